@@ -0,0 +1,193 @@
+# Runs a Rekognition API over every image under an S3 prefix, or over a video, for the notebooks
+# in this folder. Calls run concurrently on one pooled client, throttled calls are retried with
+# backoff, and every response is cached on disk so running a notebook again makes no paid calls.
+#
+#   from batchrunner import BatchRunner
+#   runner = BatchRunner(bucketName)
+#   responses = runner.run("content-moderation/media/", "detect_labels")
+#   videoResponse = runner.runVideo("content-moderation/media/GrandTour720.mp4", "start_label_detection")
+#   imageFile = runner.getLocalImage("content-moderation/media/cars.png")
+
+import hashlib
+import json
+import os
+import random
+import time
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.client import Config
+from botocore.exceptions import ClientError
+
+class BatchRunner:
+
+    # Image APIs and the field of their response with the results.
+    imageApis = {
+        "detect_labels": "Labels",
+        "detect_moderation_labels": "ModerationLabels",
+        "detect_text": "TextDetections",
+        "detect_faces": "FaceDetails",
+        "recognize_celebrities": "CelebrityFaces"
+    }
+
+    # Video APIs, the call that returns their results, the paged field of its response and whether it sorts.
+    videoApis = {
+        "start_label_detection": ("get_label_detection", "Labels", True),
+        "start_content_moderation": ("get_content_moderation", "ModerationLabels", True),
+        "start_celebrity_recognition": ("get_celebrity_recognition", "Celebrities", True),
+        "start_text_detection": ("get_text_detection", "TextDetections", False),
+        "start_face_detection": ("get_face_detection", "Faces", False)
+    }
+
+    throttlingErrors = ["ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException"]
+
+    def __init__(self, bucketName, awsRegion=None, cacheFolder="rekognition-cache", concurrency=8, maxRetries=6):
+        ''' Constructor. '''
+        self.bucketName = bucketName
+        self.cacheFolder = cacheFolder
+        self.concurrency = concurrency
+        self.maxRetries = maxRetries
+        os.makedirs(cacheFolder, exist_ok=True)
+
+        # Clients are thread safe. Their connection pool is sized for the concurrent calls.
+        config = Config(max_pool_connections=concurrency, retries=dict(max_attempts=3))
+        self.rekognition = boto3.client('rekognition', region_name=awsRegion, config=config)
+        self.s3 = boto3.client('s3', region_name=awsRegion, config=config)
+        self.lock = Lock()
+        self.apiCalls = 0
+        self.cacheHits = 0
+
+    def listKeys(self, prefix, fileTypes):
+        keys = []
+        paginator = self.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucketName, Prefix=prefix):
+            for doc in page.get('Contents', []):
+                if(os.path.splitext(doc['Key'])[1][1:].lower() in fileTypes):
+                    keys.append((doc['Key'], doc['ETag']))
+        return keys
+
+    def getCacheFile(self, apiName, key, etag, params):
+        # A changed object or different parameters give a different file, so stale answers are never reused.
+        cacheKey = json.dumps([self.bucketName, key, etag, apiName, params], sort_keys=True)
+        return os.path.join(self.cacheFolder, "{}-{}.json".format(apiName, hashlib.sha256(cacheKey.encode("utf-8")).hexdigest()[:32]))
+
+    @staticmethod
+    def readCache(cacheFile):
+        if(os.path.exists(cacheFile)):
+            with open(cacheFile, "r") as f:
+                return json.load(f)
+        return None
+
+    @staticmethod
+    def writeCache(cacheFile, content):
+        # Written to a temporary file and renamed, so an interrupted notebook never leaves a partial file.
+        with open(cacheFile + ".tmp", "w") as f:
+            json.dump(content, f, default=str)
+        os.replace(cacheFile + ".tmp", cacheFile)
+
+    def callWithBackoff(self, fn, **kwargs):
+        attempt = 0
+        while(True):
+            try:
+                with self.lock:
+                    self.apiCalls += 1
+                return fn(**kwargs)
+            except ClientError as e:
+                if(not e.response["Error"]["Code"] in self.throttlingErrors or attempt >= self.maxRetries):
+                    raise
+                # Exponential backoff with full jitter.
+                time.sleep(random.uniform(0, min(20, 0.5 * (2 ** attempt))))
+                attempt += 1
+
+    def runImage(self, apiName, key, etag=None, **params):
+        if(etag is None):
+            etag = self.s3.head_object(Bucket=self.bucketName, Key=key)['ETag']
+
+        cacheFile = self.getCacheFile(apiName, key, etag, params)
+        response = self.readCache(cacheFile)
+        if(response is not None):
+            with self.lock:
+                self.cacheHits += 1
+            return response
+
+        response = self.callWithBackoff(getattr(self.rekognition, apiName),
+                                        Image={ 'S3Object': { 'Bucket': self.bucketName, 'Name': key } }, **params)
+        response.pop('ResponseMetadata', None)
+        self.writeCache(cacheFile, response)
+        return response
+
+    def run(self, prefix, apiName, fileTypes=("jpg", "jpeg", "png"), **params):
+        if(not apiName in self.imageApis):
+            raise Exception("apiName must be one of {}.".format(", ".join(self.imageApis)))
+
+        keys = self.listKeys(prefix, fileTypes)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.runImage, apiName, key, etag, **params) for key, etag in keys]
+            responses = dict([(key, future.result()) for (key, etag), future in zip(keys, futures)])
+
+        print("{} images. So far {} API calls and {} answers from the cache.".format(len(keys), self.apiCalls, self.cacheHits))
+        return responses
+
+    def waitForVideoJob(self, getApi, jobId, resultField, sortByTimestamp, pollSeconds, maxPollSeconds):
+        getParams = { "JobId": jobId }
+        if(sortByTimestamp):
+            getParams["SortBy"] = 'TIMESTAMP'
+
+        # The wait between polls grows, so long jobs take few status calls.
+        response = self.callWithBackoff(getApi, **getParams)
+        while(response['JobStatus'] == 'IN_PROGRESS'):
+            time.sleep(pollSeconds)
+            print('.', end='')
+            pollSeconds = min(maxPollSeconds, pollSeconds * 1.5)
+            response = self.callWithBackoff(getApi, **getParams)
+
+        if(response['JobStatus'] != 'SUCCEEDED'):
+            raise Exception("Job {} {}: {}".format(jobId, response['JobStatus'], response.get('StatusMessage', '')))
+
+        # Every page of results in one response.
+        results = response[resultField]
+        while(response.get('NextToken')):
+            response = self.callWithBackoff(getApi, NextToken=response['NextToken'], **getParams)
+            results.extend(response[resultField])
+
+        response[resultField] = results
+        response.pop('NextToken', None)
+        response.pop('ResponseMetadata', None)
+        return response
+
+    def runVideo(self, videoKey, apiName, pollSeconds=5, maxPollSeconds=60, **params):
+        if(not apiName in self.videoApis):
+            raise Exception("apiName must be one of {}.".format(", ".join(self.videoApis)))
+
+        getApiName, resultField, sortByTimestamp = self.videoApis[apiName]
+        etag = self.s3.head_object(Bucket=self.bucketName, Key=videoKey)['ETag']
+        cacheFile = self.getCacheFile(apiName, videoKey, etag, params)
+
+        cached = self.readCache(cacheFile)
+        if(cached is not None and "JobStatus" in cached):
+            with self.lock:
+                self.cacheHits += 1
+            return cached
+
+        # A started job is recorded first, so a restarted notebook waits for it instead of starting another one.
+        if(cached is not None):
+            jobId = cached["JobId"]
+        else:
+            jobId = self.callWithBackoff(getattr(self.rekognition, apiName),
+                                         Video={ 'S3Object': { 'Bucket': self.bucketName, 'Name': videoKey } }, **params)['JobId']
+            self.writeCache(cacheFile, { "JobId": jobId })
+        print("Job Id: {}".format(jobId))
+
+        response = self.waitForVideoJob(getattr(self.rekognition, getApiName), jobId, resultField, sortByTimestamp, pollSeconds, maxPollSeconds)
+        self.writeCache(cacheFile, response)
+        return response
+
+    def getLocalImage(self, key):
+        # Downloaded once, for drawing boxes on the image.
+        localFile = os.path.join(self.cacheFolder, "images", key)
+        if(not os.path.exists(localFile)):
+            os.makedirs(os.path.dirname(localFile), exist_ok=True)
+            self.s3.download_file(self.bucketName, key, localFile + ".tmp")
+            os.replace(localFile + ".tmp", localFile)
+        return localFile
@@ -0,0 +1,88 @@
+# Sequential and parallel listing of an image prefix against an in-memory S3 with millions of
+# keys. Each list call sleeps for a round trip, so the time is dominated by the number of calls
+# made one after another, as it is against S3. The flat layout has every image in one folder,
+# which only adaptive range splitting can parallelize. The nested layout has date and camera folders.
+#
+# Run from src/: python3 -m benchmarks.listing [--keys 1000000] [--layouts flat,nested]
+#                [--concurrency 32] [--latency-ms 20] [--split-after-pages 2]
+
+import json
+import sys
+import time
+
+from feedback.helpers import AwsHelper, S3Helper, ParallelS3Lister
+from feedback.stubs import LocalS3Stub
+
+bucketName = "benchmark-images"
+allowedFileTypes = ["jpg", "jpeg", "png"]
+
+def getKeys(layout, keyCount):
+    if(layout == "flat"):
+        for i in range(keyCount):
+            yield "images/img_{:08d}.jpg".format(i)
+    else:
+        # 100 days of 10 cameras, with a sidecar file for every tenth image.
+        perFolder = max(keyCount // 1000, 1)
+        for i in range(keyCount):
+            folder, index = divmod(i, perFolder)
+            extension = "json" if index % 10 == 9 else "jpg"
+            yield "images/2024-{:03d}/camera-{}/{:06d}.{}".format(folder // 10, folder % 10, index, extension)
+
+def runLayout(layout, options):
+    s3 = LocalS3Stub()
+    s3.objects.update([((bucketName, key), b"") for key in getKeys(layout, options["keys"])])
+    s3.sortedKeys.clear()
+    s3.getSortedKeys(bucketName)
+    s3.listLatencySeconds = options["latencyMs"] / 1000.0
+    AwsHelper.setClient("s3", s3)
+
+    results = {}
+    try:
+        start = time.perf_counter()
+        sequentialKeys = S3Helper.getFileNames("us-east-1", bucketName, "images/", options["keys"], allowedFileTypes)
+        results["sequential"] = { "seconds": round(time.perf_counter() - start, 2), "keys": len(sequentialKeys),
+                                  "listCalls": len(s3.calls) }
+
+        s3.calls = []
+        lister = ParallelS3Lister("us-east-1", bucketName, allowedFileTypes, options["concurrency"], options["splitAfterPages"])
+        start = time.perf_counter()
+        parallelKeys = list(lister.listKeys("images/"))
+        results["parallel"] = { "seconds": round(time.perf_counter() - start, 2), "keys": len(parallelKeys),
+                                "listCalls": len(s3.calls), "splits": lister.splits }
+
+        results["speedup"] = round(results["sequential"]["seconds"] / max(results["parallel"]["seconds"], 0.001), 1)
+        results["sameKeys"] = sorted(parallelKeys) == sequentialKeys
+        if(not results["sameKeys"]):
+            print("Warning: the parallel listing of the {} layout differs from the sequential one.".format(layout))
+    finally:
+        AwsHelper.clearClients()
+
+    return results
+
+def main(args):
+    options = { "keys": 1000000, "layouts": ["flat", "nested"], "concurrency": 32, "latencyMs": 20, "splitAfterPages": 2 }
+
+    i = 0
+    while(i < len(args)):
+        if(args[i] == '--keys'):
+            options["keys"] = int(args[i+1])
+        elif(args[i] == '--layouts'):
+            options["layouts"] = args[i+1].split(",")
+        elif(args[i] == '--concurrency'):
+            options["concurrency"] = int(args[i+1])
+        elif(args[i] == '--latency-ms'):
+            options["latencyMs"] = float(args[i+1])
+        elif(args[i] == '--split-after-pages'):
+            options["splitAfterPages"] = int(args[i+1])
+        i += 1
+
+    results = {}
+    for layout in options["layouts"]:
+        print("Listing {} keys in the {} layout...".format(options["keys"], layout))
+        results[layout] = runLayout(layout, options)
+
+    print(json.dumps(results, indent=4))
+    return results
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,210 @@
+# Scaling of the CPU bound manifest paths on synthetic detections and Ground Truth output,
+# with S3 replaced by an in-memory store. Each function is timed on its own and then run again
+# under tracemalloc for its peak memory and the memory blocks it leaves allocated. The scaling
+# exponent between two sizes is about 1 for linear code and about 2 for quadratic code.
+#
+# Run from src/: python3 -m benchmarks.manifests [--records 10000,100000] [--labels 20]
+#                [--boxes 2] [--labels-per-image 2] [--bbox-fraction 0.5] [--no-memory]
+
+import contextlib
+import io
+import json
+import math
+import random
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+from feedback.helpers import AwsHelper
+from feedback.stubs import LocalS3Stub
+from feedback.groups import GroupStore
+from feedback.start import BoundingBoxScheduler, LabelVerificationScheduler
+from feedback.get import LabelVerificationJobProcessor, JobProcessor
+
+outputBucket = "benchmark-output"
+
+class SyntheticDataset:
+    # records image-label detections over records / labelsPerImage images. Label frequencies
+    # follow a 1/rank distribution, so a few labels are common and most are rare.
+
+    def __init__(self, records, labelCount, boxesPerRecord, labelsPerImage, bboxFraction, seed=1):
+        self.records = records
+        self.labelCount = labelCount
+        self.boxesPerRecord = boxesPerRecord
+        self.labelsPerImage = labelsPerImage
+        self.bboxFraction = bboxFraction
+        self.random = random.Random(seed)
+        self.labels = ["label-{}".format(i) for i in range(labelCount)]
+        self.labelWeights = [1.0 / (i + 1) for i in range(labelCount)]
+
+    def getImageUrl(self, record):
+        return "s3://benchmark-images/images/{}.jpg".format(record // self.labelsPerImage)
+
+    def getDetections(self):
+        labels = self.random.choices(self.labels, self.labelWeights, k=self.records)
+        for record in range(self.records):
+            hasBoxes = self.random.random() < self.bboxFraction
+            instances = []
+            if(hasBoxes):
+                for i in range(self.boxesPerRecord):
+                    instances.append((self.random.uniform(0, 500), self.random.uniform(0, 500),
+                                      self.random.uniform(10, 300), self.random.uniform(10, 300)))
+            yield (hasBoxes, { "imageLabelId": "{}-{}".format(self.getImageUrl(record), labels[record]),
+                               "imageUrl": self.getImageUrl(record), "imageWidth": 1024, "imageHeight": 768,
+                               "labelName": labels[record], "confidence": round(Decimal(self.random.uniform(50, 100)), 2),
+                               "instances": instances })
+
+    def getGroups(self, groupStore):
+        labelGroups = groupStore.getGroups("labels")
+        labelBoundingBoxGroups = groupStore.getGroups("bounding-boxes")
+        for hasBoxes, item in self.getDetections():
+            if(hasBoxes):
+                labelBoundingBoxGroups.add(item["labelName"], item)
+            else:
+                labelGroups.add(item["labelName"], item)
+        return (labelGroups, labelBoundingBoxGroups)
+
+    def getVerifiedLabels(self):
+        # Label verification results as LabelVerificationJobProcessor collects them.
+        finalManifestItems = {}
+        for hasBoxes, item in self.getDetections():
+            if(not hasBoxes):
+                finalManifestItems.setdefault(item["imageUrl"], []).append({ "label": item["labelName"], "confidence": 1 })
+        return finalManifestItems
+
+    def getBoundingBoxOutputLines(self):
+        # Adjusted boxes as BoundingBoxVerificationJobProcessor writes them, one line per image.
+        images = {}
+        for hasBoxes, item in self.getDetections():
+            if(hasBoxes):
+                images.setdefault(item["imageUrl"], []).append(item)
+
+        for imageUrl, items in images.items():
+            classMap = {}
+            annotations = []
+            objects = []
+            for item in items:
+                classId = str(self.labels.index(item["labelName"]))
+                classMap[classId] = item["labelName"]
+                for left, top, width, height in item["instances"]:
+                    annotations.append({ "class_id": int(classId), "left": int(left), "top": int(top),
+                                         "width": int(width), "height": int(height) })
+                    objects.append({ "confidence": 0.9 })
+            yield json.dumps({ "source-ref": imageUrl,
+                               "bounding-box-new": { "image_size": [{ "width": 1024, "height": 768, "depth": 3 }], "annotations": annotations },
+                               "bounding-box-new-metadata": { "objects": objects, "class-map": classMap, "human-annotated": "yes",
+                                                              "type": "groundtruth/object-detection", "job-name": "labeling-job/benchmark" } })
+
+def getInputParameters():
+    return { "awsRegion": "us-east-1", "runId": "benchmark", "outputBucket": outputBucket,
+             "templatesPath": "datasets/templates",
+             "boundingBoxManifestPath": "datasets/benchmark/bounding-box-verification/manifest",
+             "labelManifestPath": "datasets/benchmark/label-verification/manifest",
+             "labelsOutputFile": "datasets/benchmark/label-verification/output/labels-output.manifest",
+             "boundingBoxOutputFile": "datasets/benchmark/bounding-box-verification/output/bounding-box-output.manifest",
+             "bblbOutputFile": "datasets/benchmark/output/output.manifest",
+             "columnarOutputFile": "datasets/benchmark/output/output.parquet",
+             "maxLabelsPerBoundingBoxJob": 10, "maxImagesPerLabelVerificationBatch": 10,
+             "columnarOutput": False, "manifestCompression": None }
+
+def measure(fn, withMemory):
+    # Output of the measured functions is discarded, it would dominate the timings otherwise.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+
+        result = { "seconds": round(seconds, 3) }
+        if(withMemory):
+            blocksBefore = sys.getallocatedblocks()
+            tracemalloc.start()
+            fn()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result["peakMB"] = round(peak / (1024 * 1024), 1)
+            result["retainedBlocks"] = sys.getallocatedblocks() - blocksBefore
+
+    return result
+
+def runSize(records, options):
+    s3 = LocalS3Stub()
+    AwsHelper.setClient("s3", s3)
+    inputParameters = getInputParameters()
+    dataset = SyntheticDataset(records, options["labels"], options["boxes"], options["labelsPerImage"], options["bboxFraction"])
+
+    groupStore = GroupStore(options["groupStoreMemoryMB"] * 1024 * 1024)
+    results = {}
+    try:
+        labelGroups, labelBoundingBoxGroups = dataset.getGroups(groupStore)
+        boundingBoxScheduler = BoundingBoxScheduler(labelBoundingBoxGroups, inputParameters)
+        labelVerificationScheduler = LabelVerificationScheduler(labelGroups, inputParameters)
+
+        results["BoundingBoxScheduler.createManifestGroups"] = measure(
+            lambda: list(boundingBoxScheduler.createManifestGroups()), options["memory"])
+        manifestGroups = list(boundingBoxScheduler.createManifestGroups())
+        results["BoundingBoxScheduler.createManifestFiles"] = measure(
+            lambda: boundingBoxScheduler.createManifestFiles(manifestGroups), options["memory"])
+        del manifestGroups
+
+        results["LabelVerificationScheduler.createManifestFiles"] = measure(
+            lambda: labelVerificationScheduler.createManifestFiles(), options["memory"])
+    finally:
+        groupStore.close()
+
+    verifiedLabels = dataset.getVerifiedLabels()
+    labelJobProcessor = LabelVerificationJobProcessor(inputParameters)
+    results["LabelVerificationJobProcessor.generateOutput"] = measure(
+        lambda: labelJobProcessor.generateOutput(verifiedLabels, "benchmark-labels"), options["memory"])
+    del verifiedLabels
+
+    s3.put_object(Bucket=outputBucket, Key=inputParameters["boundingBoxOutputFile"],
+                  Body="".join([line + "\n" for line in dataset.getBoundingBoxOutputLines()]))
+    jobProcessor = JobProcessor()
+    jobProcessor.inputParameters = inputParameters
+    results["JobProcessor.mergeBBAndLabelsOutput"] = measure(
+        lambda: jobProcessor.mergeBBAndLabelsOutput(True, True, False), options["memory"])
+
+    AwsHelper.clearClients()
+    return results
+
+def main(args):
+    options = { "records": [10000, 100000], "labels": 20, "boxes": 2, "labelsPerImage": 2,
+                "bboxFraction": 0.5, "groupStoreMemoryMB": 256, "memory": True }
+
+    i = 0
+    while(i < len(args)):
+        if(args[i] == '--records'):
+            options["records"] = [int(records) for records in args[i+1].split(",")]
+        elif(args[i] == '--labels'):
+            options["labels"] = int(args[i+1])
+        elif(args[i] == '--boxes'):
+            options["boxes"] = int(args[i+1])
+        elif(args[i] == '--labels-per-image'):
+            options["labelsPerImage"] = int(args[i+1])
+        elif(args[i] == '--bbox-fraction'):
+            options["bboxFraction"] = float(args[i+1])
+        elif(args[i] == '--no-memory'):
+            options["memory"] = False
+        i += 1
+
+    results = {}
+    for records in options["records"]:
+        print("Running {} records...".format(records))
+        results[records] = runSize(records, options)
+
+    # Time growth relative to record growth between consecutive sizes.
+    sizes = options["records"]
+    for name in results[sizes[0]]:
+        for previous, current in zip(sizes, sizes[1:]):
+            previousSeconds = max(results[previous][name]["seconds"], 0.001)
+            exponent = math.log(max(results[current][name]["seconds"], 0.001) / previousSeconds) / math.log(current / previous)
+            results[current][name]["scalingExponent"] = round(exponent, 2)
+            if(exponent > 1.5):
+                print("Warning: {} grows faster than linear between {} and {} records.".format(name, previous, current))
+
+    print(json.dumps(results, indent=4))
+    return results
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,62 @@
+# Startup cost of a feedback run: a fresh interpreter per run against a warm daemon.
+#
+# Run from src/: python3 -m benchmarks.startup [--repeat 5]
+
+import json
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+def timeCommand(code, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", code], capture_output=True)
+        samples.append(time.perf_counter() - start)
+        if(completed.returncode != 0):
+            return None
+    return statistics.median(samples)
+
+def timeDaemonRequests(repeat):
+    from feedback.daemon import FeedbackDaemon
+
+    daemon = FeedbackDaemon("127.0.0.1", 0)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+
+    url = "http://127.0.0.1:{}/health".format(daemon.server_address[1])
+    samples = []
+    try:
+        for i in range(repeat):
+            start = time.perf_counter()
+            urllib.request.urlopen(url).read()
+            samples.append(time.perf_counter() - start)
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
+
+    return statistics.median(samples)
+
+def main(args):
+    repeat = 5
+    if('--repeat' in args):
+        repeat = int(args[args.index('--repeat') + 1])
+
+    results = {
+        "interpreter": timeCommand("pass", repeat),
+        "importFeedbackPackage": timeCommand("import feedback.start, feedback.get", repeat),
+        "importWithBoto3AndPillow": timeCommand("import feedback.start, feedback.get, boto3, PIL.Image", repeat),
+        "firstClients": timeCommand("from feedback.helpers import AwsHelper\n"
+                                    "for name in ['s3', 'sagemaker', 'rekognition']: AwsHelper().getClient(name, 'us-east-1')", repeat),
+        "warmDaemonRequest": timeDaemonRequests(repeat)
+    }
+
+    print("Median seconds over {} runs (null when a dependency is missing):".format(repeat))
+    print(json.dumps(results, indent=4))
+    return results
+
+if __name__ == "__main__":
+    main(sys.argv)
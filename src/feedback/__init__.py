@@ -0,0 +1,5 @@
+# Amazon Rekognition Custom Labels feedback solution.
+#
+# feedback.start analyzes images and starts the Ground Truth jobs, feedback.get turns the finished
+# jobs into a dataset manifest and feedback.daemon serves both over a local HTTP endpoint.
+# Submodules are only imported when used, which keeps boto3 and Pillow out of startup.
@@ -0,0 +1,40 @@
+import sys
+
+usage = """Usage:
+    python3 -m feedback start [--config feedback-config.json]
+    python3 -m feedback get --jobs-manifest s3://bucket/datasets/<runid>/jobs/jobs.json
+    python3 -m feedback daemon [--host 127.0.0.1] [--port 8765] [--region us-east-1]
+    python3 -m feedback shard [--config feedback-config.json] [--shards 2] [--partition hash|prefix] [--local-workers]
+    python3 -m feedback shard-worker --run s3://bucket/datasets/<runid>/shards/run.json --shard <index>
+    python3 -m feedback shard-merge --run s3://bucket/datasets/<runid>/shards/run.json
+    python3 -m feedback ingest --manifest s3://bucket/datasets/<runid>/output/output.manifest --dataset-arn <arn> [--checkpoint file]
+    python3 -m feedback harvest --jobs-manifest s3://bucket/datasets/<runid>/jobs/jobs.json [--interval 600] [--consolidate-boxes]"""
+
+def main(args):
+    if(len(args) < 2 or not args[1] in ["start", "get", "daemon", "shard", "shard-worker", "shard-merge", "ingest", "harvest"]):
+        print(usage)
+        return 1
+
+    if(args[1] == "start"):
+        from feedback.start import main as startMain
+        startMain(args[1:])
+    elif(args[1] == "get"):
+        from feedback.get import main as getMain
+        getMain(args[1:])
+    elif(args[1] == "daemon"):
+        from feedback.daemon import main as daemonMain
+        daemonMain(args[1:])
+    elif(args[1] == "ingest"):
+        from feedback.ingest import main as ingestMain
+        ingestMain(args[2:])
+    elif(args[1] == "harvest"):
+        from feedback.harvest import main as harvestMain
+        harvestMain(args[2:])
+    else:
+        from feedback.shards import main as shardsMain
+        shardsMain(args[1:])
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
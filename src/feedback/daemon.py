@@ -0,0 +1,102 @@
+import json
+import time
+from threading import Lock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from feedback.helpers import AwsHelper
+
+class FeedbackRequestHandler(BaseHTTPRequestHandler):
+    # POST /start takes the same JSON as feedback-config.json.
+    # POST /get takes {"jobsManifest": "s3://...", "args": ["--consolidate-boxes", ...]}.
+    # GET /health reports how long the daemon has been up and how many runs it served.
+    # Runs share the tracer and the AWS client overrides, so they are served one at a time. Requests
+    # wait for the run before them, while /health is still answered.
+
+    def sendJson(self, status, body):
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def readJson(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if(not length):
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):
+        if(self.path == "/health"):
+            self.sendJson(200, { "status": "ok", "uptimeSeconds": round(time.time() - self.server.startTime, 1),
+                                 "runs": self.server.runs })
+        else:
+            self.sendJson(404, { "error": "Unknown path {}".format(self.path) })
+
+    def do_POST(self):
+        try:
+            request = self.readJson()
+
+            if(not self.path in ["/start", "/get"]):
+                self.sendJson(404, { "error": "Unknown path {}".format(self.path) })
+                return
+
+            with self.server.runLock:
+                if(self.path == "/start"):
+                    from feedback.start import CustomLabelsFeedback
+                    result = CustomLabelsFeedback().runConfig(request)
+                else:
+                    from feedback.get import JobProcessor
+                    result = JobProcessor().run(["--jobs-manifest", request["jobsManifest"]] + request.get("args", []))
+                self.server.runs += 1
+
+            self.sendJson(200, { "result": result })
+        except Exception as e:
+            print("Something went wrong:\n====================================================\n{}".format(e))
+            self.sendJson(500, { "error": "{}".format(e) })
+
+class FeedbackDaemon(ThreadingHTTPServer):
+    # Keeps one process alive between feedback runs, so imports, AWS clients with their
+    # connection pools and cached lookups like bucket regions are reused by every request.
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=8765):
+        ThreadingHTTPServer.__init__(self, (host, port), FeedbackRequestHandler)
+        self.startTime = time.time()
+        self.runs = 0
+        self.runLock = Lock()
+
+    def warmUp(self, awsRegion=None):
+        import feedback.start
+        import feedback.get
+        import PIL.Image
+
+        for name in ["s3", "sagemaker", "rekognition"]:
+            AwsHelper().getClient(name, awsRegion)
+
+def main(args):
+    host = "127.0.0.1"
+    port = 8765
+    awsRegion = None
+
+    i = 0
+    while(i < len(args)):
+        if(args[i] == '--host'):
+            host = args[i+1]
+        elif(args[i] == '--port'):
+            port = int(args[i+1])
+        elif(args[i] == '--region'):
+            awsRegion = args[i+1]
+        i += 1
+
+    daemon = FeedbackDaemon(host, port)
+    daemon.warmUp(awsRegion)
+    print("Feedback daemon listening on http://{}:{}".format(host, daemon.server_address[1]))
+
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping feedback daemon...")
+    finally:
+        daemon.server_close()
@@ -0,0 +1,273 @@
+import json
+from array import array
+
+# Compares the model's predictions for a run with the human answers from Ground Truth. Boxes are
+# kept in flat columns and matched per image and label with vectorized IoU, so millions of boxes
+# fit in memory and evaluate in seconds. numpy is only imported when an evaluation runs.
+
+class ModelEvaluator:
+
+    # Keys pack an image id and a label id into one integer.
+    labelBits = 20
+
+    def __init__(self, iouThreshold=0.5, calibrationBins=10):
+        ''' Constructor. '''
+        self.iouThreshold = iouThreshold
+        self.calibrationBins = calibrationBins
+        self.imageIds = {}
+        self.labels = []
+        self.labelIds = {}
+        self.predictionKeys = array('q')
+        self.predictionBoxes = array('d')
+        self.predictionConfidences = array('d')
+        self.humanKeys = array('q')
+        self.humanBoxes = array('d')
+        self.reviewedImages = array('q')
+        self.labelPredictionKeys = array('q')
+        self.labelPredictionConfidences = array('d')
+        self.verifiedKeys = array('q')
+        self.hasLabelReview = False
+
+    def getImageId(self, sourceRef):
+        if(not sourceRef in self.imageIds):
+            self.imageIds[sourceRef] = len(self.imageIds)
+        return self.imageIds[sourceRef]
+
+    def getKey(self, sourceRef, label):
+        imageId = self.getImageId(sourceRef)
+        if(not label in self.labelIds):
+            self.labelIds[label] = len(self.labels)
+            self.labels.append(label)
+        return (imageId << self.labelBits) + self.labelIds[label]
+
+    def addPrediction(self, prediction):
+        key = self.getKey(prediction["source-ref"], prediction["label"])
+        if(prediction["type"] == "bounding-box"):
+            boxConfidences = prediction.get("boxConfidences") or [prediction["confidence"]] * len(prediction["boxes"])
+            for box, confidence in zip(prediction["boxes"], boxConfidences):
+                self.predictionKeys.append(key)
+                self.predictionBoxes.extend(box)
+                self.predictionConfidences.append(confidence)
+        else:
+            self.labelPredictionKeys.append(key)
+            self.labelPredictionConfidences.append(prediction["confidence"])
+
+    def addHumanItem(self, manifestItem):
+        # Reads every annotation attribute of an output manifest line, whether boxes were consolidated or not.
+        sourceRef = manifestItem["source-ref"]
+        for attributeName, metadata in manifestItem.items():
+            if(not attributeName.endswith("-metadata") or not isinstance(metadata, dict)):
+                continue
+
+            if(metadata.get("type") == "groundtruth/object-detection"):
+                classMap = metadata["class-map"]
+                self.reviewedImages.append(self.getImageId(sourceRef))
+                for annotation in manifestItem[attributeName[:-len("-metadata")]]["annotations"]:
+                    self.humanKeys.append(self.getKey(sourceRef, classMap[str(annotation["class_id"])]))
+                    self.humanBoxes.extend((annotation["left"], annotation["top"], annotation["width"], annotation["height"]))
+            elif(metadata.get("type") == "groundtruth/image-classification"):
+                self.verifiedKeys.append(self.getKey(sourceRef, metadata["class-name"]))
+
+    @staticmethod
+    def getIou(np, boxesA, boxesB):
+        x1 = np.maximum(boxesA[:, 0], boxesB[:, 0])
+        y1 = np.maximum(boxesA[:, 1], boxesB[:, 1])
+        x2 = np.minimum(boxesA[:, 0] + boxesA[:, 2], boxesB[:, 0] + boxesB[:, 2])
+        y2 = np.minimum(boxesA[:, 1] + boxesA[:, 3], boxesB[:, 1] + boxesB[:, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        union = boxesA[:, 2] * boxesA[:, 3] + boxesB[:, 2] * boxesB[:, 3] - intersection
+        return intersection / np.maximum(union, 1e-12)
+
+    def matchBoxes(self, np, predictionKeys, predictionBoxes, predictionConfidences, humanKeys, humanBoxes):
+        # Every prediction pairs with the human boxes of the same image and label.
+        humanOrder = np.argsort(humanKeys, kind="stable")
+        sortedHumanKeys = humanKeys[humanOrder]
+        starts = np.searchsorted(sortedHumanKeys, predictionKeys, side="left")
+        counts = np.searchsorted(sortedHumanKeys, predictionKeys, side="right") - starts
+
+        first = np.repeat(np.arange(len(predictionKeys)), counts)
+        runStarts = np.repeat(np.cumsum(counts) - counts, counts)
+        second = humanOrder[np.repeat(starts, counts) + (np.arange(len(first)) - runStarts)]
+
+        iou = self.getIou(np, predictionBoxes[first], humanBoxes[second])
+        candidates = iou >= self.iouThreshold
+        first = first[candidates]
+        second = second[candidates]
+        iou = iou[candidates]
+
+        # One to one matching in rounds: each open prediction proposes its best open human box and
+        # each human box accepts its most confident proposal. Every round matches at least one pair.
+        predictionMatched = np.zeros(len(predictionKeys), dtype=bool)
+        humanMatched = np.zeros(len(humanKeys), dtype=bool)
+        matchedIou = np.full(len(predictionKeys), np.nan)
+        while(len(first)):
+            order = np.lexsort((-iou, first))
+            proposals = order[np.r_[True, first[order][1:] != first[order][:-1]]]
+
+            proposalConfidences = predictionConfidences[first[proposals]]
+            order = np.lexsort((-iou[proposals], -proposalConfidences, second[proposals]))
+            accepted = proposals[order[np.r_[True, second[proposals][order][1:] != second[proposals][order][:-1]]]]
+
+            predictionMatched[first[accepted]] = True
+            humanMatched[second[accepted]] = True
+            matchedIou[first[accepted]] = iou[accepted]
+
+            unmatched = ~predictionMatched[first] & ~humanMatched[second]
+            first = first[unmatched]
+            second = second[unmatched]
+            iou = iou[unmatched]
+
+        return (predictionMatched, humanMatched, matchedIou)
+
+    def getCalibration(self, np, confidences, correct, labelIds):
+        bins = np.clip((confidences / 100 * self.calibrationBins).astype(np.int64), 0, self.calibrationBins - 1)
+        counts = np.bincount(bins, minlength=self.calibrationBins)
+        confidenceSums = np.bincount(bins, weights=confidences, minlength=self.calibrationBins)
+        correctSums = np.bincount(bins, weights=correct, minlength=self.calibrationBins)
+
+        curve = []
+        for b in range(self.calibrationBins):
+            if(counts[b]):
+                curve.append({ "confidenceFrom": round(100 * b / self.calibrationBins, 1),
+                               "confidenceTo": round(100 * (b + 1) / self.calibrationBins, 1),
+                               "predictions": int(counts[b]),
+                               "meanConfidence": round(float(confidenceSums[b] / counts[b]), 2),
+                               "accuracy": round(float(correctSums[b] / counts[b]), 4) })
+
+        # Expected calibration error overall and per label, from the same bins.
+        total = max(len(confidences), 1)
+        ece = float(np.sum(np.abs(correctSums - confidenceSums / 100)) / total)
+
+        labelBins = labelIds * self.calibrationBins + bins
+        size = len(self.labels) * self.calibrationBins
+        labelGaps = np.abs(np.bincount(labelBins, weights=correct, minlength=size) -
+                           np.bincount(labelBins, weights=confidences, minlength=size) / 100).reshape(-1, self.calibrationBins)
+        labelCounts = np.bincount(labelIds, minlength=len(self.labels))
+        labelEce = labelGaps.sum(axis=1) / np.maximum(labelCounts, 1)
+
+        return (curve, ece, labelEce, labelCounts)
+
+    @staticmethod
+    def getRatio(numerator, denominator):
+        return round(float(numerator) / denominator, 4) if denominator else None
+
+    def evaluate(self):
+        import numpy as np
+
+        labelMask = (1 << self.labelBits) - 1
+        labelCount = len(self.labels)
+
+        predictionKeys = np.frombuffer(self.predictionKeys, dtype=np.int64)
+        predictionBoxes = np.frombuffer(self.predictionBoxes, dtype=np.float64).reshape(-1, 4)
+        predictionConfidences = np.frombuffer(self.predictionConfidences, dtype=np.float64)
+        humanKeys = np.frombuffer(self.humanKeys, dtype=np.int64)
+        humanBoxes = np.frombuffer(self.humanBoxes, dtype=np.float64).reshape(-1, 4)
+
+        # Predictions on images that no bounding box job returned were never reviewed.
+        reviewed = np.isin(predictionKeys >> self.labelBits, np.frombuffer(self.reviewedImages, dtype=np.int64))
+        predictionKeys = predictionKeys[reviewed]
+        predictionBoxes = predictionBoxes[reviewed]
+        predictionConfidences = predictionConfidences[reviewed]
+
+        predictionMatched, humanMatched, matchedIou = self.matchBoxes(np, predictionKeys, predictionBoxes, predictionConfidences,
+                                                                      humanKeys, humanBoxes)
+
+        predictionLabels = predictionKeys & labelMask
+        humanLabels = humanKeys & labelMask
+        truePositives = np.bincount(predictionLabels, weights=predictionMatched, minlength=labelCount)
+        predicted = np.bincount(predictionLabels, minlength=labelCount)
+        human = np.bincount(humanLabels, minlength=labelCount)
+
+        ious = matchedIou[predictionMatched]
+        iouLabels = predictionLabels[predictionMatched]
+        iouSums = np.bincount(iouLabels, weights=ious, minlength=labelCount)
+        histogramCounts, histogramEdges = np.histogram(ious, bins=10, range=(self.iouThreshold, 1.0))
+
+        # Label verification answers, when the run had a label verification job.
+        labelPredictionKeys = np.frombuffer(self.labelPredictionKeys, dtype=np.int64)
+        labelPredictionConfidences = np.frombuffer(self.labelPredictionConfidences, dtype=np.float64)
+        if(not self.hasLabelReview):
+            labelPredictionKeys = labelPredictionKeys[:0]
+            labelPredictionConfidences = labelPredictionConfidences[:0]
+        verified = np.isin(labelPredictionKeys, np.frombuffer(self.verifiedKeys, dtype=np.int64))
+        verifiedLabels = labelPredictionKeys & labelMask
+        verifiedCounts = np.bincount(verifiedLabels, weights=verified, minlength=labelCount)
+        reviewedCounts = np.bincount(verifiedLabels, minlength=labelCount)
+
+        # Calibration over every reviewed prediction with a known confidence.
+        confidences = np.concatenate([predictionConfidences, labelPredictionConfidences])
+        correct = np.concatenate([predictionMatched, verified]).astype(np.float64)
+        labelIds = np.concatenate([predictionLabels, verifiedLabels])
+        known = confidences >= 0
+        curve, ece, labelEce, labelCalibrationCounts = self.getCalibration(np, confidences[known], correct[known], labelIds[known])
+
+        labels = {}
+        for labelId in range(labelCount):
+            if(not (predicted[labelId] or human[labelId] or reviewedCounts[labelId])):
+                continue
+            labels[self.labels[labelId]] = {
+                "truePositives": int(truePositives[labelId]),
+                "falsePositives": int(predicted[labelId] - truePositives[labelId]),
+                "falseNegatives": int(human[labelId] - truePositives[labelId]),
+                "precision": self.getRatio(truePositives[labelId], predicted[labelId]),
+                "recall": self.getRatio(truePositives[labelId], human[labelId]),
+                "meanIou": self.getRatio(iouSums[labelId], truePositives[labelId]),
+                "verified": int(verifiedCounts[labelId]),
+                "rejected": int(reviewedCounts[labelId] - verifiedCounts[labelId]),
+                "verifiedPrecision": self.getRatio(verifiedCounts[labelId], reviewedCounts[labelId]),
+                "calibrationError": round(float(labelEce[labelId]), 4) if labelCalibrationCounts[labelId] else None
+            }
+
+        return {
+            "iouThreshold": self.iouThreshold,
+            "boxes": {
+                "predicted": int(len(predictionKeys)),
+                "human": int(len(humanKeys)),
+                "matched": int(predictionMatched.sum()),
+                "precision": self.getRatio(predictionMatched.sum(), len(predictionKeys)),
+                "recall": self.getRatio(humanMatched.sum(), len(humanKeys)),
+                "iou": {
+                    "mean": round(float(ious.mean()), 4) if len(ious) else None,
+                    "p10": round(float(np.percentile(ious, 10)), 4) if len(ious) else None,
+                    "p50": round(float(np.percentile(ious, 50)), 4) if len(ious) else None,
+                    "p90": round(float(np.percentile(ious, 90)), 4) if len(ious) else None,
+                    "histogram": { "edges": [round(float(edge), 3) for edge in histogramEdges], "counts": histogramCounts.tolist() }
+                }
+            },
+            "labelVerification": {
+                "reviewed": int(len(labelPredictionKeys)),
+                "verified": int(verified.sum()),
+                "precision": self.getRatio(verified.sum(), len(labelPredictionKeys))
+            },
+            "calibration": curve,
+            "expectedCalibrationError": round(ece, 4),
+            "labels": labels
+        }
+
+    @staticmethod
+    def printReport(report):
+        print("\nEvaluation\n=====================")
+        boxes = report["boxes"]
+        print("Boxes: {} predicted, {} human, precision {}, recall {}, mean IoU {}".format(
+            boxes["predicted"], boxes["human"], boxes["precision"], boxes["recall"], boxes["iou"]["mean"]))
+        print("Label verification: {} reviewed, precision {}".format(report["labelVerification"]["reviewed"],
+                                                                     report["labelVerification"]["precision"]))
+        print("Expected calibration error: {}".format(report["expectedCalibrationError"]))
+        print("{:<30} {:>8} {:>8} {:>8} {:>10} {:>8} {:>8} {:>10}".format("Label", "TP", "FP", "FN", "Precision", "Recall", "IoU", "Verified"))
+        for label, stats in report["labels"].items():
+            print("{:<30} {:>8} {:>8} {:>8} {:>10} {:>8} {:>8} {:>10}".format(label[:30], stats["truePositives"], stats["falsePositives"],
+                  stats["falseNegatives"], str(stats["precision"]), str(stats["recall"]), str(stats["meanIou"]), str(stats["verifiedPrecision"])))
+
+def evaluateRun(predictionsUri, outputManifestUri, iouThreshold, hasLabelReview, awsRegion=None):
+    from feedback.helpers import S3Helper
+
+    evaluator = ModelEvaluator(iouThreshold)
+    evaluator.hasLabelReview = hasLabelReview
+    for line in S3Helper.readLinesFromS3Uri(predictionsUri, awsRegion):
+        evaluator.addPrediction(json.loads(line))
+    for line in S3Helper.readLinesFromS3Uri(outputManifestUri, awsRegion):
+        evaluator.addHumanItem(json.loads(line))
+
+    report = evaluator.evaluate()
+    ModelEvaluator.printReport(report)
+    return report
@@ -0,0 +1,796 @@
+import os
+import uuid
+import datetime
+import json
+import time
+import gzip
+import io
+import tempfile
+from array import array
+
+from feedback.helpers import AwsHelper, S3Helper
+from feedback.tracing import tracer
+
+class ColumnarManifestWriter:
+    # Flattens manifest items into one row per image, label and box and writes them to a
+    # Parquet file one row group at a time, so only one row group of rows is held in memory.
+
+    def __init__(self, fileName, rowGroupSize=65536):
+        # pyarrow is only needed when the columnar output is requested.
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.rowGroupSize = rowGroupSize
+        self.schema = pa.schema([
+            ("source_ref", pa.string()),
+            ("label", pa.string()),
+            ("left", pa.int32()),
+            ("top", pa.int32()),
+            ("width", pa.int32()),
+            ("height", pa.int32()),
+            ("confidence", pa.float64()),
+            ("job_name", pa.string()),
+            ("human_annotated", pa.bool_())
+        ])
+        self.writer = pq.ParquetWriter(fileName, self.schema, compression="zstd")
+        self.rows = {}
+        for column in self.schema.names:
+            self.rows[column] = []
+
+    def addRow(self, sourceRef, label, box, confidence, metadata):
+        self.rows["source_ref"].append(sourceRef)
+        self.rows["label"].append(label)
+        self.rows["left"].append(box[0])
+        self.rows["top"].append(box[1])
+        self.rows["width"].append(box[2])
+        self.rows["height"].append(box[3])
+        self.rows["confidence"].append(confidence)
+        self.rows["job_name"].append(metadata.get("job-name"))
+        self.rows["human_annotated"].append(metadata.get("human-annotated") == "yes")
+
+        if(len(self.rows["source_ref"]) >= self.rowGroupSize):
+            self.flush()
+
+    def addManifestItem(self, manifestItem):
+        sourceRef = manifestItem["source-ref"]
+        noBox = (None, None, None, None)
+        rowsAdded = False
+
+        for key in manifestItem:
+            metadataKey = "{}-metadata".format(key)
+            if(not metadataKey in manifestItem):
+                continue
+
+            value = manifestItem[key]
+            metadata = manifestItem[metadataKey]
+
+            if(isinstance(value, dict) and "annotations" in value):
+                classMap = metadata.get("class-map", {})
+                objects = metadata.get("objects", [])
+                i = 0
+                for annotation in value["annotations"]:
+                    confidence = objects[i].get("confidence") if i < len(objects) else None
+                    self.addRow(sourceRef, classMap.get(str(annotation["class_id"])),
+                                (annotation["left"], annotation["top"], annotation["width"], annotation["height"]),
+                                confidence, metadata)
+                    i += 1
+                    rowsAdded = True
+            else:
+                self.addRow(sourceRef, metadata.get("class-name"), noBox, metadata.get("confidence"), metadata)
+                rowsAdded = True
+
+        # Images without labels still get a row so image counts stay right.
+        if(not rowsAdded):
+            self.addRow(sourceRef, None, noBox, None, {})
+
+    def flush(self):
+        if(not self.rows["source_ref"]):
+            return
+
+        self.writer.write_table(self.pa.Table.from_pydict(self.rows, schema=self.schema))
+        for column in self.rows:
+            self.rows[column].clear()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+class BoundingBoxConsolidator:
+    # Collects the adjusted boxes of every bounding box job in flat columns and clusters
+    # overlapping boxes of the same label on the same image into one consolidated box. Boxes of
+    # the same job are separate objects drawn by one worker, so only boxes of different jobs overlap.
+
+    def __init__(self, iouThreshold):
+        self.iouThreshold = iouThreshold
+        self.sourceRefs = []
+        self.sourceRefIds = {}
+        self.imageSizes = []
+        self.labels = []
+        self.labelIds = {}
+        self.boxImages = array('q')
+        self.boxJobs = array('q')
+        self.boxLabels = array('q')
+        self.boxCoordinates = array('d')
+        self.boxConfidences = array('d')
+
+    def getSourceRefId(self, sourceRef, imageSize):
+        if(not sourceRef in self.sourceRefIds):
+            self.sourceRefIds[sourceRef] = len(self.sourceRefs)
+            self.sourceRefs.append(sourceRef)
+            self.imageSizes.append(imageSize)
+        return self.sourceRefIds[sourceRef]
+
+    def getLabelId(self, label):
+        if(not label in self.labelIds):
+            self.labelIds[label] = len(self.labels)
+            self.labels.append(label)
+        return self.labelIds[label]
+
+    def addManifestItem(self, manifestItem, jobIndex=0, labelAttributeName="bounding-box-new"):
+        boundingBox = manifestItem[labelAttributeName]
+        metadata = manifestItem["{}-metadata".format(labelAttributeName)]
+        classMap = metadata["class-map"]
+        objects = metadata.get("objects", [])
+
+        sourceRefId = self.getSourceRefId(manifestItem["source-ref"], boundingBox["image_size"])
+
+        i = 0
+        for annotation in boundingBox["annotations"]:
+            self.boxImages.append(sourceRefId)
+            self.boxJobs.append(jobIndex)
+            self.boxLabels.append(self.getLabelId(classMap[str(annotation["class_id"])]))
+            self.boxCoordinates.extend((annotation["left"], annotation["top"], annotation["width"], annotation["height"]))
+            # Missing confidences are left out of the cluster mean.
+            if(i < len(objects) and objects[i].get("confidence") is not None):
+                self.boxConfidences.append(objects[i]["confidence"])
+            else:
+                self.boxConfidences.append(float("nan"))
+            i += 1
+
+    def clusterBoxes(self, np, groupKeys, boxes, boxJobs):
+        # Returns a cluster id for every box. Boxes only ever join boxes with the same group key
+        # and a different job.
+        boxCount = len(groupKeys)
+        order = np.argsort(groupKeys, kind="stable")
+        sortedKeys = groupKeys[order]
+
+        groupStarts = np.flatnonzero(np.r_[True, sortedKeys[1:] != sortedKeys[:-1]])
+        groupSizes = np.diff(np.r_[groupStarts, boxCount])
+
+        # Every position pairs with the positions after it in its group.
+        positions = np.arange(boxCount)
+        groupEnds = np.repeat(groupStarts + groupSizes, groupSizes)
+        partnerCounts = groupEnds - positions - 1
+        first = np.repeat(positions, partnerCounts)
+        runStarts = np.repeat(np.cumsum(partnerCounts) - partnerCounts, partnerCounts)
+        second = first + 1 + (np.arange(len(first)) - runStarts)
+        first = order[first]
+        second = order[second]
+
+        x1 = boxes[:, 0]
+        y1 = boxes[:, 1]
+        x2 = x1 + boxes[:, 2]
+        y2 = y1 + boxes[:, 3]
+        areas = boxes[:, 2] * boxes[:, 3]
+
+        intersectionWidth = np.clip(np.minimum(x2[first], x2[second]) - np.maximum(x1[first], x1[second]), 0, None)
+        intersectionHeight = np.clip(np.minimum(y2[first], y2[second]) - np.maximum(y1[first], y1[second]), 0, None)
+        intersection = intersectionWidth * intersectionHeight
+        iou = intersection / np.maximum(areas[first] + areas[second] - intersection, 1e-12)
+
+        overlapping = (iou >= self.iouThreshold) & (boxJobs[first] != boxJobs[second])
+        first = first[overlapping]
+        second = second[overlapping]
+
+        # Connected components by propagating the smallest box index along overlap edges.
+        clusters = np.arange(boxCount)
+        while(True):
+            previous = clusters.copy()
+            np.minimum.at(clusters, first, clusters[second])
+            np.minimum.at(clusters, second, clusters[first])
+            clusters = clusters[clusters]
+            if(np.array_equal(previous, clusters)):
+                break
+
+        return clusters
+
+    def consolidate(self):
+        # numpy is only needed when box consolidation is turned on.
+        import numpy as np
+
+        consolidatedItems = {}
+        for sourceRefId in range(len(self.sourceRefs)):
+            consolidatedItems[self.sourceRefs[sourceRefId]] = {
+                "source-ref": self.sourceRefs[sourceRefId],
+                "bounding-box": {
+                    "image_size": self.imageSizes[sourceRefId],
+                    "annotations": []
+                },
+                "bounding-box-metadata": {
+                    "objects": [],
+                    "class-map": {},
+                    "type": "groundtruth/object-detection",
+                    "human-annotated": "yes",
+                    "creation-date": datetime.datetime.now().isoformat(),
+                    "job-name": "labeling-job/consolidated"
+                }
+            }
+
+        if(not self.boxImages):
+            return consolidatedItems
+
+        boxImages = np.frombuffer(self.boxImages, dtype=np.int64)
+        boxJobs = np.frombuffer(self.boxJobs, dtype=np.int64)
+        boxLabels = np.frombuffer(self.boxLabels, dtype=np.int64)
+        boxes = np.frombuffer(self.boxCoordinates, dtype=np.float64).reshape(-1, 4)
+        confidences = np.frombuffer(self.boxConfidences, dtype=np.float64)
+
+        clusters = self.clusterBoxes(np, boxImages * len(self.labels) + boxLabels, boxes, boxJobs)
+
+        clusterIds, clusterMembers, clusterSizes = np.unique(clusters, return_inverse=True, return_counts=True)
+        clusterBoxes = np.empty((len(clusterIds), 4))
+        for i in range(4):
+            clusterBoxes[:, i] = np.bincount(clusterMembers, weights=boxes[:, i]) / clusterSizes
+        hasConfidence = ~np.isnan(confidences)
+        confidenceCounts = np.bincount(clusterMembers, weights=hasConfidence, minlength=len(clusterIds))
+        confidenceSums = np.bincount(clusterMembers, weights=np.where(hasConfidence, confidences, 0), minlength=len(clusterIds))
+        clusterConfidences = confidenceSums / np.maximum(confidenceCounts, 1)
+        clusterImages = boxImages[clusterIds]
+        clusterLabels = boxLabels[clusterIds]
+
+        clusterOrder = np.argsort(clusterImages, kind="stable")
+        clusterBoxes = np.rint(clusterBoxes).astype(np.int64).tolist()
+        clusterConfidences = np.round(clusterConfidences, 2).tolist()
+        clusterHasConfidence = (confidenceCounts > 0).tolist()
+        clusterImages = clusterImages.tolist()
+        clusterLabels = clusterLabels.tolist()
+
+        for c in clusterOrder.tolist():
+            consolidatedItem = consolidatedItems[self.sourceRefs[clusterImages[c]]]
+            labelId = clusterLabels[c]
+            left, top, width, height = clusterBoxes[c]
+
+            consolidatedItem["bounding-box"]["annotations"].append({"class_id": labelId,
+                                                                    "left": left, "top": top,
+                                                                    "width": width, "height": height})
+            # A cluster without any confidence gets none rather than a made up one.
+            consolidatedItem["bounding-box-metadata"]["objects"].append({"confidence": clusterConfidences[c]} if clusterHasConfidence[c] else {})
+            consolidatedItem["bounding-box-metadata"]["class-map"][str(labelId)] = self.labels[labelId]
+
+        return consolidatedItems
+
+class JobResultCache:
+    # Keeps the parsed result of each labeling job in a local file, keyed by job name and the ETag of
+    # its output manifest, so a rerun only downloads and parses the output of jobs that changed. Jobs
+    # cached in a final status are not described again. Without a cacheFolder every result is fetched.
+    # Job names are only unique within an account and region, so each region has its own subfolder.
+
+    terminalStatuses = ["Completed", "Failed", "Stopped"]
+
+    def __init__(self, awsRegion, cacheFolder=None):
+        ''' Constructor. '''
+        self.awsRegion = awsRegion
+        self.cacheFolder = cacheFolder
+        self.hits = 0
+        self.misses = 0
+        if(cacheFolder):
+            os.makedirs(os.path.join(cacheFolder, str(awsRegion)), exist_ok=True)
+
+    def getCacheFile(self, jobName):
+        return os.path.join(self.cacheFolder, str(self.awsRegion), "{}.json".format(jobName))
+
+    def read(self, jobName):
+        if(not self.cacheFolder or not os.path.exists(self.getCacheFile(jobName))):
+            return None
+        with open(self.getCacheFile(jobName), "r") as cacheFile:
+            return json.load(cacheFile)
+
+    def write(self, jobName, entry):
+        # Written to a temporary file and renamed, so an interruption never leaves a partial entry.
+        temporaryFile = "{}.tmp".format(self.getCacheFile(jobName))
+        with open(temporaryFile, "w") as cacheFile:
+            json.dump(entry, cacheFile)
+        os.replace(temporaryFile, self.getCacheFile(jobName))
+
+    def isFinished(self, jobName):
+        entry = self.read(jobName)
+        return entry is not None and entry["status"] in self.terminalStatuses
+
+    def getResult(self, jobName, parse):
+        # parse turns the output manifest URI of the job into its result, which has to be JSON serializable.
+        entry = self.read(jobName)
+        if(entry is not None and entry["status"] in self.terminalStatuses):
+            status = entry["status"]
+            outputManifestUri = entry["outputManifestUri"]
+        else:
+            sageMakerClient = AwsHelper().getClient("sagemaker", self.awsRegion)
+            response = sageMakerClient.describe_labeling_job(LabelingJobName=jobName)
+            status = response["LabelingJobStatus"]
+            outputManifestUri = response["LabelingJobOutput"]["OutputDatasetS3Uri"]
+
+        if(not self.cacheFolder):
+            self.misses += 1
+            return parse(outputManifestUri)
+
+        outputBucketName, outputFileName = S3Helper.parseBucketAndDocumentName(outputManifestUri)
+        etag = AwsHelper().getClient('s3', self.awsRegion).head_object(Bucket=outputBucketName, Key=outputFileName)['ETag']
+        if(entry is not None and entry["outputManifestUri"] == outputManifestUri and entry["etag"] == etag):
+            self.hits += 1
+            return entry["result"]
+
+        self.misses += 1
+        result = parse(outputManifestUri)
+        self.write(jobName, { "jobName": jobName, "status": status, "outputManifestUri": outputManifestUri, "etag": etag, "result": result })
+        return result
+
+class BoundingBoxVerificationJobProcessor:
+
+    def __init__(self, inputParameters, jobCache=None):
+        self.inputParameters = inputParameters
+        self.jobCache = jobCache or JobResultCache(inputParameters.get("awsRegion"))
+
+    def generateOutput(self, automlManifestItems):
+
+        automlText = ""
+        for automlManifestItemKey in automlManifestItems:
+            automlManifestItem = automlManifestItems[automlManifestItemKey]
+            
+            automlText += json.dumps(automlManifestItem) + "\n"
+
+        S3Helper.writeToS3(automlText, self.inputParameters["outputBucket"], self.inputParameters["boundingBoxOutputFile"])
+
+        # print(S3Helper.generatePresignedUrl(self.inputParameters["outputBucket"], self.inputParameters["boundingBoxOutputFile"]))
+
+    def readJobOutput(self, outputManifestUri):
+        outputBucketName, outputFileName = S3Helper.parseBucketAndDocumentName(outputManifestUri)
+        jobOutputText = S3Helper.readFromS3(outputBucketName, outputFileName)
+        return [json.loads(outputManifestItemText) for outputManifestItemText in jobOutputText.splitlines()]
+
+    def getJobOutputItems(self, job):
+        with tracer.span("fetch job results", "sagemaker", job=job):
+            return self.jobCache.getResult(job, self.readJobOutput)
+
+    def processJobResults(self, boundingBoxJobs):
+        self.processOutputItems(self.getJobOutputItems(job) for job in boundingBoxJobs)
+
+    def processOutputItems(self, jobOutputItems):
+        # One list of output manifest items per job, from the job output or harvested while the job runs.
+        automlManifestItems = {}
+
+        consolidator = None
+        if(self.inputParameters["consolidateBoxes"]):
+            consolidator = BoundingBoxConsolidator(self.inputParameters["iouThreshold"])
+
+        for jobIndex, outputManifestItems in enumerate(jobOutputItems):
+            for eoutputManifestItem in outputManifestItems:
+                if(consolidator):
+                    consolidator.addManifestItem(eoutputManifestItem, jobIndex)
+                elif(eoutputManifestItem["source-ref"] in automlManifestItems):
+                    automlManifestItem = automlManifestItems[eoutputManifestItem["source-ref"]]
+                    oid = uuid.uuid1()
+                    automlManifestItem["{}-bounding-box-new".format(oid)] = eoutputManifestItem["bounding-box-new"]
+                    automlManifestItem["{}-bounding-box-new-metadata".format(oid)] = eoutputManifestItem["bounding-box-new-metadata"]
+                else:
+                    automlManifestItem =  { "source-ref" : eoutputManifestItem["source-ref"], 
+                                            "bounding-box-new": eoutputManifestItem["bounding-box-new"],
+                                            "bounding-box-new-metadata": eoutputManifestItem["bounding-box-new-metadata"]
+                                            }
+                    automlManifestItems[eoutputManifestItem["source-ref"]] = automlManifestItem
+
+        if(consolidator):
+            automlManifestItems = consolidator.consolidate()
+
+        self.generateOutput(automlManifestItems)
+
+    def checkJobStatus(self, boundingBoxJobs):
+        sageMakerClient = AwsHelper().getClient("sagemaker", self.inputParameters["awsRegion"])
+    
+        for job in boundingBoxJobs:
+            if(self.jobCache.isFinished(job)):
+                print("Job: {}, finished, output cached".format(job))
+                continue
+            response = sageMakerClient.describe_labeling_job(LabelingJobName=job)
+            print("Job: {}, Status: {}".format(job, response["LabelingJobStatus"]))
+            jobStatus = response["LabelingJobStatus"]
+            while (jobStatus in ["InProgress", "Stopping"]):
+                time.sleep(10)
+                response = sageMakerClient.describe_labeling_job(LabelingJobName=job)
+                print("Job: {}, Status: {}".format(response["LabelingJobName"], response["LabelingJobStatus"]))
+                jobStatus = response["LabelingJobStatus"]
+
+    def run(self, boundingBoxJobs):
+        self.checkJobStatus(boundingBoxJobs)
+        self.processJobResults(boundingBoxJobs)
+
+class LabelVerificationJobProcessor:
+
+    def __init__(self, inputParameters, jobCache=None):
+        self.inputParameters = inputParameters
+        self.jobCache = jobCache or JobResultCache(inputParameters.get("awsRegion"))
+
+    def generateOutput(self, finalManifestItems, labelVerificationJobName):
+        finalJobOutput = ""
+
+        for finalManifestItemKey in finalManifestItems:
+            finalLabels = finalManifestItems[finalManifestItemKey]
+            
+            label = {
+                "source-ref": finalManifestItemKey
+            }
+
+            i = 0
+            for finalLabel in finalLabels:
+                
+                label["label-{}".format(i)] = "0"
+                label["label-{}-metadata".format(i)] = {
+                    "class-name": "{}".format(finalLabel["label"]),
+                    "confidence": finalLabel["confidence"],
+                    "type":"groundtruth/image-classification",
+                    "job-name": labelVerificationJobName,
+                    "human-annotated": "yes",
+                    "creation-date": "2018-10-18T22:18:13.527256"
+                }
+                
+                i += 1
+            finalJobOutput += json.dumps(label) + "\n"
+
+        S3Helper.writeToS3(finalJobOutput, self.inputParameters["outputBucket"], self.inputParameters["labelsOutputFile"])
+
+        #print(S3Helper.generatePresignedUrl(self.inputParameters["outputBucket"], self.inputParameters["labelsOutputFile"]))
+
+    def readJobOutput(self, outputManifestUri):
+        # The result is the verified labels per image, so a cached job needs neither its output nor its batch files.
+        jobOutputText = S3Helper.readFromS3Uri(outputManifestUri)
+        outputManifestItems = [json.loads(outputManifestItemText) for outputManifestItemText in jobOutputText.splitlines()]
+        return self.getFinalManifestItems(outputManifestItems)
+
+    def processJobResults(self, labelVerificationJobName):
+        with tracer.span("fetch job results", "sagemaker", job=labelVerificationJobName):
+            finalManifestItems = self.jobCache.getResult(labelVerificationJobName, self.readJobOutput)
+
+        self.generateOutput(finalManifestItems, labelVerificationJobName)
+
+    def processOutputItems(self, outputManifestItems, labelVerificationJobName, batches=None):
+        self.generateOutput(self.getFinalManifestItems(outputManifestItems, batches), labelVerificationJobName)
+
+    def getFinalManifestItems(self, outputManifestItems, batches=None):
+        # batches caches the images and labels of each task, so repeated calls read every batch file once.
+        finalManifestItems = {}
+        if(batches is None):
+            batches = {}
+
+        for eoutputManifestItem in outputManifestItems:
+            if(not eoutputManifestItem["source-ref"] in batches):
+                batches[eoutputManifestItem["source-ref"]] = json.loads(S3Helper.readFromS3Uri(eoutputManifestItem["source-ref"]))
+            imagesAndLabels = batches[eoutputManifestItem["source-ref"]]
+            
+            i = 0
+            for imageAndLabel in imagesAndLabels:
+                if(eoutputManifestItem['labels']['item-{}'.format(i)] == "Yes"):
+                    if(imageAndLabel["imageUrl"] in finalManifestItems):
+                        finalManifestItem = finalManifestItems[imageAndLabel["imageUrl"]]
+                    else:
+                        finalManifestItem = []
+                        finalManifestItems[imageAndLabel["imageUrl"]] = finalManifestItem
+                        
+                    finalManifestItem.append({"label": imageAndLabel["label"], "confidence": 1})
+                    
+                i += 1
+
+        return finalManifestItems
+
+    def checkJobStatus(self, labelVerificationJobName):
+        if(self.jobCache.isFinished(labelVerificationJobName)):
+            print("Job: {}, finished, output cached".format(labelVerificationJobName))
+            return
+
+        sageMakerClient = AwsHelper().getClient("sagemaker", self.inputParameters["awsRegion"])
+        response = sageMakerClient.describe_labeling_job(LabelingJobName=labelVerificationJobName)
+        print("Job: {}, Status: {}".format(response["LabelingJobName"], response["LabelingJobStatus"]))
+        jobStatus = response["LabelingJobStatus"]
+        while (jobStatus in ["InProgress", "Stopping"]):
+            time.sleep(10)
+            response = sageMakerClient.describe_labeling_job(LabelingJobName=labelVerificationJobName)
+            print("Job: {}, Status: {}".format(response["LabelingJobName"], response["LabelingJobStatus"]))
+            jobStatus = response["LabelingJobStatus"]
+
+
+    def run(self, labelVerificationJob):
+        self.checkJobStatus(labelVerificationJob)
+        self.processJobResults(labelVerificationJob)
+
+class JobProcessor:
+
+    def __init__(self):
+        self.inputParameters = {}
+
+    def readManifestLines(self, fileName):
+        return S3Helper.readLinesFromS3Uri("s3://{}/{}".format(self.inputParameters["outputBucket"], fileName))
+
+    def mergeBBAndLabelsOutput(self, hasBBResults, hasLabelResults, hasNoLabelResults):
+        # The job outputs are read line by line and joined on the source-ref. The merged manifest is
+        # then written line by line to local files, compressed and columnar copies in the same pass,
+        # so it is only held once, as the joined items.
+
+        bblb = {}
+
+        if(hasLabelResults):
+            for lbManifestItemLine in self.readManifestLines(self.inputParameters["labelsOutputFile"]):
+                lbManifestItem = json.loads(lbManifestItemLine)
+                bblb[lbManifestItem["source-ref"]] = lbManifestItem
+
+        if(hasBBResults):
+            for bbManifestItemLine in self.readManifestLines(self.inputParameters["boundingBoxOutputFile"]):
+                bbManifestItem = json.loads(bbManifestItemLine)
+                if (bbManifestItem["source-ref"] in bblb):
+                    item = bblb[bbManifestItem["source-ref"]]
+                    for ekey in bbManifestItem:
+                        if(not ekey == "source-ref"):
+                            item[ekey] = bbManifestItem[ekey]
+                else:
+                    bblb[bbManifestItem["source-ref"]] = bbManifestItem
+
+        if(hasNoLabelResults):
+            for noLabelManifestItemLine in self.readManifestLines(self.inputParameters["noLabelsFile"]):
+                noLabelManifestItem = json.loads(noLabelManifestItemLine)
+                bblb[noLabelManifestItem["source-ref"]] = noLabelManifestItem
+
+        outputBucket = self.inputParameters["outputBucket"]
+        bblbOutputFile = self.inputParameters["bblbOutputFile"]
+
+        # Local file name and S3 key of every output, removed once uploaded.
+        outputFiles = []
+        openFiles = []
+
+        def createOutputFile(suffix, s3FileName, mode="w"):
+            outputFile = tempfile.NamedTemporaryFile(mode=mode, suffix=suffix, delete=False)
+            outputFiles.append((outputFile.name, s3FileName))
+            openFiles.append(outputFile)
+            return outputFile
+
+        columnarWriter = None
+        try:
+            streams = [createOutputFile(".manifest", bblbOutputFile)]
+
+            if(self.inputParameters["manifestCompression"] == "gzip"):
+                compressedFile = createOutputFile(".gz", "{}.gz".format(bblbOutputFile), "wb")
+                streams.append(io.TextIOWrapper(gzip.GzipFile(filename="", mode="wb", fileobj=compressedFile), encoding="utf-8"))
+            elif(self.inputParameters["manifestCompression"] == "zstd"):
+                # zstandard is only needed when zstd compression is requested.
+                import zstandard
+                compressedFile = createOutputFile(".zst", "{}.zst".format(bblbOutputFile), "wb")
+                streams.append(io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(compressedFile), encoding="utf-8"))
+
+            if(self.inputParameters["columnarOutput"]):
+                columnarFile = createOutputFile(".parquet", self.inputParameters["columnarOutputFile"], "wb")
+                columnarFile.close()
+                columnarWriter = ColumnarManifestWriter(columnarFile.name)
+
+            for bblbItem in bblb.values():
+                bblbLine = json.dumps(bblbItem) + "\n"
+                for stream in streams:
+                    stream.write(bblbLine)
+                if(columnarWriter):
+                    columnarWriter.addManifestItem(bblbItem)
+
+            # Compressed streams write their last frame on close, before their file is closed.
+            for stream in streams:
+                stream.close()
+            for openFile in openFiles:
+                openFile.close()
+            if(columnarWriter):
+                columnarWriter.close()
+
+            for localFileName, s3FileName in outputFiles:
+                S3Helper.uploadToS3(localFileName, outputBucket, s3FileName)
+        finally:
+            for openFile in openFiles:
+                openFile.close()
+            for localFileName, s3FileName in outputFiles:
+                if(os.path.exists(localFileName)):
+                    os.remove(localFileName)
+
+        print("\nOutput\n=====================")
+        print("Presigned Url:")
+        print(S3Helper.generatePresignedUrl(self.inputParameters["outputBucket"], self.inputParameters["bblbOutputFile"]))
+        print("\nS3 Path:")
+        print("s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["bblbOutputFile"]))
+        if(columnarWriter):
+            print("\nColumnar S3 Path:")
+            print("s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["columnarOutputFile"]))
+
+        return "s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["bblbOutputFile"])
+
+    def processJobFile(self):
+        
+        # print("s3: {}, file: {}".format(self.inputParameters["outputBucket"], self.inputParameters["jobsListFile"]))
+
+        jobs = json.loads(S3Helper.readFromS3(self.inputParameters["outputBucket"], self.inputParameters["jobsListFile"]))
+
+        runid = jobs["runid"]
+        boundingBoxOutputPath = "datasets/{}/bounding-box-verification/output".format(runid)
+        labelsAndBoundingBoxOutputPath = "datasets/{}/output".format(runid)
+        labelOutputPath = "datasets/{}/label-verification/output".format(runid)
+        labelsOutputFile = "{}/labels-output.manifest".format(labelOutputPath)
+        boundingBoxOutputFile = "{}/bounding-box-output.manifest".format(boundingBoxOutputPath)
+        bblbOutputFile = "{}/output.manifest".format(labelsAndBoundingBoxOutputPath)
+        columnarOutputFile = "{}/output.parquet".format(labelsAndBoundingBoxOutputPath)
+        evaluationFile = "{}/evaluation.json".format(labelsAndBoundingBoxOutputPath)
+        self.inputParameters["awsRegion"] = S3Helper.getS3BucketRegion(self.inputParameters["outputBucket"])
+        self.inputParameters["labelsOutputFile"] = labelsOutputFile
+        self.inputParameters["boundingBoxOutputFile"] = boundingBoxOutputFile
+        self.inputParameters["bblbOutputFile"] = bblbOutputFile
+        self.inputParameters["columnarOutputFile"] = columnarOutputFile
+        self.inputParameters["evaluationFile"] = evaluationFile
+
+        return jobs       
+
+    def stopStreamingJobs(self, jobs):
+        # Streaming jobs run until they are stopped. Stopped jobs write their output manifest like other jobs.
+        sageMakerClient = AwsHelper().getClient("sagemaker", self.inputParameters["awsRegion"])
+        jobNames = list(jobs["bounding-box-verification-jobs"])
+        if(jobs["label-verification-job"]):
+            jobNames.append(jobs["label-verification-job"])
+
+        for jobName in jobNames:
+            response = sageMakerClient.describe_labeling_job(LabelingJobName=jobName)
+            if(response["LabelingJobStatus"] == "InProgress"):
+                print("Stopping streaming job: {}".format(jobName))
+                sageMakerClient.stop_labeling_job(LabelingJobName=jobName)
+
+        sns = AwsHelper().getClient("sns", self.inputParameters["awsRegion"])
+        for topicArn in jobs["streaming-topics"]:
+            sns.delete_topic(TopicArn=topicArn)
+
+    def evaluate(self, jobs, outputManifest, hasLabelResults):
+        # Runs started before predictions were recorded cannot be evaluated.
+        if(not jobs.get("predictions-manifest-file")):
+            print("This run has no predictions manifest, skipping the evaluation.")
+            return None
+
+        from feedback.evaluation import evaluateRun
+
+        print("Evaluating model predictions against the review...")
+        report = evaluateRun(jobs["predictions-manifest-file"], outputManifest, self.inputParameters["iouThreshold"],
+                             hasLabelResults, self.inputParameters["awsRegion"])
+        S3Helper.writeToS3(json.dumps(report, indent=2), self.inputParameters["outputBucket"], self.inputParameters["evaluationFile"])
+        print("\nEvaluation S3 Path:")
+        print("s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["evaluationFile"]))
+        return report
+
+    def validateInput(self, args):
+        event = {}
+        event['consolidateBoxes'] = False
+        event['iouThreshold'] = 0.5
+        event['columnarOutput'] = False
+        event['manifestCompression'] = None
+        event['stopStreamingJobs'] = False
+        event['traceFile'] = None
+        event['datasetArn'] = None
+        event['ingestCheckpoint'] = None
+        event['ingestConcurrency'] = 4
+        event['ingestChunkEntries'] = 1000
+        event['evaluate'] = False
+        event['jobCacheFolder'] = None
+        event['collectTimings'] = False
+        i = 0
+        while(i < len(args)):
+            if(args[i] == '--jobs-manifest'):
+                event['jobsFile'] = args[i+1]
+            elif(args[i] == '--consolidate-boxes'):
+                event['consolidateBoxes'] = True
+            elif(args[i] == '--iou-threshold'):
+                event['iouThreshold'] = float(args[i+1])
+            elif(args[i] == '--columnar-output'):
+                event['columnarOutput'] = True
+            elif(args[i] == '--manifest-compression'):
+                event['manifestCompression'] = args[i+1]
+            elif(args[i] == '--stop-streaming-jobs'):
+                event['stopStreamingJobs'] = True
+            elif(args[i] == '--trace-file'):
+                event['traceFile'] = args[i+1]
+            elif(args[i] == '--dataset-arn'):
+                event['datasetArn'] = args[i+1]
+            elif(args[i] == '--ingest-checkpoint'):
+                event['ingestCheckpoint'] = args[i+1]
+            elif(args[i] == '--ingest-concurrency'):
+                event['ingestConcurrency'] = int(args[i+1])
+            elif(args[i] == '--ingest-chunk-entries'):
+                event['ingestChunkEntries'] = int(args[i+1])
+            elif(args[i] == '--evaluate'):
+                event['evaluate'] = True
+            elif(args[i] == '--job-cache'):
+                event['jobCacheFolder'] = args[i+1]
+            elif(args[i] == '--collect-timings'):
+                event['collectTimings'] = True
+            i += 1
+
+        if(not event['manifestCompression'] in [None, 'gzip', 'zstd']):
+            raise Exception("--manifest-compression must be either gzip or zstd.")
+
+        return event
+
+    def run(self, args):
+        event = self.validateInput(args)
+
+        if(not event["traceFile"]):
+            return self.processJobs(event)
+
+        tracer.start()
+        try:
+            return self.processJobs(event)
+        finally:
+            tracer.stop(event["traceFile"])
+
+    def processJobs(self, event):
+        self.jobsFile = event["jobsFile"]
+        print("Jobs manifest file: {}".format(self.jobsFile))
+
+        outputBucket, jobsListFile = S3Helper.parseBucketAndDocumentName(self.jobsFile)
+        # print("Output bucket: {}, Jobs file: {}".format(outputBucket, jobsListFile))
+        self.inputParameters["outputBucket"] = outputBucket
+        self.inputParameters["jobsListFile"] = jobsListFile
+        self.inputParameters["consolidateBoxes"] = event["consolidateBoxes"]
+        self.inputParameters["iouThreshold"] = event["iouThreshold"]
+        self.inputParameters["columnarOutput"] = event["columnarOutput"]
+        self.inputParameters["manifestCompression"] = event["manifestCompression"]
+
+        jobs = self.processJobFile()
+        jobCache = JobResultCache(self.inputParameters["awsRegion"], event["jobCacheFolder"])
+
+        if(jobs.get("streaming-topics")):
+            if(not event["stopStreamingJobs"]):
+                raise Exception("This run uses streaming jobs, which keep running until they are stopped. Run again with --stop-streaming-jobs once the review is done.")
+            self.stopStreamingJobs(jobs)
+
+        hasLabelResults = False
+        if(jobs["label-verification-job"]):
+            print("Processing label verification jobs...")
+            labelJobProcessor = LabelVerificationJobProcessor(self.inputParameters, jobCache)
+            labelJobProcessor.run(jobs["label-verification-job"])
+            hasLabelResults = True
+            print("Processed label verification jobs...")
+
+        hasBBResults = False
+        if(jobs["bounding-box-verification-jobs"]):
+            print("Processing bounding box verification jobs...")
+            bbJobProcessor = BoundingBoxVerificationJobProcessor(self.inputParameters, jobCache)
+            bbJobProcessor.run(jobs["bounding-box-verification-jobs"])
+            hasBBResults = True
+            print("Processed bounding box verification jobs...")
+
+        hasNoLabelResults = False
+        if(jobs["no-labels-manifest-file"]):
+            print("Processing no labels manifest...")
+            # print(jobs["no-labels-manifest-file"])
+            nlbBucket, self.inputParameters["noLabelsFile"] = S3Helper.parseBucketAndDocumentName(jobs["no-labels-manifest-file"])
+            hasNoLabelResults = True
+            print("Processed no labels manifest...")
+
+        if(jobCache.cacheFolder):
+            print("Job results: {} from the cache, {} fetched.".format(jobCache.hits, jobCache.misses))
+
+        outputManifest = self.mergeBBAndLabelsOutput(hasBBResults, hasLabelResults, hasNoLabelResults)
+
+        if(event["evaluate"]):
+            self.evaluate(jobs, outputManifest, hasLabelResults)
+
+        if(event["collectTimings"]):
+            from feedback.tuning import TaskTimingCollector
+
+            print("Collecting task timings for tuning the next run...")
+            TaskTimingCollector(self.inputParameters).run(jobs)
+
+        if(event["datasetArn"]):
+            from feedback.ingest import ingestManifest
+
+            print("Adding output manifest entries to dataset: {}".format(event["datasetArn"]))
+            ingestManifest(outputManifest, event["datasetArn"], event["ingestCheckpoint"], event["ingestConcurrency"],
+                           event["ingestChunkEntries"])
+
+        return outputManifest
+
+def main(args):
+    jobProcessor = JobProcessor()
+    jobProcessor.run(args)
@@ -0,0 +1,135 @@
+from threading import Lock
+import os
+import pickle
+import sqlite3
+import tempfile
+
+class LabelGroups:
+    # One kind of group held by a GroupStore. Behaves like the label -> images dictionaries
+    # ImageAnalyzer used to build: iterating yields labels and indexing yields the label's items.
+
+    def __init__(self, store, groupType):
+        self.store = store
+        self.groupType = groupType
+
+    def add(self, label, item, key=None):
+        self.store.add(self.groupType, label, item, key)
+
+    def items(self, label):
+        return self.store.items(self.groupType, label)
+
+    def values(self):
+        for label in self:
+            for item in self.items(label):
+                yield item
+
+    def count(self, label):
+        return self.store.labelCounts[self.groupType].get(label, 0)
+
+    def __iter__(self):
+        return iter(list(self.store.labelCounts[self.groupType]))
+
+    def __getitem__(self, label):
+        if(not label in self):
+            raise KeyError(label)
+        return self.items(label)
+
+    def __contains__(self, label):
+        return label in self.store.labelCounts[self.groupType]
+
+    def __len__(self):
+        return len(self.store.labelCounts[self.groupType])
+
+class GroupStore:
+    # Holds the label groups of one run within a memory budget. Once the pickled items in memory
+    # exceed the budget they are moved to a local SQLite file clustered by group type and label,
+    # so each label can be read back in insertion order without loading the others.
+
+    def __init__(self, memoryBudgetBytes, storePath=None):
+        self.memoryBudgetBytes = memoryBudgetBytes
+        self.storePath = storePath or tempfile.gettempdir()
+        self.lock = Lock()
+        self.labelCounts = {}
+        self.memoryItems = {}
+        self.memoryKeys = set()
+        self.memoryBytes = 0
+        self.sequence = 0
+        self.connection = None
+        self.fileName = None
+
+    def getGroups(self, groupType):
+        self.labelCounts.setdefault(groupType, {})
+        return LabelGroups(self, groupType)
+
+    def openStore(self):
+        storeFile = tempfile.NamedTemporaryFile(prefix="feedback-groups-", suffix=".sqlite", dir=self.storePath, delete=False)
+        storeFile.close()
+        self.fileName = storeFile.name
+
+        self.connection = sqlite3.connect(self.fileName, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=OFF")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.connection.execute("""CREATE TABLE items (groupType TEXT, label TEXT, seq INTEGER, payload BLOB,
+                                   PRIMARY KEY (groupType, label, seq)) WITHOUT ROWID""")
+        self.connection.execute("CREATE TABLE keys (groupType TEXT, key TEXT, PRIMARY KEY (groupType, key)) WITHOUT ROWID")
+
+    def spill(self):
+        if(not self.connection):
+            self.openStore()
+
+        rows = []
+        for (groupType, label), payloads in self.memoryItems.items():
+            for seq, payload in payloads:
+                rows.append((groupType, label, seq, payload))
+
+        with self.connection:
+            self.connection.executemany("INSERT INTO items VALUES (?, ?, ?, ?)", rows)
+            self.connection.executemany("INSERT INTO keys VALUES (?, ?)", list(self.memoryKeys))
+
+        self.memoryItems.clear()
+        self.memoryKeys.clear()
+        self.memoryBytes = 0
+
+    def hasKey(self, groupType, key):
+        if((groupType, key) in self.memoryKeys):
+            return True
+        if(self.connection):
+            cursor = self.connection.execute("SELECT 1 FROM keys WHERE groupType = ? AND key = ?", (groupType, key))
+            return cursor.fetchone() is not None
+        return False
+
+    def add(self, groupType, label, item, key=None):
+        # Items with a key are only stored once per group type.
+        with self.lock:
+            if(key is not None):
+                if(self.hasKey(groupType, key)):
+                    return
+                self.memoryKeys.add((groupType, key))
+
+            payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+            self.memoryItems.setdefault((groupType, label), []).append((self.sequence, payload))
+            self.sequence += 1
+            self.memoryBytes += len(payload)
+
+            labelCounts = self.labelCounts.setdefault(groupType, {})
+            labelCounts[label] = labelCounts.get(label, 0) + 1
+
+            if(self.memoryBytes > self.memoryBudgetBytes):
+                self.spill()
+
+    def items(self, groupType, label):
+        # Spilled items are always older than the ones still in memory.
+        if(self.connection):
+            cursor = self.connection.execute("SELECT payload FROM items WHERE groupType = ? AND label = ? ORDER BY seq",
+                                             (groupType, label))
+            for (payload,) in cursor:
+                yield pickle.loads(payload)
+
+        for seq, payload in list(self.memoryItems.get((groupType, label), [])):
+            yield pickle.loads(payload)
+
+    def close(self):
+        if(self.connection):
+            self.connection.close()
+            self.connection = None
+            os.remove(self.fileName)
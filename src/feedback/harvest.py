@@ -0,0 +1,216 @@
+import json
+import time
+import datetime
+
+from feedback.helpers import AwsHelper, S3Helper
+from feedback.tracing import tracer
+from feedback.get import JobProcessor, BoundingBoxVerificationJobProcessor, LabelVerificationJobProcessor
+
+# Builds a partial output.manifest from the Ground Truth tasks that were already reviewed, while
+# the jobs are still running. Ground Truth writes the consolidated answers of every task to
+# <output path>/<job>/annotations/consolidated-annotation/consolidation-response/ as they come in.
+# Each refresh reads only the files after the watermark of each job and writes their answers to a
+# new part of the job's partial manifest under datasets/<runId>/partial/jobs/<job>/. The harvest
+# state only keeps the watermark and part count of each job, and the ETags of the files read after
+# the watermark. When there are new answers, the partial output.manifest is merged again from the parts.
+
+class PartialResultHarvester:
+
+    # Files named shortly before a refresh may be followed by files with earlier names, so the
+    # watermark stays behind files younger than this. Those files are listed again next time, but
+    # only read again when their ETag changed. Answers are keyed by task and the latest part wins.
+    settleSeconds = 300
+    terminalStatuses = ["Completed", "Failed", "Stopped"]
+
+    def __init__(self, jobsFile, consolidateBoxes=False, iouThreshold=0.5):
+        ''' Constructor. '''
+        self.jobProcessor = JobProcessor()
+        self.inputParameters = self.jobProcessor.inputParameters
+        self.inputParameters["outputBucket"], self.inputParameters["jobsListFile"] = S3Helper.parseBucketAndDocumentName(jobsFile)
+        self.inputParameters["consolidateBoxes"] = consolidateBoxes
+        self.inputParameters["iouThreshold"] = iouThreshold
+        self.inputParameters["columnarOutput"] = False
+        self.inputParameters["manifestCompression"] = None
+
+        self.jobs = self.jobProcessor.processJobFile()
+        partialPath = "datasets/{}/partial".format(self.jobs["runid"])
+        self.inputParameters["labelsOutputFile"] = "{}/labels-output.manifest".format(partialPath)
+        self.inputParameters["boundingBoxOutputFile"] = "{}/bounding-box-output.manifest".format(partialPath)
+        self.inputParameters["bblbOutputFile"] = "{}/output.manifest".format(partialPath)
+        self.stateFile = "{}/harvest-state.json".format(partialPath)
+        self.jobsPath = "{}/jobs".format(partialPath)
+
+    def loadState(self):
+        if(S3Helper.objectExists(self.inputParameters["outputBucket"], self.stateFile)):
+            return json.loads(S3Helper.readFromS3(self.inputParameters["outputBucket"], self.stateFile))
+        return { "jobs": {}, "annotations": 0 }
+
+    def getPartFile(self, job, part):
+        return "{}/{}/part-{:05d}.jsonl".format(self.jobsPath, job, part)
+
+    def readJobAnswers(self, job, jobState):
+        # Latest answer of each task, in the order the tasks were first answered.
+        answers = {}
+        for part in range(jobState["parts"]):
+            partUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], self.getPartFile(job, part))
+            for line in S3Helper.readLinesFromS3Uri(partUri):
+                answer = json.loads(line)
+                answers[answer["datasetObjectId"]] = answer
+        return answers.values()
+
+    def getAnnotationFiles(self, outputBucketName, annotationsPath, watermark):
+        s3 = AwsHelper().getClient('s3', self.inputParameters["awsRegion"])
+        params = { "Bucket": outputBucketName, "Prefix": annotationsPath, "MaxKeys": 1000 }
+        if(watermark):
+            params["StartAfter"] = watermark
+        while(True):
+            listObjectsResponse = s3.list_objects_v2(**params)
+            for doc in listObjectsResponse.get('Contents', []):
+                yield doc
+            if(not listObjectsResponse['IsTruncated']):
+                break
+            params["ContinuationToken"] = listObjectsResponse['NextContinuationToken']
+
+    def harvestJob(self, job, jobState, isLabelJob=False):
+        sageMakerClient = AwsHelper().getClient("sagemaker", self.inputParameters["awsRegion"])
+        response = sageMakerClient.describe_labeling_job(LabelingJobName=job)
+
+        manifestUri = response["InputConfig"]["DataSource"].get("S3DataSource", {}).get("ManifestS3Uri")
+        if(not manifestUri):
+            # Tasks of streaming jobs are not lines of an input manifest. Their output is read by get-feedback.py.
+            print("Job: {}, Status: {}, streaming job skipped".format(job, response["LabelingJobStatus"]))
+            return (response["LabelingJobStatus"], 0)
+
+        outputBucketName, outputPath = S3Helper.parseBucketAndDocumentName(response["OutputConfig"]["S3OutputPath"])
+        annotationsPath = "{}/{}/annotations/consolidated-annotation/consolidation-response/".format(outputPath.rstrip("/"), job)
+        settledBefore = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.settleSeconds)
+
+        # Batch files of label verification tasks are read once per refresh.
+        labelJobProcessor = LabelVerificationJobProcessor(self.inputParameters) if isLabelJob else None
+        batches = {}
+
+        readFiles = jobState.get("unsettled", {})
+        unsettled = {}
+        sourceRefs = None
+        answers = []
+        settled = True
+        for doc in self.getAnnotationFiles(outputBucketName, annotationsPath, jobState["watermark"]):
+            settled = settled and doc['LastModified'] < settledBefore
+            if(settled):
+                jobState["watermark"] = doc['Key']
+            else:
+                unsettled[doc['Key']] = doc['ETag']
+
+            # Already in a part.
+            if(readFiles.get(doc['Key']) == doc['ETag']):
+                continue
+
+            if(sourceRefs is None):
+                # datasetObjectId is the line number of the task in the input manifest.
+                sourceRefs = [json.loads(line)["source-ref"] for line in S3Helper.readLinesFromS3Uri(manifestUri, self.inputParameters["awsRegion"])]
+
+            with tracer.span("read annotations", "s3", job=job, key=doc['Key']):
+                consolidationResponse = json.loads(S3Helper.readFromS3(outputBucketName, doc['Key']))
+            for taskAnswer in consolidationResponse:
+                outputManifestItem = { "source-ref": sourceRefs[int(taskAnswer["datasetObjectId"])] }
+                outputManifestItem.update(taskAnswer["consolidatedAnnotation"]["content"])
+                answer = { "datasetObjectId": taskAnswer["datasetObjectId"] }
+                if(labelJobProcessor):
+                    # The images and labels of a label verification task are resolved from its batch file once.
+                    answer["images"] = labelJobProcessor.getFinalManifestItems([outputManifestItem], batches)
+                else:
+                    answer["item"] = outputManifestItem
+                answers.append(answer)
+
+        jobState["unsettled"] = unsettled
+
+        # The part is written before the state, so an interrupted refresh writes the same part again.
+        if(answers):
+            S3Helper.writeToS3("".join([json.dumps(answer) + "\n" for answer in answers]), self.inputParameters["outputBucket"],
+                               self.getPartFile(job, jobState["parts"]))
+            jobState["parts"] += 1
+
+        print("Job: {}, Status: {}, new answers: {}, manifest parts: {}".format(job, response["LabelingJobStatus"], len(answers),
+                                                                              jobState["parts"]))
+        return (response["LabelingJobStatus"], len(answers))
+
+    def refresh(self):
+        state = self.loadState()
+
+        labelJob = self.jobs["label-verification-job"]
+        jobNames = list(self.jobs["bounding-box-verification-jobs"])
+        if(labelJob):
+            jobNames.append(labelJob)
+
+        statuses = []
+        newAnswers = 0
+        for job in jobNames:
+            jobState = state["jobs"].setdefault(job, { "watermark": None, "parts": 0, "unsettled": {} })
+            status, annotations = self.harvestJob(job, jobState, job == labelJob)
+            statuses.append(status)
+            newAnswers += annotations
+        state["annotations"] += newAnswers
+
+        S3Helper.writeToS3(json.dumps(state), self.inputParameters["outputBucket"], self.stateFile)
+
+        boundingBoxJobs = [job for job in self.jobs["bounding-box-verification-jobs"] if state["jobs"][job]["parts"]]
+        hasBBResults = len(boundingBoxJobs) > 0
+        hasLabelResults = bool(labelJob) and state["jobs"][labelJob]["parts"] > 0
+
+        if(not hasBBResults and not hasLabelResults):
+            print("No reviewed tasks yet.")
+            return (None, statuses)
+
+        outputManifest = "s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["bblbOutputFile"])
+        if(not newAnswers and S3Helper.objectExists(self.inputParameters["outputBucket"], self.inputParameters["bblbOutputFile"])):
+            print("No new answers, partial output is current: {}".format(outputManifest))
+            return (outputManifest, statuses)
+
+        if(hasBBResults):
+            # Jobs are read one at a time from their parts.
+            BoundingBoxVerificationJobProcessor(self.inputParameters).processOutputItems(
+                [answer["item"] for answer in self.readJobAnswers(job, state["jobs"][job])] for job in boundingBoxJobs)
+
+        if(hasLabelResults):
+            finalManifestItems = {}
+            for answer in self.readJobAnswers(labelJob, state["jobs"][labelJob]):
+                for imageUrl, labels in answer["images"].items():
+                    finalManifestItems.setdefault(imageUrl, []).extend(labels)
+            LabelVerificationJobProcessor(self.inputParameters).generateOutput(finalManifestItems, labelJob)
+
+        return (self.jobProcessor.mergeBBAndLabelsOutput(hasBBResults, hasLabelResults, False), statuses)
+
+    def run(self, intervalSeconds=0):
+        while(True):
+            outputManifest, statuses = self.refresh()
+            if(all([status in self.terminalStatuses for status in statuses])):
+                print("All jobs have finished. Run get-feedback.py for the complete output.")
+                return outputManifest
+            if(not intervalSeconds):
+                return outputManifest
+            time.sleep(intervalSeconds)
+
+def main(args):
+    jobsFile = None
+    consolidateBoxes = False
+    iouThreshold = 0.5
+    intervalSeconds = 0
+
+    i = 0
+    while(i < len(args)):
+        if(args[i] == '--jobs-manifest'):
+            jobsFile = args[i+1]
+        elif(args[i] == '--consolidate-boxes'):
+            consolidateBoxes = True
+        elif(args[i] == '--iou-threshold'):
+            iouThreshold = float(args[i+1])
+        elif(args[i] == '--interval'):
+            intervalSeconds = int(args[i+1])
+        i += 1
+
+    try:
+        if(not jobsFile):
+            raise Exception("--jobs-manifest is required.")
+        PartialResultHarvester(jobsFile, consolidateBoxes, iouThreshold).run(intervalSeconds)
+    except Exception as e:
+        print("Something went wrong:\n====================================================\n{}".format(e))
@@ -0,0 +1,540 @@
+from urllib.parse import urlparse
+from threading import Lock
+from collections import deque
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import hashlib
+import os
+import re
+import time
+
+from feedback.tracing import tracer
+
+class AwsHelper:
+
+    # Clients are thread safe and slow to create, so they are created once per process and
+    # shared by every thread and every run. setClient swaps in a local stand-in for a service.
+    clients = {}
+    clientOverrides = {}
+    clientsLock = Lock()
+    maxPoolConnections = 50
+
+    def getConfig(self):
+        from botocore.client import Config
+
+        return Config(
+            retries = dict(
+                max_attempts = 5
+            ),
+            max_pool_connections = self.maxPoolConnections
+        )
+
+    def getClient(self, name, awsRegion=None):
+        if(name in AwsHelper.clientOverrides):
+            return AwsHelper.clientOverrides[name]
+
+        with AwsHelper.clientsLock:
+            if(not (name, awsRegion) in AwsHelper.clients):
+                import boto3
+                AwsHelper.clients[(name, awsRegion)] = boto3.client(name, region_name=awsRegion, config=self.getConfig())
+            return AwsHelper.clients[(name, awsRegion)]
+
+    def getResource(self, name, awsRegion=None):
+        import boto3
+
+        if(awsRegion):
+            return boto3.resource(name, region_name=awsRegion, config=self.getConfig())
+        else:
+            return boto3.resource(name, config=self.getConfig())
+
+    @staticmethod
+    def setClient(name, client):
+        AwsHelper.clientOverrides[name] = client
+
+    @staticmethod
+    def clearClients():
+        with AwsHelper.clientsLock:
+            AwsHelper.clients.clear()
+            AwsHelper.clientOverrides.clear()
+
+class S3Helper:
+
+    bucketRegions = {}
+
+    @staticmethod
+    def generatePresignedUrl(bucketName, fileName, awsRegion=None):
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        response = s3.generate_presigned_url('get_object',
+                                            Params={'Bucket': bucketName,
+                                            'Key': fileName},)
+        return response
+
+
+    @staticmethod
+    def writeToS3(content, bucketName, s3FileName, awsRegion=None):
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        with tracer.span("put_object", "s3", key=s3FileName):
+            s3.put_object(Bucket=bucketName, Key=s3FileName, Body=content)
+
+    @staticmethod
+    def objectExists(bucketName, s3FileName, awsRegion=None):
+        from botocore.exceptions import ClientError
+
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        try:
+            s3.head_object(Bucket=bucketName, Key=s3FileName)
+            return True
+        except ClientError as e:
+            if(e.response['Error']['Code'] in ['404', 'NoSuchKey', 'NotFound']):
+                return False
+            raise
+
+    @staticmethod
+    def writeContentAddressed(content, bucketName, s3Path, extension, awsRegion=None):
+        # Identical content always maps to the same key, so it is uploaded only once.
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        s3FileName = "{}/{}.{}".format(s3Path, digest, extension)
+        if(not S3Helper.objectExists(bucketName, s3FileName, awsRegion)):
+            S3Helper.writeToS3(content, bucketName, s3FileName, awsRegion)
+        return s3FileName
+
+    @staticmethod
+    def uploadToS3(localFileName, bucketName, s3FileName, awsRegion=None):
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        with tracer.span("upload_file", "s3", key=s3FileName):
+            s3.upload_file(localFileName, bucketName, s3FileName)
+
+    @staticmethod
+    def readFromS3(bucketName, s3FileName, awsRegion=None):
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        with tracer.span("get_object", "s3", key=s3FileName):
+            return s3.get_object(Bucket=bucketName, Key=s3FileName)['Body'].read().decode('utf-8')
+
+    @staticmethod
+    def readFromS3Uri(documentUri, awsRegion=None):
+        o = urlparse(documentUri)
+        bucketName = o.netloc
+        fileName = o.path[1:]
+        return S3Helper.readFromS3(bucketName, fileName)
+
+    @staticmethod
+    def readLinesFromS3Uri(documentUri, awsRegion=None):
+        # Streams a JSON lines file instead of reading it into memory at once.
+        bucketName, fileName = S3Helper.parseBucketAndDocumentName(documentUri)
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        response = s3.get_object(Bucket=bucketName, Key=fileName)
+        for line in response['Body'].iter_lines():
+            if(line):
+                yield line.decode('utf-8')
+
+    @staticmethod
+    def parseBucketAndDocumentName(documentUri, awsRegion=None):
+        o = urlparse(documentUri)
+        bucketName = o.netloc
+        fileName = o.path[1:]
+        return (bucketName, fileName)
+
+    @staticmethod
+    def getImageSize(bucketName, imageName, awsRegion=None):
+        from PIL import Image
+
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        iresponse = s3.get_object(Bucket=bucketName, Key=imageName)
+        file_stream = iresponse['Body']
+        im = Image.open(file_stream)
+        return (im.width, im.height)
+
+    @staticmethod
+    def getS3BucketRegion(bucketName):
+        if(not bucketName in S3Helper.bucketRegions):
+            client = AwsHelper().getClient('s3')
+            response = client.get_bucket_location(Bucket=bucketName)
+            S3Helper.bucketRegions[bucketName] = response['LocationConstraint']
+        return S3Helper.bucketRegions[bucketName]
+
+    @staticmethod
+    def getFileNames(awsRegion, bucketName, prefix, maxPages, allowedFileTypes):
+
+        files = []
+
+        currentPage = 1
+        hasMoreContent = True
+        continuationToken = None
+
+        s3client = AwsHelper().getClient('s3', awsRegion)
+
+        while(hasMoreContent and currentPage <= maxPages):
+            with tracer.span("list page", "s3", prefix=prefix, page=currentPage):
+                if(continuationToken):
+                    listObjectsResponse = s3client.list_objects_v2(
+                        Bucket=bucketName,
+                        Prefix=prefix,
+                        MaxKeys=1000,
+                        ContinuationToken=continuationToken)
+                else:
+                    listObjectsResponse = s3client.list_objects_v2(
+                        Bucket=bucketName,
+                        Prefix=prefix,
+                        MaxKeys=1000)
+
+            if(listObjectsResponse['IsTruncated']):
+                continuationToken = listObjectsResponse['NextContinuationToken']
+            else:
+                hasMoreContent = False
+
+            for doc in listObjectsResponse.get('Contents', []):
+                docName = doc['Key']
+                docExt = FileHelper.getFileExtenstion(docName)
+                docExtLower = docExt.lower()
+                if(docExtLower in allowedFileTypes):
+                    files.append(docName)
+
+            currentPage += 1
+
+        return files
+
+class ParallelS3Lister:
+    # Lists a prefix with many list_objects_v2 chains at once instead of one continuation chain.
+    # Folders found with the delimiter are listed by chains of their own. A chain that is still
+    # truncated after splitAfterPages pages, such as a flat folder with millions of keys, hands the
+    # rest of its key range to new chains. Ranges never overlap, so every key is listed once.
+    # Folders repeated at range edges are dropped.
+
+    def __init__(self, awsRegion, bucketName, allowedFileTypes, concurrency=16, splitAfterPages=2, delimiter="/"):
+        ''' Constructor. '''
+        self.bucketName = bucketName
+        self.allowedFileTypes = allowedFileTypes
+        self.concurrency = concurrency
+        self.splitAfterPages = splitAfterPages
+        self.delimiter = delimiter
+        # One client for all chains, its connection pool is sized for concurrent calls.
+        self.s3client = AwsHelper().getClient('s3', awsRegion)
+        self.listCalls = 0
+        self.splits = 0
+
+    @staticmethod
+    def getSplitRanges(prefix, pageEntries, endAt):
+        # Key names count up from the last entry of the page, like a number in the characters that
+        # varied on the page. Boundaries are placed at every digit of that number, from the one that
+        # varied up to the first, so the ranges grow from a page to most of the remaining keys.
+        firstEntry = min(pageEntries)
+        lastEntry = max(pageEntries)
+
+        position = 0
+        while(position < len(firstEntry) and firstEntry[position] == lastEntry[position]):
+            position += 1
+
+        alphabet = set()
+        for entry in pageEntries:
+            alphabet.update(re.match("[0-9A-Za-z]*", entry[position:]).group(0))
+        alphabet = sorted(alphabet)
+
+        boundaries = []
+        while(position >= len(prefix) and position < len(lastEntry) and lastEntry[position] in alphabet):
+            boundaries.extend([lastEntry[:position] + c for c in alphabet if c > lastEntry[position]])
+            position -= 1
+        boundaries = [boundary for boundary in boundaries if endAt is None or boundary < endAt]
+
+        # (startAfter, endAt] ranges, the last one ends where the chain did.
+        return list(zip([lastEntry] + boundaries, boundaries + [endAt]))
+
+    def listRange(self, prefix, startAfter, endAt):
+        keys = []
+        folders = []
+        ranges = []
+        pages = 0
+        continuationToken = None
+        while(True):
+            params = { "Bucket": self.bucketName, "Prefix": prefix, "MaxKeys": 1000, "Delimiter": self.delimiter }
+            if(continuationToken):
+                params["ContinuationToken"] = continuationToken
+            elif(startAfter):
+                params["StartAfter"] = startAfter
+            with tracer.span("list page", "s3", prefix=prefix, startAfter=startAfter, page=pages + 1):
+                listObjectsResponse = self.s3client.list_objects_v2(**params)
+            pages += 1
+
+            entries = [doc['Key'] for doc in listObjectsResponse.get('Contents', [])]
+            pageFolders = [commonPrefix['Prefix'] for commonPrefix in listObjectsResponse.get('CommonPrefixes', [])]
+            if(not entries and not pageFolders):
+                break
+            lastEntry = max(entries[-1:] + pageFolders[-1:])
+            keys.extend([key for key in entries if endAt is None or key <= endAt])
+            folders.extend([folder for folder in pageFolders if endAt is None or folder <= endAt])
+
+            if(not listObjectsResponse['IsTruncated'] or (endAt is not None and lastEntry >= endAt)):
+                break
+            if(pages >= self.splitAfterPages):
+                ranges = self.getSplitRanges(prefix, entries + pageFolders, endAt)
+                break
+            continuationToken = listObjectsResponse['NextContinuationToken']
+
+        return (prefix, keys, folders, ranges, pages)
+
+    def listKeys(self, prefix, maxKeys=None):
+        listedFolders = set()
+        listedKeys = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = set([executor.submit(self.listRange, prefix, None, None)])
+            try:
+                while(futures):
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        rangePrefix, keys, folders, ranges, pages = future.result()
+                        self.listCalls += pages
+
+                        for folder in folders:
+                            if(not folder in listedFolders):
+                                listedFolders.add(folder)
+                                futures.add(executor.submit(self.listRange, folder, None, None))
+                        if(ranges):
+                            self.splits += 1
+                        for startAfter, endAt in ranges:
+                            futures.add(executor.submit(self.listRange, rangePrefix, startAfter, endAt))
+
+                        for key in keys:
+                            if(FileHelper.getFileExtenstion(key).lower() in self.allowedFileTypes):
+                                yield key
+                                listedKeys += 1
+                                if(maxKeys and listedKeys >= maxKeys):
+                                    return
+            finally:
+                for future in futures:
+                    future.cancel()
+
+class FileHelper:
+    @staticmethod
+    def getFileNameAndExtension(filePath):
+        basename = os.path.basename(filePath)
+        dn, dext = os.path.splitext(basename)
+        return (dn, dext[1:])
+
+    @staticmethod
+    def getFileName(fileName):
+        basename = os.path.basename(fileName)
+        dn, dext = os.path.splitext(basename)
+        return dn
+
+    @staticmethod
+    def getFileExtenstion(fileName):
+        basename = os.path.basename(fileName)
+        dn, dext = os.path.splitext(basename)
+        return dext[1:]
+
+class RateLimiter:
+    # Spaces out calls made from any number of threads to at most ratePerSecond.
+
+    def __init__(self, ratePerSecond):
+        self.interval = 1.0 / ratePerSecond
+        self.nextTime = time.monotonic()
+        self.lock = Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            waitTime = self.nextTime - now
+            self.nextTime = max(now, self.nextTime) + self.interval
+
+        if(waitTime > 0):
+            time.sleep(waitTime)
+
+class RequestHedger:
+    # Sends a duplicate of a call that has been running longer than the given percentile of recent
+    # latencies and returns whichever finishes first. The loser cannot be cancelled once started, so
+    # its result is ignored. Hedges are capped at maxExtraLoad times the number of calls.
+
+    def __init__(self, percentile, maxExtraLoad, maxWorkers, minSamples=20, windowSize=1000):
+        self.percentile = percentile
+        self.maxExtraLoad = maxExtraLoad
+        self.minSamples = minSamples
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.lock = Lock()
+        self.recentLatencies = deque(maxlen=windowSize)
+        self.primaryLatencies = array('d')
+        self.effectiveLatencies = array('d')
+        self.hedgeDelay = None
+        self.samplesSinceUpdate = 0
+        self.calls = 0
+        self.hedges = 0
+        self.hedgeWins = 0
+        self.savedSeconds = 0
+
+    def recordLatency(self, latency):
+        with self.lock:
+            self.recentLatencies.append(latency)
+            self.primaryLatencies.append(latency)
+            self.samplesSinceUpdate += 1
+            # Sorting the window on every call is wasted work, the threshold moves slowly.
+            if(len(self.recentLatencies) >= self.minSamples and (self.hedgeDelay is None or self.samplesSinceUpdate >= 10)):
+                latencies = sorted(self.recentLatencies)
+                self.hedgeDelay = latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+                self.samplesSinceUpdate = 0
+
+    def canHedge(self):
+        with self.lock:
+            if(self.hedges + 1 > self.calls * self.maxExtraLoad):
+                return False
+            self.hedges += 1
+            return True
+
+    def call(self, fn, *args):
+        with self.lock:
+            self.calls += 1
+            hedgeDelay = self.hedgeDelay
+
+        startTime = time.time()
+        primary = self.executor.submit(fn, *args)
+        primary.add_done_callback(lambda f: self.recordLatency(time.time() - startTime))
+
+        futures = [primary]
+        if(hedgeDelay is not None):
+            done, pending = wait(futures, timeout=hedgeDelay)
+            if(pending and self.canHedge()):
+                futures.append(self.executor.submit(fn, *args))
+
+        # The first successful response wins. If both fail, the primary's error is raised.
+        pending = set(futures)
+        while(pending):
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if(future.exception() is None):
+                    winTime = time.time()
+                    with self.lock:
+                        self.effectiveLatencies.append(winTime - startTime)
+                    if(future is not primary):
+                        with self.lock:
+                            self.hedgeWins += 1
+                        primary.add_done_callback(lambda f: self.addSavedSeconds(time.time() - winTime))
+                    return future.result()
+
+        return primary.result()
+
+    def addSavedSeconds(self, seconds):
+        with self.lock:
+            self.savedSeconds += seconds
+
+    @staticmethod
+    def getPercentile(latencies, percentile):
+        if(not latencies):
+            return 0
+        latencies = sorted(latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile / 100))]
+
+    def report(self):
+        with self.lock:
+            hedgeRate = self.hedges / self.calls if self.calls else 0
+            print("Hedged {} of {} requests ({:.1%}), {} hedges answered first, at least {:.1f} seconds saved.".format(
+                self.hedges, self.calls, hedgeRate, self.hedgeWins, self.savedSeconds))
+            print("p99 latency without hedging: {:.3f} seconds, with hedging: {:.3f} seconds.".format(
+                self.getPercentile(self.primaryLatencies, 99), self.getPercentile(self.effectiveLatencies, 99)))
+
+    def shutdown(self):
+        # Calls that lost are not waited for.
+        self.executor.shutdown(wait=False)
+
+class EndpointBalancer:
+    # Sends each call to the endpoint with the fewest calls in flight. An endpoint that throttles or
+    # fails is taken out of rotation for ejectSeconds, doubled for every further failure in a row, and
+    # the call is retried on the next endpoint. Once every endpoint has failed a call, it waits for the
+    # first one back in rotation, up to maxRounds times. Errors listed in requestErrors are caused by
+    # the request itself, so they are raised without retrying or ejecting.
+
+    throttlingErrors = ["ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException"]
+    maxEjectSeconds = 300
+
+    def __init__(self, endpoints, ejectSeconds=5, requestErrors=None, maxRounds=3):
+        self.endpoints = []
+        for name, target in endpoints:
+            self.endpoints.append({ "name": name, "target": target, "outstanding": 0, "calls": 0, "failures": 0, "throttles": 0,
+                                    "ejections": 0, "consecutiveFailures": 0, "ejectedUntil": 0, "latencies": array('d') })
+        self.ejectSeconds = ejectSeconds
+        self.requestErrors = requestErrors or []
+        self.maxRounds = maxRounds
+        self.lock = Lock()
+        self.startTime = time.monotonic()
+
+    @staticmethod
+    def getErrorCode(e):
+        return getattr(e, "response", {}).get("Error", {}).get("Code")
+
+    def acquire(self, tried):
+        with self.lock:
+            now = time.monotonic()
+            candidates = [endpoint for endpoint in self.endpoints if not endpoint in tried]
+            available = [endpoint for endpoint in candidates if endpoint["ejectedUntil"] <= now]
+            waitSeconds = 0
+            if(available):
+                # Ties go to the endpoint with fewer calls, so idle endpoints take turns.
+                endpoint = min(available, key=lambda e: (e["outstanding"], e["calls"]))
+            else:
+                # Every endpoint is out of rotation, so the call goes to the one that is back soonest.
+                endpoint = min(candidates, key=lambda e: e["ejectedUntil"])
+                waitSeconds = endpoint["ejectedUntil"] - now
+            endpoint["outstanding"] += 1
+            endpoint["calls"] += 1
+            return (endpoint, waitSeconds)
+
+    def release(self, endpoint, latency):
+        with self.lock:
+            endpoint["outstanding"] -= 1
+            endpoint["consecutiveFailures"] = 0
+            endpoint["latencies"].append(latency)
+
+    def eject(self, endpoint, e):
+        with self.lock:
+            endpoint["outstanding"] -= 1
+            endpoint["failures"] += 1
+            if(self.getErrorCode(e) in self.throttlingErrors):
+                endpoint["throttles"] += 1
+            endpoint["consecutiveFailures"] += 1
+            endpoint["ejections"] += 1
+            ejectSeconds = min(self.maxEjectSeconds, self.ejectSeconds * 2 ** (endpoint["consecutiveFailures"] - 1))
+            endpoint["ejectedUntil"] = time.monotonic() + ejectSeconds
+        print("Endpoint {} out of rotation for {} seconds: {}".format(endpoint["name"], ejectSeconds, e))
+
+    def call(self, fn, *args, eligible=None):
+        # fn is called with the target of the chosen endpoint followed by args. eligible, when given,
+        # takes an endpoint name and leaves out the endpoints that cannot serve this call.
+        skipped = []
+        if(eligible):
+            skipped = [endpoint for endpoint in self.endpoints if not eligible(endpoint["name"])]
+            if(len(skipped) == len(self.endpoints)):
+                raise Exception("No endpoint can serve this call.")
+
+        tried = list(skipped)
+        rounds = 1
+        while(True):
+            endpoint, waitSeconds = self.acquire(tried)
+            if(waitSeconds > 0):
+                time.sleep(waitSeconds)
+
+            startTime = time.time()
+            try:
+                result = fn(endpoint["target"], *args)
+            except Exception as e:
+                if(self.getErrorCode(e) in self.requestErrors):
+                    with self.lock:
+                        endpoint["outstanding"] -= 1
+                    raise
+                self.eject(endpoint, e)
+                tried.append(endpoint)
+                if(len(tried) == len(self.endpoints)):
+                    if(rounds >= self.maxRounds):
+                        raise
+                    tried = list(skipped)
+                    rounds += 1
+                continue
+
+            self.release(endpoint, time.time() - startTime)
+            return result
+
+    def report(self):
+        with self.lock:
+            elapsedSeconds = max(time.monotonic() - self.startTime, 1e-6)
+            for endpoint in self.endpoints:
+                latencies = endpoint["latencies"]
+                meanLatency = sum(latencies) / len(latencies) if latencies else 0
+                print("Endpoint {}: {} answered, {:.2f} per second, mean latency {:.3f} seconds, p99 {:.3f} seconds, "
+                      "{} failures ({} throttled), out of rotation {} times.".format(
+                          endpoint["name"], len(latencies), len(latencies) / elapsedSeconds, meanLatency,
+                          RequestHedger.getPercentile(latencies, 99), endpoint["failures"], endpoint["throttles"], endpoint["ejections"]))
@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import random
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from feedback.helpers import AwsHelper, S3Helper
+from feedback.tracing import tracer
+
+# Adds the entries of an output manifest to a Custom Labels dataset with update_dataset_entries.
+# The manifest is streamed from S3 and cut into chunks within the API limits, chunks are uploaded
+# concurrently, and finished chunks are recorded in a local checkpoint so an interrupted ingestion
+# continues with the first chunk that was not acknowledged.
+
+class DatasetIngestor:
+
+    # update_dataset_entries takes at most 5 MB of JSON lines per call.
+    maxChunkBytes = 5 * 1024 * 1024
+    throttlingErrors = ["ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException"]
+
+    def __init__(self, datasetArn, checkpointFile, concurrency=4, maxChunkEntries=1000, maxRetries=8, rekognition=None):
+        ''' Constructor. '''
+        self.datasetArn = datasetArn
+        self.checkpointFile = checkpointFile
+        self.concurrency = concurrency
+        self.maxChunkEntries = maxChunkEntries
+        self.maxRetries = maxRetries
+        self.lock = Lock()
+        self.checkpoint = None
+        if(rekognition):
+            self.rekognition = rekognition
+        else:
+            # arn:aws:rekognition:<region>:<account>:project/<project>/dataset/<type>/<timestamp>
+            self.rekognition = AwsHelper().getClient('rekognition', datasetArn.split(":")[3])
+
+    def getChunks(self, lines):
+        chunk = []
+        chunkBytes = 0
+        for line in lines:
+            if(not line):
+                continue
+            lineBytes = len(line.encode("utf-8")) + 1
+            if(lineBytes > self.maxChunkBytes):
+                raise Exception("Manifest entry of {} bytes is larger than the update_dataset_entries limit.".format(lineBytes))
+            if(chunk and (len(chunk) == self.maxChunkEntries or chunkBytes + lineBytes > self.maxChunkBytes)):
+                yield chunk
+                chunk = []
+                chunkBytes = 0
+            chunk.append(line)
+            chunkBytes += lineBytes
+        if(chunk):
+            yield chunk
+
+    def loadCheckpoint(self, manifestUri, manifestETag=None):
+        # Chunk boundaries only repeat with the same manifest content and chunk size, so anything else
+        # starts over. get-feedback.py writes every rerun to the same URI, so the ETag tells them apart.
+        checkpoint = { "datasetArn": self.datasetArn, "manifest": manifestUri, "manifestETag": manifestETag,
+                       "maxChunkEntries": self.maxChunkEntries, "completedBelow": 0, "completedChunks": [], "entries": 0 }
+        if(os.path.exists(self.checkpointFile)):
+            with open(self.checkpointFile, "r") as checkpointFile:
+                saved = json.load(checkpointFile)
+            if(all([saved.get(key) == checkpoint[key] for key in ["datasetArn", "manifest", "manifestETag", "maxChunkEntries"]])):
+                checkpoint = saved
+                print("Resuming ingestion after {} entries.".format(saved["entries"]))
+            else:
+                print("Checkpoint {} belongs to another ingestion and is replaced.".format(self.checkpointFile))
+        checkpoint["completedChunks"] = set(checkpoint["completedChunks"])
+        self.checkpoint = checkpoint
+
+    def saveCheckpoint(self):
+        # Written to a temporary file and renamed, so an interruption never leaves a partial checkpoint.
+        checkpoint = dict(self.checkpoint)
+        checkpoint["completedChunks"] = sorted(checkpoint["completedChunks"])
+        temporaryFile = "{}.tmp".format(self.checkpointFile)
+        with open(temporaryFile, "w") as checkpointFile:
+            json.dump(checkpoint, checkpointFile)
+        os.replace(temporaryFile, self.checkpointFile)
+
+    def isCompleted(self, chunkIndex):
+        return chunkIndex < self.checkpoint["completedBelow"] or chunkIndex in self.checkpoint["completedChunks"]
+
+    def markCompleted(self, chunkIndex, entries):
+        with self.lock:
+            completedChunks = self.checkpoint["completedChunks"]
+            completedChunks.add(chunkIndex)
+            # Chunks finish out of order. Everything below completedBelow is done, so only the
+            # few chunks past it have to be listed.
+            while(self.checkpoint["completedBelow"] in completedChunks):
+                completedChunks.remove(self.checkpoint["completedBelow"])
+                self.checkpoint["completedBelow"] += 1
+            self.checkpoint["entries"] += entries
+            self.saveCheckpoint()
+
+    def uploadChunk(self, chunkIndex, chunk):
+        from botocore.exceptions import ClientError
+
+        groundTruth = ("\n".join(chunk) + "\n").encode("utf-8")
+        attempt = 0
+        while(True):
+            try:
+                with tracer.span("update_dataset_entries", "rekognition", chunk=chunkIndex, entries=len(chunk)):
+                    self.rekognition.update_dataset_entries(DatasetArn=self.datasetArn, Changes={ "GroundTruth": groundTruth })
+                break
+            except ClientError as e:
+                if(not e.response["Error"]["Code"] in self.throttlingErrors or attempt >= self.maxRetries):
+                    raise
+                # Exponential backoff with full jitter.
+                time.sleep(random.uniform(0, min(30, 0.5 * (2 ** attempt))))
+                attempt += 1
+
+        self.markCompleted(chunkIndex, len(chunk))
+
+    def run(self, manifestUri, lines, manifestETag=None):
+        self.loadCheckpoint(manifestUri, manifestETag)
+
+        uploaded = 0
+        futures = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                for chunkIndex, chunk in enumerate(self.getChunks(lines)):
+                    if(self.isCompleted(chunkIndex)):
+                        continue
+
+                    # Only a few chunks are read ahead of the uploads, the manifest is never held in memory.
+                    if(len(futures) >= self.concurrency * 2):
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            future.result()
+
+                    futures.add(executor.submit(self.uploadChunk, chunkIndex, chunk))
+                    uploaded += len(chunk)
+
+                for future in futures:
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        print("Ingested {} entries into {} ({} in total).".format(uploaded, self.datasetArn, self.checkpoint["entries"]))
+        return self.checkpoint["entries"]
+
+def ingestManifest(manifestUri, datasetArn, checkpointFile=None, concurrency=4, maxChunkEntries=1000):
+    if(not checkpointFile):
+        checkpointFile = "ingest-{}.checkpoint.json".format(datasetArn.split(":project/")[-1].replace("/", "-"))
+    ingestor = DatasetIngestor(datasetArn, checkpointFile, concurrency, maxChunkEntries)
+    bucketName, fileName = S3Helper.parseBucketAndDocumentName(manifestUri)
+    awsRegion = S3Helper.getS3BucketRegion(bucketName)
+    manifestETag = AwsHelper().getClient('s3', awsRegion).head_object(Bucket=bucketName, Key=fileName)['ETag']
+    return ingestor.run(manifestUri, S3Helper.readLinesFromS3Uri(manifestUri, awsRegion), manifestETag)
+
+def main(args):
+    manifestUri = None
+    datasetArn = None
+    checkpointFile = None
+    concurrency = 4
+    maxChunkEntries = 1000
+
+    i = 0
+    while(i < len(args)):
+        if(args[i] == '--manifest'):
+            manifestUri = args[i+1]
+        elif(args[i] == '--dataset-arn'):
+            datasetArn = args[i+1]
+        elif(args[i] == '--checkpoint'):
+            checkpointFile = args[i+1]
+        elif(args[i] == '--concurrency'):
+            concurrency = int(args[i+1])
+        elif(args[i] == '--chunk-entries'):
+            maxChunkEntries = int(args[i+1])
+        i += 1
+
+    try:
+        if(not manifestUri or not datasetArn):
+            raise Exception("--manifest and --dataset-arn are required.")
+        ingestManifest(manifestUri, datasetArn, checkpointFile, concurrency, maxChunkEntries)
+    except Exception as e:
+        print("Something went wrong:\n====================================================\n{}".format(e))
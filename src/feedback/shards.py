@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import zlib
+import tempfile
+import subprocess
+from decimal import Decimal
+
+from feedback.helpers import AwsHelper, S3Helper
+from feedback.groups import GroupStore
+from feedback.start import CustomLabelsFeedback, JobScheduler, ImageAnalyzer, ProjectVersionManager
+
+# Sharded mode: a coordinator splits the image listing into shards under datasets/<runId>/shards/,
+# workers on any number of processes or hosts analyze one shard each and write its partial groups,
+# and a merge step combines the groups of all shards before the Ground Truth jobs are scheduled.
+
+groupTypes = ["labels", "bounding-boxes", "no-labels", "comparison"]
+
+class ShardRun:
+    # Locations of one sharded run in the output bucket.
+
+    def __init__(self, outputBucket, runId):
+        self.outputBucket = outputBucket
+        self.runId = runId
+        self.shardsPath = "datasets/{}/shards".format(runId)
+
+    @staticmethod
+    def fromUri(runUri):
+        outputBucket, runFileName = S3Helper.parseBucketAndDocumentName(runUri)
+        # datasets/<runId>/shards/run.json
+        return ShardRun(outputBucket, runFileName.split("/")[1])
+
+    def getRunFileName(self):
+        return "{}/run.json".format(self.shardsPath)
+
+    def getRunUri(self):
+        return "s3://{}/{}".format(self.outputBucket, self.getRunFileName())
+
+    def getImagesFileName(self, shardIndex):
+        return "{}/shard-{}/images.json".format(self.shardsPath, shardIndex)
+
+    def getGroupsFileName(self, shardIndex):
+        return "{}/shard-{}/groups.jsonl".format(self.shardsPath, shardIndex)
+
+    def readRun(self):
+        return json.loads(S3Helper.readFromS3(self.outputBucket, self.getRunFileName()))
+
+class ShardCoordinator:
+
+    def __init__(self, inputParameters, shardCount, partitionBy="hash"):
+        ''' Constructor. '''
+        self.inputParameters = inputParameters
+        self.shardCount = shardCount
+        self.partitionBy = partitionBy
+
+    def getShardIndex(self, imageName):
+        # By prefix, all images under the same top level folder go to one shard.
+        key = imageName
+        if(self.partitionBy == "prefix"):
+            relativeName = imageName[len(self.inputParameters["inputDocumentPath"]):].lstrip("/")
+            key = relativeName.split("/")[0]
+        return zlib.crc32(key.encode("utf-8")) % self.shardCount
+
+    def run(self):
+        if(self.inputParameters["streamingJobs"]):
+            raise Exception("streamingJobs cannot be used in sharded mode.")
+
+        jobScheduler = JobScheduler(self.inputParameters)
+        images = jobScheduler.startRun()
+
+        shards = [[] for i in range(self.shardCount)]
+        for imageName in images:
+            shards[self.getShardIndex(imageName)].append(imageName)
+
+        shardRun = ShardRun(self.inputParameters["outputBucket"], self.inputParameters["runId"])
+        for shardIndex in range(self.shardCount):
+            S3Helper.writeToS3(json.dumps(shards[shardIndex]), shardRun.outputBucket, shardRun.getImagesFileName(shardIndex))
+            print("Shard {}: {} images".format(shardIndex, len(shards[shardIndex])))
+
+        # The model is started once for all workers and stopped by the merge step.
+        projectVersionManager = jobScheduler.startProjectVersion(len(images))
+        startedProjectVersion = projectVersionManager.startedProjectVersion if projectVersionManager else False
+
+        run = { "shardCount": self.shardCount, "inputParameters": self.inputParameters, "startedProjectVersion": startedProjectVersion }
+        S3Helper.writeToS3(json.dumps(run), shardRun.outputBucket, shardRun.getRunFileName())
+
+        print("Sharded run: {}".format(shardRun.getRunUri()))
+        return shardRun.getRunUri()
+
+class ShardWorker:
+
+    def __init__(self, runUri, shardIndex):
+        ''' Constructor. '''
+        self.shardRun = ShardRun.fromUri(runUri)
+        self.shardIndex = shardIndex
+
+    def writeGroups(self, groupStore):
+        # One line per item, written to a local file first so the shard is never held in memory as text.
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".jsonl") as groupsFile:
+            for groupType in groupTypes:
+                groups = groupStore.getGroups(groupType)
+                for label in groups:
+                    for item in groups.items(label):
+                        groupsFile.write(json.dumps({ "groupType": groupType, "label": label, "item": item }, default=float) + "\n")
+            groupsFile.flush()
+            S3Helper.uploadToS3(groupsFile.name, self.shardRun.outputBucket, self.shardRun.getGroupsFileName(self.shardIndex))
+
+    def run(self):
+        run = self.shardRun.readRun()
+        inputParameters = run["inputParameters"]
+        images = json.loads(S3Helper.readFromS3(self.shardRun.outputBucket, self.shardRun.getImagesFileName(self.shardIndex)))
+        print("Analyzing shard {} with {} images...".format(self.shardIndex, len(images)))
+
+        imageAnalyzer = ImageAnalyzer(images, inputParameters)
+        try:
+            imageAnalyzer.run()
+            self.writeGroups(imageAnalyzer.groupStore)
+        finally:
+            imageAnalyzer.groupStore.close()
+
+        print("Shard {} written to s3://{}/{}".format(self.shardIndex, self.shardRun.outputBucket,
+                                                      self.shardRun.getGroupsFileName(self.shardIndex)))
+
+class ShardMerger:
+
+    def __init__(self, runUri):
+        ''' Constructor. '''
+        self.shardRun = ShardRun.fromUri(runUri)
+
+    def readGroups(self, groupStore, shardIndex, awsRegion):
+        s3 = AwsHelper().getClient('s3', awsRegion)
+        response = s3.get_object(Bucket=self.shardRun.outputBucket, Key=self.shardRun.getGroupsFileName(shardIndex))
+        for line in response['Body'].iter_lines():
+            if(not line):
+                continue
+            record = json.loads(line)
+            item = record["item"]
+            if("confidence" in item):
+                item["confidence"] = round(Decimal(item["confidence"]), 2)
+            # An image without labels is only listed once, whichever shard it came from.
+            key = item["imageUrl"] if record["groupType"] == "no-labels" else None
+            groupStore.getGroups(record["groupType"]).add(record["label"], item, key)
+
+    def run(self):
+        run = self.shardRun.readRun()
+        inputParameters = run["inputParameters"]
+
+        missingShards = []
+        for shardIndex in range(run["shardCount"]):
+            if(not S3Helper.objectExists(self.shardRun.outputBucket, self.shardRun.getGroupsFileName(shardIndex))):
+                missingShards.append(shardIndex)
+        if(missingShards):
+            raise Exception("Shards not finished yet: {}".format(", ".join([str(i) for i in missingShards])))
+
+        groupStore = GroupStore(inputParameters["groupStoreMemoryMB"]*1024*1024, inputParameters["groupStorePath"])
+        try:
+            try:
+                for shardIndex in range(run["shardCount"]):
+                    self.readGroups(groupStore, shardIndex, inputParameters["awsRegion"])
+                print("Merged {} shards.".format(run["shardCount"]))
+            finally:
+                if(run["startedProjectVersion"]):
+                    projectVersionManager = ProjectVersionManager(inputParameters["projectVersionArn"], inputParameters["awsRegion"],
+                                                                  inputParameters["projectVersionPollSeconds"])
+                    projectVersionManager.startedProjectVersion = True
+                    projectVersionManager.stop()
+
+            jobScheduler = JobScheduler(inputParameters)
+            return jobScheduler.scheduleJobs(groupStore, groupStore.getGroups("labels"), groupStore.getGroups("bounding-boxes"),
+                                             groupStore.getGroups("no-labels"))
+        finally:
+            groupStore.close()
+
+def runLocalWorkers(runUri, shardCount):
+    # Runs every shard in its own local process, as separate hosts would.
+    srcPath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    workers = []
+    for shardIndex in range(shardCount):
+        workers.append(subprocess.Popen([sys.executable, "-m", "feedback", "shard-worker", "--run", runUri, "--shard", str(shardIndex)],
+                                        cwd=srcPath))
+
+    failedShards = [str(i) for i, worker in enumerate(workers) if worker.wait() != 0]
+    if(failedShards):
+        raise Exception("Shard workers failed: {}".format(", ".join(failedShards)))
+
+def main(args):
+    command = args[0]
+    runUri = None
+    shardIndex = None
+    shardCount = 2
+    partitionBy = "hash"
+    localWorkers = False
+
+    i = 1
+    while(i < len(args)):
+        if(args[i] == '--run'):
+            runUri = args[i+1]
+        elif(args[i] == '--shard'):
+            shardIndex = int(args[i+1])
+        elif(args[i] == '--shards'):
+            shardCount = int(args[i+1])
+        elif(args[i] == '--partition'):
+            partitionBy = args[i+1]
+        elif(args[i] == '--local-workers'):
+            localWorkers = True
+        i += 1
+
+    try:
+        if(command == "shard"):
+            if(not partitionBy in ["hash", "prefix"]):
+                raise Exception("--partition must be either hash or prefix.")
+
+            clf = CustomLabelsFeedback()
+            inputParameters = clf.validateInput(clf.getInput(args))
+            runUri = ShardCoordinator(inputParameters, shardCount, partitionBy).run()
+
+            if(localWorkers):
+                runLocalWorkers(runUri, shardCount)
+                return ShardMerger(runUri).run()
+
+            print("Start one worker per shard, on this or other hosts:")
+            print("python3 -m feedback shard-worker --run {} --shard <0-{}>".format(runUri, shardCount-1))
+            print("Then merge the shards and start the Ground Truth jobs:")
+            print("python3 -m feedback shard-merge --run {}".format(runUri))
+            return runUri
+        elif(command == "shard-worker"):
+            ShardWorker(runUri, shardIndex).run()
+        elif(command == "shard-merge"):
+            return ShardMerger(runUri).run()
+    except Exception as e:
+        print("Something went wrong:\n====================================================\n{}".format(e))
+        if(command == "shard-worker"):
+            sys.exit(1)
@@ -0,0 +1,1927 @@
+import os
+import uuid
+from decimal import Decimal
+import json
+import io
+import math
+import time
+import heapq
+import random
+import hashlib
+import tempfile
+import multiprocessing
+from threading import Thread
+from queue import Queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from feedback.helpers import AwsHelper, S3Helper, RateLimiter, RequestHedger, ParallelS3Lister, EndpointBalancer
+from feedback.groups import GroupStore
+from feedback.video import VideoFrameSampler
+from feedback.tuning import ReviewTuner
+from feedback.tracing import tracer
+
+class BufferPool:
+    # Fixed set of byte buffers shared by the image threads, so single-fetch mode holds
+    # at most one downloaded image per buffer no matter how many images are analyzed.
+
+    def __init__(self, size):
+        self.buffers = Queue()
+        for i in range(size):
+            self.buffers.put(bytearray())
+
+    def acquire(self):
+        return self.buffers.get()
+
+    def release(self, buffer):
+        self.buffers.put(buffer)
+
+def downscaleImage(imageBytes, maxImageEdge, jpegQuality):
+    # Runs in a worker process of ImageAnalyzer's preprocess pool, so it has to stay a module level function.
+    from PIL import Image
+
+    im = Image.open(io.BytesIO(imageBytes))
+    imageWidth, imageHeight = im.size
+
+    if(max(imageWidth, imageHeight) <= maxImageEdge):
+        return (imageWidth, imageHeight, None)
+
+    # Let the JPEG decoder skip detail we are going to throw away anyway.
+    im.draft('RGB', (maxImageEdge, maxImageEdge))
+    im = im.convert('RGB')
+    im.thumbnail((maxImageEdge, maxImageEdge), Image.LANCZOS)
+
+    output = io.BytesIO()
+    im.save(output, format='JPEG', quality=jpegQuality)
+    return (imageWidth, imageHeight, output.getvalue())
+
+def getImageLocation(imageName, inputParameters):
+    # Frames sampled from videos are listed as s3:// URIs in the output bucket, images as keys of the images bucket.
+    if(imageName.startswith("s3://")):
+        return S3Helper.parseBucketAndDocumentName(imageName)
+    return (inputParameters["bucketName"], imageName)
+
+def getArnRegion(arn):
+    # arn:aws:rekognition:<region>:<account>:project/<project>/version/<version>/<timestamp>
+    return arn.split(":")[3]
+
+def getTileOffsets(length, tileSize, tileOverlap):
+    if(length <= tileSize):
+        return [0]
+
+    offsets = list(range(0, length - tileSize, tileSize - tileOverlap))
+    offsets.append(length - tileSize)
+    return offsets
+
+def cropTiles(imageBytes, tileSize, tileOverlap, jpegQuality):
+    # Runs in a worker process of ImageAnalyzer's preprocess pool, so it has to stay a module level function.
+    from PIL import Image
+
+    im = Image.open(io.BytesIO(imageBytes))
+    imageWidth, imageHeight = im.size
+
+    tiles = []
+    if(max(imageWidth, imageHeight) <= tileSize):
+        return (imageWidth, imageHeight, tiles)
+
+    im = im.convert('RGB')
+    for top in getTileOffsets(imageHeight, tileSize, tileOverlap):
+        for left in getTileOffsets(imageWidth, tileSize, tileOverlap):
+            right = min(left + tileSize, imageWidth)
+            bottom = min(top + tileSize, imageHeight)
+
+            output = io.BytesIO()
+            im.crop((left, top, right, bottom)).save(output, format='JPEG', quality=jpegQuality)
+            tiles.append((left, top, right - left, bottom - top, output.getvalue()))
+
+    return (imageWidth, imageHeight, tiles)
+
+def nonMaxSuppression(boxes, scores, iouThreshold):
+    # numpy is only needed when tiling is turned on.
+    import numpy as np
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    scores = np.asarray(scores, dtype=np.float64)
+
+    x1 = boxes[:, 0]
+    y1 = boxes[:, 1]
+    x2 = x1 + boxes[:, 2]
+    y2 = y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+
+    keep = []
+    order = np.argsort(-scores, kind='stable')
+    while(order.size > 0):
+        best = order[0]
+        keep.append(int(best))
+        rest = order[1:]
+
+        intersectionWidth = np.clip(np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]), 0, None)
+        intersectionHeight = np.clip(np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]), 0, None)
+        intersection = intersectionWidth * intersectionHeight
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-12)
+
+        order = rest[iou <= iouThreshold]
+
+    return keep
+
+def mergeTileLabels(customLabels, iouThreshold):
+    # Same shape as the CustomLabels of a detect_custom_labels response, with duplicates
+    # from overlapping tiles removed per label.
+    mergedLabels = []
+    imageLabels = {}
+    boxLabels = {}
+
+    for customLabel in customLabels:
+        if("Geometry" in customLabel):
+            boxLabels.setdefault(customLabel["Name"], []).append(customLabel)
+        elif(not customLabel["Name"] in imageLabels or imageLabels[customLabel["Name"]]["Confidence"] < customLabel["Confidence"]):
+            imageLabels[customLabel["Name"]] = customLabel
+
+    mergedLabels.extend(imageLabels.values())
+
+    for labelName in boxLabels:
+        candidates = boxLabels[labelName]
+        boxes = []
+        scores = []
+        for candidate in candidates:
+            bb = candidate["Geometry"]["BoundingBox"]
+            boxes.append((bb["Left"], bb["Top"], bb["Width"], bb["Height"]))
+            scores.append(candidate["Confidence"])
+
+        for keepIndex in nonMaxSuppression(boxes, scores, iouThreshold):
+            mergedLabels.append(candidates[keepIndex])
+
+    return mergedLabels
+
+def getBoxIou(a, b):
+    intersectionWidth = max(0, min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0]))
+    intersectionHeight = max(0, min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1]))
+    intersection = intersectionWidth * intersectionHeight
+    return intersection / max(a[2] * a[3] + b[2] * b[3] - intersection, 1e-12)
+
+def getLabelAgreement(labelsA, labelsB, iouThreshold):
+    # Jaccard index of two models' answers, where an answer is an image-level label or a box of a label.
+    # Boxes of the same label are matched one to one, best overlap first.
+    imageLabelsA = set([label["Name"] for label in labelsA if not label["Instances"]])
+    imageLabelsB = set([label["Name"] for label in labelsB if not label["Instances"]])
+    matches = len(imageLabelsA & imageLabelsB)
+    answers = len(imageLabelsA) + len(imageLabelsB)
+
+    boxesA = {}
+    boxesB = {}
+    for labels, boxes in [(labelsA, boxesA), (labelsB, boxesB)]:
+        for label in labels:
+            for instance in label["Instances"]:
+                bb = instance["BoundingBox"]
+                boxes.setdefault(label["Name"], []).append((bb["Left"], bb["Top"], bb["Width"], bb["Height"]))
+                answers += 1
+
+    for labelName in boxesA:
+        if(not labelName in boxesB):
+            continue
+        pairs = []
+        for i, boxA in enumerate(boxesA[labelName]):
+            for j, boxB in enumerate(boxesB[labelName]):
+                iou = getBoxIou(boxA, boxB)
+                if(iou >= iouThreshold):
+                    pairs.append((iou, i, j))
+        matchedA = set()
+        matchedB = set()
+        for iou, i, j in sorted(pairs, reverse=True):
+            if(not i in matchedA and not j in matchedB):
+                matchedA.add(i)
+                matchedB.add(j)
+        matches += len(matchedA)
+
+    if(answers == 0):
+        return 1.0
+    return matches / (answers - matches)
+
+def getDisagreement(modelLabels, iouThreshold):
+    # 0 when every model gives the same answers, 1 when two of them share none.
+    agreement = 1.0
+    for i in range(len(modelLabels)):
+        for j in range(i + 1, len(modelLabels)):
+            agreement = min(agreement, getLabelAgreement(modelLabels[i], modelLabels[j], iouThreshold))
+    return round(1.0 - agreement, 3)
+
+class ImageProcessor(Thread):
+
+    # Largest image Rekognition accepts as Bytes.
+    maxImageBytes = 4 * 1024 * 1024
+
+    # Errors caused by the image rather than the project version, which another project version would repeat.
+    imageErrors = ["InvalidImageFormatException", "ImageTooLargeException", "InvalidS3ObjectException", "InvalidParameterException"]
+
+    def __init__(self, imageName, inputParameters, dataObject, preprocessPool=None, bufferPool=None, inferencePool=None, hedger=None,
+                 modelPool=None, endpointBalancer=None):
+        ''' Constructor. '''
+        Thread.__init__(self)
+        self.imageName = imageName
+        self.inputParameters = inputParameters
+        self.dataObject = dataObject
+        self.preprocessPool = preprocessPool
+        self.bufferPool = bufferPool
+        self.inferencePool = inferencePool
+        self.hedger = hedger
+        self.modelPool = modelPool
+        self.endpointBalancer = endpointBalancer
+        self.tiles = []
+        
+    def getImageObject(self):
+        s3 = AwsHelper().getClient('s3', self.inputParameters["awsRegion"])
+        bucketName, imageKey = getImageLocation(self.imageName, self.inputParameters)
+        return s3.get_object(Bucket=bucketName, Key=imageKey)
+
+    def getImageSize(self):
+        from PIL import Image
+
+        with tracer.span("size probe", "image", image=self.imageName):
+            iresponse = self.getImageObject()
+            file_stream = iresponse['Body']
+            im = Image.open(file_stream)
+            return (im.width, im.height)
+
+    def getImageBytes(self):
+        with tracer.span("fetch image", "image", image=self.imageName):
+            iresponse = self.getImageObject()
+            return iresponse['Body'].read()
+
+    def fetchImage(self, buffer):
+        with tracer.span("fetch image", "image", image=self.imageName):
+            iresponse = self.getImageObject()
+
+            # Overwrite the buffer in place so its allocation is reused from image to image.
+            offset = 0
+            for chunk in iresponse['Body'].iter_chunks(1024 * 1024):
+                buffer[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+            del buffer[offset:]
+
+    def getImageSizeFromBuffer(self, buffer):
+        # Only feed the parser until the header is identified instead of copying the whole image.
+        from PIL import ImageFile
+
+        parser = ImageFile.Parser()
+        view = memoryview(buffer)
+        offset = 0
+        while(parser.image is None and offset < len(view)):
+            parser.feed(bytes(view[offset:offset + 65536]))
+            offset += 65536
+        view.release()
+
+        if(parser.image is None):
+            raise Exception("Unable to read image size for {}".format(self.imageName))
+
+        return parser.image.size
+
+    def getInferenceImage(self, buffer=None):
+        # imageWidth/imageHeight always describe the original image. Rekognition returns normalized
+        # geometry, so boxes computed in processLabel stay in original image coordinates even when
+        # the model only saw a downscaled copy.
+        imageBytes = None
+        if(buffer is not None):
+            self.fetchImage(buffer)
+
+        if(self.preprocessPool and self.inputParameters["tileSize"]):
+            source = buffer if buffer is not None else self.getImageBytes()
+            with tracer.span("crop tiles", "image", image=self.imageName):
+                future = self.preprocessPool.submit(cropTiles, source, self.inputParameters["tileSize"],
+                                                    self.inputParameters["tileOverlap"], self.inputParameters["jpegQuality"])
+                imageWidth, imageHeight, self.tiles = future.result()
+        elif(self.preprocessPool):
+            source = buffer if buffer is not None else self.getImageBytes()
+            with tracer.span("downscale", "image", image=self.imageName):
+                future = self.preprocessPool.submit(downscaleImage, source,
+                                                    self.inputParameters["maxImageEdge"], self.inputParameters["jpegQuality"])
+                imageWidth, imageHeight, imageBytes = future.result()
+        elif(buffer is not None):
+            with tracer.span("size probe", "image", image=self.imageName):
+                imageWidth, imageHeight = self.getImageSizeFromBuffer(buffer)
+        else:
+            imageWidth, imageHeight = self.getImageSize()
+
+        # Single-fetch mode sends the downloaded object itself unless it is over the Bytes limit. A hedged
+        # call that lost is still sending its image when run() hands the buffer to the next image, so
+        # with hedging the model gets a copy.
+        if(not imageBytes and buffer is not None and len(buffer) <= self.maxImageBytes):
+            imageBytes = bytes(buffer) if self.hedger else buffer
+
+        self.dataObject["imageWidth"] = imageWidth
+        self.dataObject["imageHeight"] = imageHeight
+
+        if(imageBytes):
+            return { 'Bytes': imageBytes }
+
+        bucketName, imageKey = getImageLocation(self.imageName, self.inputParameters)
+        return {
+            'S3Object': {
+                'Bucket': bucketName,
+                'Name': imageKey,
+            }
+        }
+
+    def transformLabels(self, labels):
+        fixedLabels = {}
+        for ecl in labels["CustomLabels"]:
+            lname = ecl["Name"]
+            lconfidence = ecl["Confidence"]
+
+            if(lname in fixedLabels):
+                fixedLabel = fixedLabels[lname]
+            else:
+                fixedLabel = {}
+                fixedLabel["Instances"] = []
+                fixedLabels[lname] = fixedLabel
+                fixedLabel["Name"] = lname
+
+            if("Geometry" in ecl):
+                fixedLabel["Instances"].append({"BoundingBox": ecl["Geometry"]["BoundingBox"], "Confidence": lconfidence})
+            else:
+                fixedLabel["Confidence"] = lconfidence
+
+        clabels = []
+        for efixedLabel in fixedLabels:
+            fl = fixedLabels[efixedLabel]
+            if(not "Confidence" in fl):
+                fl["Confidence"] = -1
+            clabels.append(fl)
+        return clabels
+
+    def detectLabels(self, rekognition, image, projectVersionArn=None):
+        if(self.hedger):
+            return self.hedger.call(self.requestLabels, rekognition, image, projectVersionArn)
+        return self.requestLabels(rekognition, image, projectVersionArn)
+
+    def requestLabels(self, rekognition, image, projectVersionArn=None):
+        if(self.endpointBalancer):
+            # Images passed as S3 objects can only be read by project versions in the region of the bucket.
+            eligible = None
+            if("S3Object" in image):
+                eligible = lambda projectVersionArn: getArnRegion(projectVersionArn) == self.inputParameters["awsRegion"]
+            return self.endpointBalancer.call(self.requestEndpointLabels, image, eligible=eligible)
+        return self.requestEndpointLabels((projectVersionArn or self.inputParameters["projectVersionArn"], rekognition), image)
+
+    def requestEndpointLabels(self, endpoint, image):
+        projectVersionArn, rekognition = endpoint
+        with tracer.span("detect_custom_labels", "inference", image=self.imageName, model=projectVersionArn):
+            return rekognition.detect_custom_labels(
+                Image=image,
+                ProjectVersionArn= projectVersionArn,
+                #MinConfidence = self.inputParameters["minimumConfidence"],
+                #MaxResults=self.inputParameters["maxLabels"]
+            )
+
+    def detectTiledLabels(self, rekognition, projectVersionArn=None):
+        imageWidth = self.dataObject["imageWidth"]
+        imageHeight = self.dataObject["imageHeight"]
+
+        futures = []
+        for tile in self.tiles:
+            futures.append(self.inferencePool.submit(self.detectLabels, rekognition, { 'Bytes': tile[4] }, projectVersionArn))
+
+        customLabels = []
+        for (left, top, width, height, tileBytes), future in zip(self.tiles, futures):
+            for customLabel in future.result()["CustomLabels"]:
+                if("Geometry" in customLabel):
+                    # Map tile relative geometry back to the full image.
+                    bb = customLabel["Geometry"]["BoundingBox"]
+                    customLabel["Geometry"] = {
+                        "BoundingBox": {
+                            "Left": (left + bb["Left"] * width) / imageWidth,
+                            "Top": (top + bb["Top"] * height) / imageHeight,
+                            "Width": bb["Width"] * width / imageWidth,
+                            "Height": bb["Height"] * height / imageHeight
+                        }
+                    }
+                customLabels.append(customLabel)
+
+        return { "CustomLabels": mergeTileLabels(customLabels, self.inputParameters["tileIouThreshold"]) }
+
+    def detectModelLabels(self, rekognition, image, projectVersionArn=None):
+        if(self.tiles):
+            return self.detectTiledLabels(rekognition, projectVersionArn)
+        return self.detectLabels(rekognition, image, projectVersionArn)
+
+    def compareModels(self, rekognition, image):
+        # The image was fetched and sized once. The other models get it on the model pool while
+        # this thread asks the first one, whose labels are the ones sent for review.
+        projectVersionArns = self.inputParameters["projectVersionArns"]
+        futures = [self.modelPool.submit(self.detectModelLabels, rekognition, image, projectVersionArn)
+                   for projectVersionArn in projectVersionArns[1:]]
+        try:
+            labels = self.detectModelLabels(rekognition, image, projectVersionArns[0])
+        finally:
+            # The other calls may still be sending the image buffer, which run() hands back to the pool.
+            wait(futures)
+
+        modelLabels = [self.transformLabels(labels)] + [self.transformLabels(future.result()) for future in futures]
+        self.dataObject["modelLabels"] = dict(zip(projectVersionArns, modelLabels))
+        self.dataObject["disagreement"] = getDisagreement(modelLabels, self.inputParameters["comparisonIouThreshold"])
+        return labels
+
+    def run(self):
+        try:
+            print("Analyzing image: {}".format(self.imageName))
+
+            buffer = None
+            if(self.bufferPool):
+                buffer = self.bufferPool.acquire()
+
+            try:
+                image = self.getInferenceImage(buffer)
+
+                rekognition = AwsHelper().getClient('rekognition', self.inputParameters["awsRegion"])
+                inferenceStart = time.time()
+                if(self.modelPool):
+                    labels = self.compareModels(rekognition, image)
+                else:
+                    labels = self.detectModelLabels(rekognition, image)
+                self.dataObject["inferenceSeconds"] = time.time() - inferenceStart
+            finally:
+                if(buffer is not None):
+                    self.bufferPool.release(buffer)
+
+            self.dataObject['labels'] = self.transformLabels(labels)
+        except Exception as e:
+            print("Failed to process labels for {}. Error: {}.".format(self.imageName, e))
+            self.dataObject['labels'] = { 'Error' : "{}".format(e)}
+
+class ImageAnalyzer:
+
+    def __init__(self, images, inputParameters, streamingPublisher=None):
+        ''' Constructor. '''
+        self.images = images
+        self.inputParameters = inputParameters
+        self.streamingPublisher = streamingPublisher
+        # Per instance, so several runs in one process (daemon mode) do not share groups.
+        # Groups are kept within a memory budget and spill to a local file for large datasets.
+        self.groupStore = GroupStore(self.inputParameters["groupStoreMemoryMB"]*1024*1024, self.inputParameters["groupStorePath"])
+        self.labelGroups = self.groupStore.getGroups("labels")
+        self.labelBoundingBoxGroups = self.groupStore.getGroups("bounding-boxes")
+        self.noLabelsGroup = self.groupStore.getGroups("no-labels")
+        self.comparisonGroup = self.groupStore.getGroups("comparison")
+        self.inferenceCount = 0
+        self.inferenceSeconds = 0
+        self.agreedCount = 0
+            
+    def processLabel(self, imageName, imageUrl, imageWidth, imageHeight, label):
+        instances = label['Instances']
+        transformedInstances = []
+        instanceConfidences = []
+        for einstance in instances:        
+             transformedInstances.append((
+                                round(einstance["BoundingBox"]["Left"]*imageWidth,2),
+                                round(einstance["BoundingBox"]["Top"]*imageHeight,2),                            
+                                round(einstance["BoundingBox"]["Width"]*imageWidth,2),
+                                round(einstance["BoundingBox"]["Height"]*imageHeight,2))
+            )
+             instanceConfidences.append(round(einstance.get("Confidence", -1), 2))
+
+        imageMetadata = {}
+        imageMetadata["imageLabelId"] = "{}-{}".format(imageUrl, label['Name'])
+        imageMetadata["imageUrl"] = imageUrl
+        imageMetadata["imageWidth"] = imageWidth
+        imageMetadata["imageHeight"] = imageHeight
+        imageMetadata["labelName"] = label['Name']
+        imageMetadata["confidence"] = round(Decimal(label['Confidence']), 2)
+        imageMetadata["instances"] = transformedInstances
+        imageMetadata["instanceConfidences"] = instanceConfidences
+
+        return imageMetadata
+            
+    def processLabels(self, dataObject):
+
+        if("inferenceSeconds" in dataObject):
+            self.inferenceCount += 1
+            self.inferenceSeconds += dataObject["inferenceSeconds"]
+
+        imageWidth = dataObject["imageWidth"]
+        imageHeight = dataObject["imageHeight"]
+        imageName = dataObject["imageName"]
+        imageUrl = "s3://{}/{}".format(*getImageLocation(imageName, self.inputParameters))
+        detectedLabels = dataObject["labels"]
+
+        if("modelLabels" in dataObject):
+            comparison = { "source-ref": imageUrl, "disagreement": dataObject["disagreement"], "models": {} }
+            for projectVersionArn, labels in dataObject["modelLabels"].items():
+                comparison["models"][projectVersionArn] = [{ "label": label["Name"], "confidence": label["Confidence"],
+                                                             "boxes": [einstance["BoundingBox"] for einstance in label["Instances"]] }
+                                                           for label in labels]
+            self.comparisonGroup.add("", comparison, imageUrl)
+
+        # Images the models agree on are not sent for review, but images without labels are still
+        # recorded, so they end up in the output manifest.
+        agreed = "disagreement" in dataObject and dataObject["disagreement"] <= self.inputParameters["disagreementThreshold"]
+        if(agreed):
+            self.agreedCount += 1
+
+        if(not detectedLabels):
+            self.noLabelsGroup.add("", {"imageUrl": imageUrl, "imageWidth": imageWidth, "imageHeight": imageHeight}, imageUrl)
+        elif(not agreed):
+            for label in detectedLabels:
+                metadata = self.processLabel(imageName, imageUrl, imageWidth, imageHeight, label)
+                if("disagreement" in dataObject):
+                    metadata["disagreement"] = dataObject["disagreement"]
+
+                # Groups are kept in streaming mode too, for the predictions manifest.
+                if(self.streamingPublisher):
+                    self.streamingPublisher.add("bounding-boxes" if label['Instances'] else "labels", label["Name"], metadata)
+
+                if(label['Instances']):            
+                    self.labelBoundingBoxGroups.add(label["Name"], metadata)
+                else:            
+                    self.labelGroups.add(label["Name"], metadata)
+  
+    def processBatch(self, threads):
+        # The batch span ends with the slowest image, which shows the barrier between batches.
+        with tracer.span("batch", "analysis", images=len(threads)):
+            for thr in threads:
+                thr.start()
+
+            for thr in threads:
+                thr.join()
+
+    def run(self):
+        
+        threads = []
+        output = []
+        
+        totalImages = len(self.images)
+
+        # Decoding and re-encoding is CPU bound, so it runs in processes rather than in the image threads.
+        # Workers are spawned, as forking a process that runs other threads can copy held locks.
+        preprocessPool = None
+        if(self.inputParameters["maxImageEdge"] or self.inputParameters["tileSize"]):
+            preprocessPool = ProcessPoolExecutor(max_workers=self.inputParameters["preprocessWorkers"],
+                                                 mp_context=multiprocessing.get_context("spawn"))
+
+        # Tiles of all images in a batch share one set of inference workers.
+        inferencePool = None
+        if(self.inputParameters["tileSize"]):
+            inferencePool = ThreadPoolExecutor(max_workers=self.inputParameters["concurrencyControl"])
+
+        # One buffer per image thread in a batch.
+        bufferPool = None
+        if(self.inputParameters["imageSource"] == "bytes"):
+            bufferPool = BufferPool(self.inputParameters["concurrencyControl"])
+
+        # Room for a primary and a hedged call from every thread that calls the model.
+        hedger = None
+        if(self.inputParameters["hedgePercentile"]):
+            hedger = RequestHedger(self.inputParameters["hedgePercentile"], self.inputParameters["hedgeMaxExtraLoad"],
+                                   self.inputParameters["concurrencyControl"] * 2 * max(1, len(self.inputParameters["projectVersionArns"])))
+
+        # Every image thread calls the other models of a comparison at the same time as the first one.
+        modelPool = None
+        if(self.inputParameters["projectVersionArns"]):
+            modelPool = ThreadPoolExecutor(max_workers=self.inputParameters["concurrencyControl"] * (len(self.inputParameters["projectVersionArns"]) - 1))
+
+        # Each call goes to the project version of the pool with the fewest calls in flight.
+        endpointBalancer = None
+        if(self.inputParameters["projectVersionPool"]):
+            endpointBalancer = EndpointBalancer([(projectVersionArn, (projectVersionArn, AwsHelper().getClient('rekognition', getArnRegion(projectVersionArn))))
+                                                 for projectVersionArn in self.inputParameters["projectVersionPool"]],
+                                                self.inputParameters["endpointEjectSeconds"], ImageProcessor.imageErrors)
+        
+        try:
+            i = 1
+            for imageName in self.images:
+                
+                ado = { 'imageName' : imageName }
+                
+                output.append(ado)
+                ip = ImageProcessor(imageName, self.inputParameters, ado, preprocessPool, bufferPool, inferencePool, hedger, modelPool,
+                                    endpointBalancer)
+                threads.append(ip)
+                
+                if(i % self.inputParameters["concurrencyControl"] == 0):
+                    self.processBatch(threads)
+                    with tracer.span("process labels", "analysis", images=len(output)):
+                        for dataObject in output:
+                            self.processLabels(dataObject)
+                    print("Analyzed images: {}/{}".format(i, totalImages))
+                    output.clear()
+                    threads.clear()
+
+                i = i + 1
+                
+            if(threads):
+                self.processBatch(threads)
+                with tracer.span("process labels", "analysis", images=len(output)):
+                    for dataObject in output:
+                        self.processLabels(dataObject)
+                print("Analyzed images: {}/{}".format(i-1, totalImages))
+                output.clear()
+                threads.clear()
+        finally:
+            if(preprocessPool):
+                preprocessPool.shutdown()
+            if(inferencePool):
+                inferencePool.shutdown()
+            if(modelPool):
+                modelPool.shutdown()
+            if(hedger):
+                hedger.shutdown()
+                hedger.report()
+            if(endpointBalancer):
+                endpointBalancer.report()
+
+        if(self.inferenceCount):
+            # Feed this back as imageLatencySeconds to plan capacity for the next run.
+            print("Measured per-image latency: {:.3f} seconds".format(self.inferenceSeconds / self.inferenceCount))
+
+        if(self.inputParameters["projectVersionArns"]):
+            print("Models agreed on {} of {} images, which are not sent for review.".format(self.agreedCount, totalImages))
+        
+        return (self.labelGroups, self.labelBoundingBoxGroups, self.noLabelsGroup)
+        
+class CapacityPlanner:
+
+    def __init__(self, inputParameters):
+        self.inputParameters = inputParameters
+
+    def plan(self, imageCount):
+        targetSeconds = self.inputParameters["targetRunSeconds"]
+        imageLatency = self.inputParameters["imageLatencySeconds"]
+
+        # Images per second needed to finish in time, and how many requests have to be in flight for that.
+        requiredRate = imageCount / targetSeconds
+        concurrency = max(1, math.ceil(requiredRate * imageLatency))
+        inferenceUnits = max(1, math.ceil(requiredRate / self.inputParameters["inferenceUnitImagesPerSecond"]))
+
+        if(inferenceUnits > self.inputParameters["maxInferenceUnits"]):
+            print("Target of {} seconds needs {} inference units, capped at {}.".format(targetSeconds, inferenceUnits, self.inputParameters["maxInferenceUnits"]))
+            inferenceUnits = self.inputParameters["maxInferenceUnits"]
+
+        achievableRate = min(concurrency / imageLatency, inferenceUnits * self.inputParameters["inferenceUnitImagesPerSecond"])
+        expectedSeconds = imageCount / achievableRate if imageCount else 0
+
+        print("Capacity plan: {} images, {} inference units, concurrency {}, expected {:.0f} seconds.".format(
+            imageCount, inferenceUnits, concurrency, expectedSeconds))
+
+        return { "imageCount": imageCount, "inferenceUnits": inferenceUnits,
+                 "concurrency": concurrency, "expectedSeconds": expectedSeconds }
+
+class ProjectVersionManager:
+    # Starts the project version for a run and stops it again, unless it was already running before.
+
+    def __init__(self, projectVersionArn, awsRegion, pollSeconds=30, rekognition=None):
+        self.projectVersionArn = projectVersionArn
+        self.pollSeconds = pollSeconds
+        self.startedProjectVersion = False
+        if(rekognition):
+            self.rekognition = rekognition
+        else:
+            self.rekognition = AwsHelper().getClient('rekognition', awsRegion)
+
+    def describe(self):
+        # arn:aws:rekognition:<region>:<account>:project/<project>/version/<version>/<timestamp>
+        resource = self.projectVersionArn.split(":", 5)[5].split("/")
+        projectName = resource[1]
+        versionName = resource[3]
+
+        projects = self.rekognition.describe_projects(ProjectNames=[projectName])
+        projectArn = projects["ProjectDescriptions"][0]["ProjectArn"]
+
+        response = self.rekognition.describe_project_versions(ProjectArn=projectArn, VersionNames=[versionName])
+        return response["ProjectVersionDescriptions"][0]
+
+    def waitForStatus(self, transitionStatus):
+        description = self.describe()
+        while(description["Status"] == transitionStatus):
+            time.sleep(self.pollSeconds)
+            description = self.describe()
+        print("Project version status: {}".format(description["Status"]))
+        return description
+
+    def start(self, inferenceUnits):
+        description = self.describe()
+
+        if(description["Status"] == "STARTING"):
+            description = self.waitForStatus("STARTING")
+        elif(description["Status"] != "RUNNING"):
+            print("Starting project version with {} inference units...".format(inferenceUnits))
+            self.rekognition.start_project_version(ProjectVersionArn=self.projectVersionArn, MinInferenceUnits=inferenceUnits)
+            self.startedProjectVersion = True
+            description = self.waitForStatus("STARTING")
+
+        if(description["Status"] != "RUNNING"):
+            raise Exception("Project version is {}: {}".format(description["Status"], description.get("StatusMessage", "")))
+
+        if(description.get("MinInferenceUnits", inferenceUnits) < inferenceUnits):
+            print("Project version is running with {} inference units, {} are planned.".format(description["MinInferenceUnits"], inferenceUnits))
+
+    def stop(self):
+        if(not self.startedProjectVersion):
+            return
+
+        print("Stopping project version...")
+        self.rekognition.stop_project_version(ProjectVersionArn=self.projectVersionArn)
+        self.waitForStatus("STOPPING")
+        self.startedProjectVersion = False
+
+class ReviewSampler:
+    # Picks at most reviewBudget Ground Truth tasks for human review. A label verification task shows
+    # up to maxImagesPerLabelVerificationBatch images of one label, and a bounding box task shows one
+    # image with every label of its job, so labels are sampled in batches and bounding box jobs by image.
+    # The budget is split across labels and jobs, favoring rare and low confidence ones, and each is
+    # sampled in one pass with a weighted reservoir, so only the selected items are held in memory.
+
+    def __init__(self, groupStore, reviewBudget, imageBatchSize, maxLabelsPerJob, seed=None):
+        self.groupStore = groupStore
+        self.reviewBudget = reviewBudget
+        self.imageBatchSize = imageBatchSize
+        self.maxLabelsPerJob = maxLabelsPerJob
+        self.random = random.Random(seed)
+        self.imageSalt = str(self.random.getrandbits(64)).encode()
+
+    @staticmethod
+    def getItemConfidence(item):
+        # Labels found with boxes have no label confidence (-1), so their most confident box is used.
+        if(item.get("instanceConfidences")):
+            return max(item["instanceConfidences"])
+        return float(item["confidence"])
+
+    @staticmethod
+    def getItemWeight(confidence):
+        # 1 for a fully confident prediction, up to 2 for the least confident.
+        return 2 - float(confidence)/100
+
+    def getImageRandom(self, imageUrl):
+        # The same uniform number for every item of an image, without keeping one per image.
+        digest = hashlib.blake2b(imageUrl.encode(), key=self.imageSalt, digest_size=8).digest()
+        return (int.from_bytes(digest, "big") + 1) / (2**64 + 1)
+
+    def getJobLabels(self, labelBoundingBoxGroups):
+        # The labels of each bounding box job, as BoundingBoxScheduler groups them.
+        labels = list(labelBoundingBoxGroups)
+        return [labels[i:i + self.maxLabelsPerJob] for i in range(0, len(labels), self.maxLabelsPerJob)]
+
+    def getLabelStrata(self, labelGroups):
+        # A label with count items takes ceil(count / imageBatchSize) tasks.
+        strata = {}
+        for label in labelGroups:
+            count = 0
+            confidence = 0
+            for item in labelGroups.items(label):
+                count += 1
+                confidence += self.getItemConfidence(item)
+            strata[("labels", label)] = (math.ceil(count/self.imageBatchSize), count, confidence/count)
+        return strata
+
+    def getJobStrata(self, labelBoundingBoxGroups, jobLabels):
+        # A job takes one task per distinct image. The images are counted through the group store, so
+        # the count stays within its memory budget.
+        jobImages = self.groupStore.getGroups("review-job-images")
+        strata = {}
+        for jobIndex, labels in enumerate(jobLabels):
+            count = 0
+            confidence = 0
+            for label in labels:
+                for item in labelBoundingBoxGroups.items(label):
+                    count += 1
+                    confidence += self.getItemConfidence(item)
+                    jobImages.add(str(jobIndex), item["imageUrl"], key="{}/{}".format(jobIndex, item["imageUrl"]))
+            imageCount = jobImages.count(str(jobIndex))
+            strata[("bounding-boxes", jobIndex)] = (imageCount, imageCount, confidence/count)
+        return strata
+
+    def allocate(self, strata):
+        # Strata are (tasks, size, meanConfidence). The square root of the size gives rare labels a
+        # larger share than their frequency. Shares larger than a stratum's tasks are handed on.
+        weights = {}
+        for key, (tasks, size, meanConfidence) in strata.items():
+            weights[key] = math.sqrt(size) * self.getItemWeight(meanConfidence)
+
+        allocation = { key: 0 for key in strata }
+        budget = self.reviewBudget
+        active = [key for key in strata]
+
+        while(budget > 0 and active):
+            totalWeight = sum([weights[key] for key in active])
+            shares = { key: budget * weights[key] / totalWeight for key in active }
+
+            given = 0
+            for key in active:
+                share = min(int(shares[key]), strata[key][0] - allocation[key])
+                allocation[key] += share
+                given += share
+
+            if(given == 0):
+                for key in sorted(active, key=lambda k: shares[k], reverse=True)[:budget]:
+                    allocation[key] += 1
+                    given += 1
+
+            budget -= given
+            active = [key for key in active if allocation[key] < strata[key][0]]
+
+        return allocation
+
+    def sampleLabel(self, items, sampleSize, deferItem):
+        # Weighted reservoir sampling: every item gets the key u^(1/weight) and the sampleSize largest
+        # keys are kept. Items that never enter the reservoir or are pushed out of it are deferred.
+        reservoir = []
+        seq = 0
+        for item in items:
+            key = self.random.random() ** (1.0 / self.getItemWeight(self.getItemConfidence(item)))
+            entry = (key, seq, item)
+            seq += 1
+
+            if(len(reservoir) < sampleSize):
+                heapq.heappush(reservoir, entry)
+            elif(reservoir and key > reservoir[0][0]):
+                deferItem(heapq.heapreplace(reservoir, entry)[2])
+            else:
+                deferItem(item)
+
+        return [entry[2] for entry in sorted(reservoir, key=lambda e: e[1])]
+
+    def sampleImages(self, items, sampleSize):
+        # Weighted reservoir sampling over images: an image takes the largest key of its items, which
+        # is the key of its least confident one as all of them share u. Entries left behind in the heap
+        # when the key of an image goes up are skipped.
+        reservoir = []
+        keys = {}
+        for item in items:
+            imageUrl = item["imageUrl"]
+            key = self.getImageRandom(imageUrl) ** (1.0 / self.getItemWeight(self.getItemConfidence(item)))
+            if(key <= keys.get(imageUrl, 0)):
+                continue
+            if(not imageUrl in keys and len(keys) >= sampleSize):
+                while(reservoir and keys.get(reservoir[0][1]) != reservoir[0][0]):
+                    heapq.heappop(reservoir)
+                if(not reservoir or key <= reservoir[0][0]):
+                    continue
+                del keys[heapq.heappop(reservoir)[1]]
+
+            keys[imageUrl] = key
+            heapq.heappush(reservoir, (key, imageUrl))
+
+        return set(keys)
+
+    def sample(self, labelGroups, labelBoundingBoxGroups, deferredFile):
+        jobLabels = self.getJobLabels(labelBoundingBoxGroups)
+
+        strata = self.getLabelStrata(labelGroups)
+        strata.update(self.getJobStrata(labelBoundingBoxGroups, jobLabels))
+        allocation = self.allocate(strata)
+
+        groups = { "labels": labelGroups, "bounding-boxes": labelBoundingBoxGroups }
+        sampledGroups = { groupType: self.groupStore.getGroups("sampled-{}".format(groupType)) for groupType in groups }
+        deferredCount = 0
+
+        def deferItem(item, taskType):
+            nonlocal deferredCount
+            deferredCount += 1
+            deferredFile.write(json.dumps({ "source-ref": item["imageUrl"], "label": item["labelName"],
+                                            "confidence": self.getItemConfidence(item), "task-type": taskType }) + "\n")
+
+        selectedItems = 0
+        for (groupType, key), tasks in allocation.items():
+            if(groupType == "labels"):
+                selected = self.sampleLabel(labelGroups.items(key), tasks * self.imageBatchSize, lambda item: deferItem(item, groupType))
+                for item in selected:
+                    sampledGroups[groupType].add(key, item)
+                selectedItems += len(selected)
+                continue
+
+            # Every label of a selected image is kept, as they are all shown in the same task.
+            labels = jobLabels[key]
+            selectedImages = self.sampleImages((item for label in labels for item in labelBoundingBoxGroups.items(label)), tasks)
+            for label in labels:
+                for item in labelBoundingBoxGroups.items(label):
+                    if(item["imageUrl"] in selectedImages):
+                        sampledGroups[groupType].add(label, item)
+                        selectedItems += 1
+                    else:
+                        deferItem(item, groupType)
+
+        # Labels left without images drop out of their job, so the sampled jobs keep the same labels.
+        sampledJobLabels = [[label for label in labels if label in sampledGroups["bounding-boxes"]] for labels in jobLabels]
+
+        print("Selected {} tasks ({} items) for review, {} items deferred to the next cycle.".format(sum(allocation.values()),
+                                                                                                   selectedItems, deferredCount))
+
+        return (sampledGroups["labels"], sampledGroups["bounding-boxes"], [labels for labels in sampledJobLabels if labels], deferredCount)
+
+class BoundingBoxScheduler:
+
+    def __init__(self, labelBoundingBoxGroups, inputParameters, jobLabels=None):
+        self.labelBoundingBoxGroups = labelBoundingBoxGroups
+        self.inputParameters = inputParameters
+        # The labels of each job, when a review sample has already decided them.
+        self.jobLabels = jobLabels
+        
+    def getHtmlTemplate(self, headerText=None, fullInstructions=None, shortInstructions=None):
+
+        if(not headerText):
+            headerText = "Please adjust existing bounding box around instances of humans and assign the correct label. See full instructions for additional information."
+
+        if(not fullInstructions):
+            fullInstructions = """
+        <full-instructions header="Bounding box adjustment instructions">
+            <p>Note: For this task, if there are more than 4 people in the image, you only need to label the closest/biggest 4 people. </p><p><br></p><ol><li><strong>Inspect</strong> the image</li><li><strong>Determine</strong> if the specified label is/are visible in the picture.</li><li><strong>Outline</strong> each instance of the specified label in the image using the provided “Box” tool.</li></ol><ul><li>Boxes should fit tight around each object</li><li>Do not include parts of the object are overlapping or that cannot be seen, even though you think you can interpolate the whole shape.</li><li>Avoid including shadows.</li><li>If the target is off screen, draw the box up to the edge of the image.</li></ul><p><img src="https://d1i6hezpxab4vs.cloudfront.net/76082909-991b-406e-83a3-92726c2b00c5/src/images/bounding-box-good-example.png" style="max-width:100%"></p><h2><span style="color: rgb(0, 138, 0);">Good Example</span></h2><p><img src="https://d1i6hezpxab4vs.cloudfront.net/76082909-991b-406e-83a3-92726c2b00c5/src/images/bounding-box-bad-example.png" style="max-width:100%"></p><h2><span style="color: rgb(230, 0, 0);">Bad Example</span></h2>
+        </full-instructions>"""
+        if(not shortInstructions):
+            shortInstructions = """
+        <short-instructions>
+            <h2><span style="color: rgb(0, 138, 0);">Good example</span></h2><p>Enter description of a correct bounding box label</p><p><img src="https://d1i6hezpxab4vs.cloudfront.net/76082909-991b-406e-83a3-92726c2b00c5/src/images/quick-instructions-example-placeholder.png" style="max-width:100%"></p><p><br></p><h2><span style="color: rgb(230, 0, 0);">Bad example</span></h2><p>Enter description of an incorrect bounding box label</p><p><img src="https://d1i6hezpxab4vs.cloudfront.net/76082909-991b-406e-83a3-92726c2b00c5/src/images/quick-instructions-example-placeholder.png" style="max-width:100%"></p>
+        </short-instructions>"""    
+
+        htmlTemplate = """
+    <script src="https://assets.crowd.aws/crowd-html-elements.js"></script>
+    <crowd-form>
+      <crowd-bounding-box
+        name="boundingBox"
+        src="{{{{ task.input.taskObject | grant_read_access }}}}"
+        header="{}"
+        labels="{{{{ task.input.labels | to_json | escape }}}}"
+        initial-value="[
+          {{% for box in task.input.manifestLine.bounding-box.annotations %}}
+            {{% capture class_id %}}{{{{ box.class_id }}}}{{% endcapture %}}
+            {{% assign label = task.input.manifestLine.bounding-box-metadata.class-map[class_id] %}}
+          {{
+            label: {{{{label | to_json}}}},
+            left: {{{{box.left}}}},
+            top: {{{{box.top}}}},
+            width: {{{{box.width}}}},
+            height: {{{{box.height}}}},
+          }},
+          {{% endfor %}}
+        ]"
+      >
+        {}{}
+      </crowd-bounding-box>
+    </crowd-form>""".format(headerText, fullInstructions, shortInstructions)
+
+        return htmlTemplate
+
+    def getJobLabels(self):
+        if(self.jobLabels):
+            return self.jobLabels
+
+        maxLabels = self.inputParameters["maxLabelsPerBoundingBoxJob"]
+        labels = list(self.labelBoundingBoxGroups)
+        return [labels[i:i + maxLabels] for i in range(0, len(labels), maxLabels)]
+
+    def createManifestGroups(self):
+        # Yields one group at a time, so only the items of the current group are held in memory.
+
+        labelId = 0
+        for jobLabels in self.getJobLabels():
+            manifestGroup = {}
+            manifestGroup["items"] = {}
+            manifestGroup["labels"] = {}
+            for label in jobLabels:
+                self.addLabelItems(manifestGroup, labelId, label)
+                labelId += 1
+            yield manifestGroup
+
+    def addLabelItems(self, manifestGroup, labelId, label):
+        manifestItems = manifestGroup["items"]
+        manifestLabels = manifestGroup["labels"]
+
+        if(not labelId in manifestLabels):
+            manifestLabels[labelId] = label
+
+        for eimage in self.labelBoundingBoxGroups[label]:
+            if(eimage["imageUrl"] in manifestItems):
+                manifestItem = manifestItems[eimage["imageUrl"]]
+            else:
+                manifestItem = {}
+                manifestItem["imageUrl"] = eimage["imageUrl"]
+                manifestItem["imageWidth"] = eimage["imageWidth"]
+                manifestItem["imageHeight"] = eimage["imageHeight"]
+                manifestItem["annotations"] = []
+                manifestItem["confidences"] = []
+                manifestItem["classMap"] = {}
+                manifestItems[eimage["imageUrl"]] = manifestItem
+
+            for einstance in eimage["instances"]:
+                manifestItem["annotations"].append({"class_id": labelId,
+                                    "left": int(einstance[0]),
+                                    "top": int(einstance[1]),
+                                    "width": int(einstance[2]),
+                                    "height": int(einstance[3])})
+
+                manifestItem["confidences"].append(0.9)
+
+            if(not labelId in manifestItem["classMap"]):
+                manifestItem["classMap"][labelId] = label
+
+    @staticmethod
+    def getManifestItemJson(manifestItem):
+        annotations = []
+        for eannotation in manifestItem["annotations"]:
+            annotations.append({
+                "class_id": eannotation["class_id"],
+                "left": eannotation["left"],
+                "top": eannotation["top"],
+                "width": eannotation["width"],
+                "height": eannotation["height"]})
+
+        confidences = []
+        for econfidence in manifestItem["confidences"]:
+            confidences.append({"confidence": econfidence})
+
+        classMap = {}
+        for eclass in manifestItem["classMap"]:
+            classMap[eclass] = manifestItem["classMap"][eclass]
+
+        manifestItemJSON = { 
+            "source-ref": manifestItem["imageUrl"],
+            "bounding-box": {
+                "image_size": [{ "width":  manifestItem["imageWidth"], "height": manifestItem["imageHeight"], "depth": 3 }],
+                "annotations": annotations
+            },
+            "bounding-box-metadata": {
+                "objects": confidences,
+                "class-map": classMap,
+                "type": "groundtruth/object-detection",
+                "job-name": "labeling-job/test"
+            }
+        }
+
+        return manifestItemJSON
+
+    def createManifestFiles(self, manifestGroups):
+        
+        i = 0
+
+        manifestFiles = []
+
+        # Every group uses the same template, so it is stored once under its content hash.
+        htmlFileName = S3Helper.writeContentAddressed(self.getHtmlTemplate(), self.inputParameters["outputBucket"],
+                                                      self.inputParameters["templatesPath"], "html")
+
+        for manifestGroup in manifestGroups:
+
+            manifestItemsText = ""
+
+            manifestFileName = "{}/manifest-{}.json".format(self.inputParameters["boundingBoxManifestPath"], i)
+            labelsFileName = "{}/labels-{}.json".format(self.inputParameters["boundingBoxManifestPath"], i)    
+
+            groupLabels = []
+            for label in manifestGroup["labels"]:
+                groupLabels.append({"label": manifestGroup["labels"][label]})
+
+            labels = {
+                "document-version": "2018-11-28", 
+                "labels": groupLabels
+            }
+
+            S3Helper.writeToS3(json.dumps(labels), self.inputParameters["outputBucket"], labelsFileName)
+
+            for manifestItemUrl in manifestGroup["items"]:
+                manifestItem = manifestGroup["items"][manifestItemUrl]
+
+                manifestItemsText += json.dumps(BoundingBoxScheduler.getManifestItemJson(manifestItem)) + "\n"
+
+            S3Helper.writeToS3(manifestItemsText, self.inputParameters["outputBucket"], manifestFileName)
+
+            manifestFiles.append({"manifest": "s3://{}/{}".format(self.inputParameters["outputBucket"], manifestFileName),
+                                  "labels-manifest": "s3://{}/{}".format(self.inputParameters["outputBucket"], labelsFileName),
+                                 "html-template": "s3://{}/{}".format(self.inputParameters["outputBucket"], htmlFileName)})
+
+            i += 1
+        return manifestFiles
+    
+    def createGTJob(self, jobName, manifestUri, labelsUri, outputUri, preLambda, postLambda, roleArn, workTeamArn, templateUri, snsTopicArn=None):
+
+        sageMakerClient = AwsHelper().getClient("sagemaker", self.inputParameters["awsRegion"])
+
+        dataSource = { 'S3DataSource': { 'ManifestS3Uri': manifestUri } }
+        if(snsTopicArn):
+            # Streaming jobs take their data objects from the topic until they are stopped.
+            dataSource = { 'SnsDataSource': { 'SnsTopicArn': snsTopicArn } }
+
+        with tracer.span("create_labeling_job", "sagemaker", job=jobName):
+            response = sageMakerClient.create_labeling_job(
+                LabelingJobName=jobName,
+                LabelAttributeName="bounding-box-new",
+                InputConfig={
+                    'DataSource': dataSource,
+                    'DataAttributes': {
+                        'ContentClassifiers': [
+                            'FreeOfPersonallyIdentifiableInformation'
+                        ]
+                    }
+                },
+                OutputConfig={
+                    'S3OutputPath': outputUri
+                },
+                RoleArn=roleArn,
+                LabelCategoryConfigS3Uri=labelsUri,
+                HumanTaskConfig={
+                    'WorkteamArn': workTeamArn,
+                     'UiConfig': {
+                        'UiTemplateS3Uri': templateUri
+                     },
+                    'PreHumanTaskLambdaArn': preLambda,
+                    'TaskTitle': 'Confirm Bounding Boxes',
+                    'TaskDescription': 'Confirm bounding boxes.',
+                    'NumberOfHumanWorkersPerDataObject': 1,
+                    'TaskTimeLimitInSeconds': self.inputParameters["reviewTaskSettings"]["bounding-boxes"]["taskTimeLimitSeconds"],
+                    'MaxConcurrentTaskCount': self.inputParameters["reviewTaskSettings"]["bounding-boxes"]["maxConcurrentTaskCount"],
+                    'AnnotationConsolidationConfig': {
+                        'AnnotationConsolidationLambdaArn': postLambda
+                    }
+                }
+            )
+
+    def getLambdaArns(self):
+
+        lambdaMap = {
+            "us-east-1": "432418664414",
+            "us-east-2": "266458841044",
+            "us-west-2": "081040173940",
+            "ca-central-1": "918755190332",
+            "eu-west-1": "568282634449",
+            "eu-west-2": "487402164563",
+            "eu-central-1": "203001061592",
+            "ap-northeast-1": "477331159723",
+            "ap-northeast-2": "845288260483",
+            "ap-south-1": "565803892007",
+            "ap-southeast-1": "377565633583",
+            "ap-southeast-2": "454466003867"
+        }
+
+        preLambda = "arn:aws:lambda:{}:{}:function:PRE-AdjustmentBoundingBox".format(self.inputParameters["awsRegion"], lambdaMap[self.inputParameters["awsRegion"]])
+        postLambda = "arn:aws:lambda:{}:{}:function:ACS-AdjustmentBoundingBox".format(self.inputParameters["awsRegion"], lambdaMap[self.inputParameters["awsRegion"]])
+
+        # preLambda = "arn:aws:lambda:us-east-1:432418664414:function:PRE-AdjustmentBoundingBox"
+        # postLambda = "arn:aws:lambda:us-east-1:432418664414:function:ACS-AdjustmentBoundingBox"
+
+        return (preLambda, postLambda)
+
+    def createBoundingBoxGTJobs(self, manifestFiles):
+
+        jobs = []
+        mindex = 0
+        rateLimiter = RateLimiter(self.inputParameters["sageMakerApiRate"])
+        preLambda, postLambda = self.getLambdaArns()
+
+        for manifestFile in manifestFiles:
+
+            #jobName = "{}".format(uuid.uuid1())
+            jobName = "{}-{}".format(self.inputParameters["runId"], mindex)
+            manifestUri = manifestFile["manifest"]
+            labelsUri = manifestFile["labels-manifest"]
+            outputUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["boundingBoxGroundTruthOutputPath"])
+            templateUri = manifestFile["html-template"]
+
+            roleArn = self.inputParameters["gtJobRoleArn"]
+            workTeamArn = self.inputParameters["gtWorkTeamArn"]
+
+            jobs.append({ "jobName": jobName, "manifestUri" : manifestUri, "labelsUri": labelsUri,
+                        "templateUri": templateUri, "outputUri": outputUri,
+                        "preLambda": preLambda, "postLambda": postLambda, "roleArn": roleArn, "workTeamArn": workTeamArn})
+
+            mindex += 1
+
+        def createJob(job):
+            rateLimiter.wait()
+            self.createGTJob(job["jobName"], job["manifestUri"], job["labelsUri"], job["outputUri"], job["preLambda"],
+                             job["postLambda"], job["roleArn"], job["workTeamArn"], job["templateUri"])
+
+        # The rate limiter keeps concurrent creation within the SageMaker API quota.
+        with ThreadPoolExecutor(max_workers=self.inputParameters["gtJobCreationConcurrency"]) as executor:
+            for future in [executor.submit(createJob, job) for job in jobs]:
+                future.result()
+
+        return jobs
+
+    def run(self):
+        print("Label BoundingBox Groups:")
+        for ebbLabel in self.labelBoundingBoxGroups:
+            print("BBLabel: {}".format(ebbLabel))
+            for eimage in self.labelBoundingBoxGroups[ebbLabel]:
+                print(eimage["imageUrl"])
+
+        manifestGroups = self.createManifestGroups()
+        manifestFiles = self.createManifestFiles(manifestGroups)
+        jobs = self.createBoundingBoxGTJobs(manifestFiles)
+        return jobs
+
+class LabelVerificationScheduler:
+
+    def __init__(self, labelGroups, inputParameters):
+        self.labelGroups = labelGroups
+        self.inputParameters = inputParameters
+
+    def writeManifestBatch(self, label, batchIndex, manifestItems):
+        fileName = "{}/manifest-{}-{}.json".format(self.inputParameters["labelManifestPath"], label.replace(" ", "-"), batchIndex)
+        S3Helper.writeToS3(json.dumps(manifestItems), self.inputParameters["outputBucket"], fileName)
+        # print("s3://{}/{}".format(self.inputParameters["outputBucket"], fileName))
+        return "s3://{}/{}".format(self.inputParameters["outputBucket"], fileName)
+
+    def createManifestFiles(self):
+        imageBatchSize = self.inputParameters["maxImagesPerLabelVerificationBatch"]
+        masterManifestFileText = ""
+        for elabel in self.labelGroups:
+            i = 0
+            j = 0
+            # print("Generating manifest files for label: {}".format(elabel))
+            
+            manifestItems = []
+            
+            for eimage in self.labelGroups[elabel]:
+                manifestItems.append({"imageUrl": eimage["imageUrl"], 
+                                    "label": elabel,
+                                    "confidence" : float(eimage["confidence"])})
+                
+                i += 1
+                
+                if( i % imageBatchSize == 0):
+                    masterManifestFileText += ('{{ "source-ref": "{}" }}\n'.format(self.writeManifestBatch(elabel, j, manifestItems)))
+                    manifestItems.clear()
+                    j += 1
+                    
+            if(manifestItems):
+                masterManifestFileText += ('{{ "source-ref": "{}" }}\n'.format(self.writeManifestBatch(elabel, j, manifestItems)))
+                manifestItems.clear()
+                j += 1
+                
+        labelVerificationManifestFileName = "{}/manifest.json".format(self.inputParameters["labelManifestPath"])
+
+        S3Helper.writeToS3(masterManifestFileText, self.inputParameters["outputBucket"], labelVerificationManifestFileName)
+
+        print("Generated label verification manifest file...")
+        print("s3://{}/{}".format(self.inputParameters["outputBucket"], labelVerificationManifestFileName))
+
+        return labelVerificationManifestFileName
+
+    def getLabelVeriificationHtmlTemplate(self):
+        
+        labelVerificationHtmlTemplate = """
+    <script src="https://assets.crowd.aws/crowd-html-elements.js"></script>
+    <style>
+    .center {    text-align: center;
+    border: 3px solid white;
+    }
+    .row {    display: flex;
+    flex-wrap: wrap;
+    padding: 0 4px;
+    }
+    /* Create five equal columns that sits next to each other */
+    .column {    flex: 18%;
+    padding: 0 4px;
+    }
+    </style>
+    <crowd-form>
+    <div class="center">
+    <h1> Confirm that each image is correctly labelled as "{{ task.input.sourceRef[0].label }}"</h1>
+    </div>
+    <div class="row">
+    {% assign length = task.input.sourceRef.size | minus: 1 %}
+    {% for i in (0..length) %}
+    <div class="column">
+    <crowd-card
+    image="{{ task.input.sourceRef[i].imageUrl | grant_read_access }}">
+    <div class="center">Confirm <crowd-checkbox checked="true" name="item-{{i}}" value="Confirmed" /></div>
+    </crowd-card>
+    </div>
+    {% endfor %}
+    </div>
+    </crowd-form>"""
+
+        return labelVerificationHtmlTemplate
+
+    def createCutomGTJob(self, jobName, manifestUri, outputUri, preLambda, postLambda, roleArn, workTeamArn, templateUri, snsTopicArn=None):
+        
+        sageMakerClient = AwsHelper().getClient("sagemaker", self.inputParameters["awsRegion"])
+
+        dataSource = { 'S3DataSource': { 'ManifestS3Uri': manifestUri } }
+        if(snsTopicArn):
+            dataSource = { 'SnsDataSource': { 'SnsTopicArn': snsTopicArn } }
+
+        with tracer.span("create_labeling_job", "sagemaker", job=jobName):
+            response = sageMakerClient.create_labeling_job(
+                LabelingJobName=jobName,
+                LabelAttributeName="labels",
+                InputConfig={
+                    'DataSource': dataSource,
+                    'DataAttributes': {
+                        'ContentClassifiers': [
+                            'FreeOfPersonallyIdentifiableInformation'
+                        ]
+                    }
+                },
+                OutputConfig={
+                    'S3OutputPath': outputUri
+                },
+                RoleArn=roleArn,
+                HumanTaskConfig={
+                    'WorkteamArn': workTeamArn,
+                    'UiConfig': {
+                        'UiTemplateS3Uri': templateUri
+                    },
+                    'PreHumanTaskLambdaArn': preLambda,
+                    'TaskTitle': 'Confirm label for images below',
+                    'TaskDescription': 'Confirm images for label.',
+                    'NumberOfHumanWorkersPerDataObject': 1,
+                    'TaskTimeLimitInSeconds': self.inputParameters["reviewTaskSettings"]["labels"]["taskTimeLimitSeconds"],
+                    'MaxConcurrentTaskCount': self.inputParameters["reviewTaskSettings"]["labels"]["maxConcurrentTaskCount"],
+                    'AnnotationConsolidationConfig': {
+                        'AnnotationConsolidationLambdaArn': postLambda
+                    }
+                }
+            )
+
+    def run(self):
+        
+        labelVerificationManifestFileName = self.createManifestFiles()
+
+        labelVerificationHtmlTemplate = self.getLabelVeriificationHtmlTemplate()
+        labelVerificationHtmlTemplateFile = S3Helper.writeContentAddressed(labelVerificationHtmlTemplate, self.inputParameters["outputBucket"],
+                                                                           self.inputParameters["templatesPath"], "html")
+
+        jobName = "{}".format(uuid.uuid1())
+
+        manifestUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], labelVerificationManifestFileName)
+        outputUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["labelGroundTruthOutputPath"])
+        templateUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], labelVerificationHtmlTemplateFile)
+
+        roleArn = self.inputParameters["gtJobRoleArn"]
+        workTeamArn = self.inputParameters["gtWorkTeamArn"]
+
+        preLambda = self.inputParameters["gtLabelVerificationPreLambda"]
+        postLambda = self.inputParameters["gtLabelVerificationPostLambda"]
+
+        self.createCutomGTJob(jobName, manifestUri, outputUri, preLambda, postLambda, roleArn, workTeamArn, templateUri)
+
+        return jobName
+
+class StreamingJobPublisher:
+    # Streaming mode: Ground Truth streaming labeling jobs read their tasks from SNS topics, so label
+    # groups are published as they fill up while the analysis is still running. A single worker keeps
+    # the messages of a label behind the creation of its job and off the analysis thread.
+
+    def __init__(self, inputParameters):
+        self.inputParameters = inputParameters
+        self.boundingBoxScheduler = BoundingBoxScheduler(None, inputParameters)
+        self.labelVerificationScheduler = LabelVerificationScheduler(None, inputParameters)
+        self.rateLimiter = RateLimiter(inputParameters["sageMakerApiRate"])
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+        self.pending = {}
+        self.batchIndexes = {}
+        self.boundingBoxJobs = {}
+        self.labelVerificationJob = None
+        self.topics = []
+
+    def getFillLevel(self, groupType):
+        # A label verification task shows one batch of images, so a batch is published at a time.
+        if(groupType == "labels"):
+            return self.inputParameters["maxImagesPerLabelVerificationBatch"]
+        return self.inputParameters["streamingFillLevel"]
+
+    def createTopic(self, name):
+        sns = AwsHelper().getClient("sns", self.inputParameters["awsRegion"])
+        topicArn = sns.create_topic(Name=name)["TopicArn"]
+        self.topics.append(topicArn)
+        return topicArn
+
+    def publish(self, topicArn, item):
+        sns = AwsHelper().getClient("sns", self.inputParameters["awsRegion"])
+        with tracer.span("sns publish", "sns", topic=topicArn):
+            sns.publish(TopicArn=topicArn, Message=json.dumps(item))
+
+    def createLabelVerificationJob(self):
+        templateFile = S3Helper.writeContentAddressed(self.labelVerificationScheduler.getLabelVeriificationHtmlTemplate(),
+                                                      self.inputParameters["outputBucket"], self.inputParameters["templatesPath"], "html")
+
+        jobName = "{}".format(uuid.uuid1())
+        topicArn = self.createTopic(jobName)
+        outputUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["labelGroundTruthOutputPath"])
+        templateUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], templateFile)
+
+        self.rateLimiter.wait()
+        self.labelVerificationScheduler.createCutomGTJob(jobName, None, outputUri, self.inputParameters["gtLabelVerificationPreLambda"],
+                                                         self.inputParameters["gtLabelVerificationPostLambda"], self.inputParameters["gtJobRoleArn"],
+                                                         self.inputParameters["gtWorkTeamArn"], templateUri, topicArn)
+        print("Started streaming label verification job: {}".format(jobName))
+
+        self.labelVerificationJob = { "jobName": jobName, "topicArn": topicArn }
+
+    def createBoundingBoxJob(self, label):
+        # One job per label, as the labels of a job are fixed when it is created.
+        index = len(self.boundingBoxJobs)
+        jobName = "{}-{}".format(self.inputParameters["runId"], index)
+
+        labelsFileName = "{}/labels-{}.json".format(self.inputParameters["boundingBoxManifestPath"], index)
+        labels = { "document-version": "2018-11-28", "labels": [{"label": label}] }
+        S3Helper.writeToS3(json.dumps(labels), self.inputParameters["outputBucket"], labelsFileName)
+
+        templateFile = S3Helper.writeContentAddressed(self.boundingBoxScheduler.getHtmlTemplate(), self.inputParameters["outputBucket"],
+                                                      self.inputParameters["templatesPath"], "html")
+
+        topicArn = self.createTopic(jobName)
+        labelsUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], labelsFileName)
+        outputUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], self.inputParameters["boundingBoxGroundTruthOutputPath"])
+        templateUri = "s3://{}/{}".format(self.inputParameters["outputBucket"], templateFile)
+        preLambda, postLambda = self.boundingBoxScheduler.getLambdaArns()
+
+        self.rateLimiter.wait()
+        self.boundingBoxScheduler.createGTJob(jobName, None, labelsUri, outputUri, preLambda, postLambda,
+                                              self.inputParameters["gtJobRoleArn"], self.inputParameters["gtWorkTeamArn"], templateUri, topicArn)
+        print("Started streaming bounding box job: {} for label: {}".format(jobName, label))
+
+        self.boundingBoxJobs[label] = { "jobName": jobName, "topicArn": topicArn }
+
+    def publishGroup(self, groupType, label, items):
+        if(groupType == "labels"):
+            if(not self.labelVerificationJob):
+                self.createLabelVerificationJob()
+
+            batchIndex = self.batchIndexes.get(label, 0)
+            self.batchIndexes[label] = batchIndex + 1
+
+            manifestItems = []
+            for eimage in items:
+                manifestItems.append({"imageUrl": eimage["imageUrl"], "label": label, "confidence": float(eimage["confidence"])})
+            manifestUri = self.labelVerificationScheduler.writeManifestBatch(label, batchIndex, manifestItems)
+            self.publish(self.labelVerificationJob["topicArn"], { "source-ref": manifestUri })
+        else:
+            if(not label in self.boundingBoxJobs):
+                self.createBoundingBoxJob(label)
+
+            for eimage in items:
+                manifestItem = { "imageUrl": eimage["imageUrl"], "imageWidth": eimage["imageWidth"], "imageHeight": eimage["imageHeight"],
+                                 "annotations": [], "confidences": [], "classMap": { 0: label } }
+                for einstance in eimage["instances"]:
+                    manifestItem["annotations"].append({"class_id": 0, "left": int(einstance[0]), "top": int(einstance[1]),
+                                                        "width": int(einstance[2]), "height": int(einstance[3])})
+                    manifestItem["confidences"].append(0.9)
+                self.publish(self.boundingBoxJobs[label]["topicArn"], BoundingBoxScheduler.getManifestItemJson(manifestItem))
+
+    def submit(self, groupType, label):
+        items = self.pending.pop((groupType, label))
+        self.futures.append(self.executor.submit(self.publishGroup, groupType, label, items))
+
+    def add(self, groupType, label, item):
+        items = self.pending.setdefault((groupType, label), [])
+        items.append(item)
+        if(len(items) >= self.getFillLevel(groupType)):
+            self.submit(groupType, label)
+
+    def close(self):
+        # Publishes what is left of every group and waits for the worker.
+        for groupType, label in list(self.pending):
+            self.submit(groupType, label)
+
+        self.executor.shutdown()
+        for future in self.futures:
+            future.result()
+
+        boundingBoxJobs = list(self.boundingBoxJobs.values())
+        labelVerificationJob = self.labelVerificationJob["jobName"] if self.labelVerificationJob else ""
+        return (boundingBoxJobs, labelVerificationJob)
+
+class JobScheduler:
+
+    def __init__(self, inputParameters):
+        self.inputParameters = inputParameters
+   
+    def printGroups(self, labelGroups, labelBoundingBoxGroups, noLabelsGroup):
+        print("No Labels")
+        print(noLabelsGroup)
+        
+        print("Label Groups:")
+        for elabel in labelGroups:
+            print("Label: {}".format(elabel))
+            for eimage in labelGroups[elabel]:
+                print(eimage["imageUrl"])
+                
+        print("Label BoundingBox Groups:")
+        for ebbLabel in labelBoundingBoxGroups:
+            print("BBLabel: {}".format(ebbLabel))
+            for eimage in labelBoundingBoxGroups[ebbLabel]:
+                print(eimage["imageUrl"])
+
+    def setOutputPaths(self, runId):
+        self.inputParameters["labelManifestPath"] = "datasets/{}/label-verification/manifest".format(runId)
+        self.inputParameters["labelGroundTruthOutputPath"] = "datasets/{}/label-verification/ground-truth-output".format(runId)
+        self.inputParameters["boundingBoxManifestPath"] = "datasets/{}/bounding-box-verification/manifest".format(runId)
+        self.inputParameters["boundingBoxGroundTruthOutputPath"] = "datasets/{}/bounding-box-verification/ground-truth-output".format(runId)
+        self.inputParameters["noLabelsManifestPath"] = "datasets/{}/no-labels/manifest".format(runId)
+        self.inputParameters["deferredManifestPath"] = "datasets/{}/deferred/manifest".format(runId)
+        self.inputParameters["predictionsManifestPath"] = "datasets/{}/predictions".format(runId)
+        self.inputParameters["comparisonManifestPath"] = "datasets/{}/comparison".format(runId)
+        self.inputParameters["framesPath"] = "datasets/{}/frames".format(runId)
+        self.inputParameters["jobsListPath"] = "datasets/{}/jobs".format(runId)
+        self.inputParameters["templatesPath"] = "datasets/templates"
+
+    def parseInputPath(self):
+        print("Input data path: {}".format(self.inputParameters["datasetPath"]))
+        bucketName, inputDocumentPath = S3Helper.parseBucketAndDocumentName(self.inputParameters["datasetPath"])
+        self.inputParameters["bucketName"] = bucketName
+        self.inputParameters["inputDocumentPath"] = inputDocumentPath
+        print("Images bucket: {}, Images path: {}".format(bucketName, inputDocumentPath))
+
+    def getImageList(self):
+        print("Getting image list...")
+        allowedFileTypes = ["jpg", "jpeg", "png"]
+        if(self.inputParameters["videoFrameSampling"]):
+            allowedFileTypes = allowedFileTypes + VideoFrameSampler.videoFileTypes
+        if(self.inputParameters["listConcurrency"]):
+            lister = ParallelS3Lister(self.inputParameters["awsRegion"], self.inputParameters["bucketName"], allowedFileTypes,
+                                      self.inputParameters["listConcurrency"])
+            # Sorted, so the image order is the same as with the sequential listing.
+            images = sorted(lister.listKeys(self.inputParameters["inputDocumentPath"], self.inputParameters["maxListedImages"]))
+            print("Listed with {} calls and {} range splits.".format(lister.listCalls, lister.splits))
+        else:
+            images = S3Helper.getFileNames(self.inputParameters["awsRegion"], self.inputParameters["bucketName"],
+                                         self.inputParameters["inputDocumentPath"], -(-self.inputParameters["maxListedImages"] // 1000),
+                                         allowedFileTypes)
+
+        if(self.inputParameters["videoFrameSampling"]):
+            videos = [imageName for imageName in images if VideoFrameSampler.isVideo(imageName)]
+            if(videos):
+                images = [imageName for imageName in images if not VideoFrameSampler.isVideo(imageName)]
+                images.extend(VideoFrameSampler(self.inputParameters).run(videos))
+
+        print("Total images: {}".format(len(images)))
+        return images
+
+    def startBoundingBoxAdjustmentJobs(self, labelBoundingBoxGroups, jobLabels=None):
+        print("Starting bounding box adjustment jobs...")
+        boundingBoxJobScheduler = BoundingBoxScheduler(labelBoundingBoxGroups, self.inputParameters, jobLabels)
+        boundingBoxJobs = boundingBoxJobScheduler.run()
+        print("Started {} jobs for bounding box adjustment.".format(len(boundingBoxJobs)))
+        jobStatuses = self.getJobStatuses(self.inputParameters["runId"])
+        for job in boundingBoxJobs:
+            print("Job: {}, Status: {}".format(job["jobName"], jobStatuses.get(job["jobName"], "Pending")))
+        return boundingBoxJobs
+
+    def getJobStatuses(self, nameContains):
+        # One paginated listing instead of a describe call per job.
+        client = AwsHelper().getClient('sagemaker', self.inputParameters["awsRegion"])
+        jobStatuses = {}
+        paginator = client.get_paginator('list_labeling_jobs')
+        for page in paginator.paginate(NameContains=nameContains):
+            for jobSummary in page["LabelingJobSummaryList"]:
+                jobStatuses[jobSummary["LabelingJobName"]] = jobSummary["LabelingJobStatus"]
+        return jobStatuses
+
+    def startLabelVerificationJobs(self, labelGroups):
+        print("Starting label verification job.")
+        labelVerificationScheduler = LabelVerificationScheduler(labelGroups, self.inputParameters)
+        labelVerificationJob = labelVerificationScheduler.run()
+        print("Started label verification job with Id: {}".format(labelVerificationJob))
+        client = AwsHelper().getClient('sagemaker', self.inputParameters["awsRegion"])
+        response = client.describe_labeling_job(LabelingJobName=labelVerificationJob)
+        print("Job: {}, Status: {}".format(labelVerificationJob, response["LabelingJobStatus"]))
+        return labelVerificationJob
+
+    def generateOutputJobsFile(self, boundingBoxJobs, labelVerificationJob, noLabelsFile, deferredFile="", streamingTopics=None, predictionsFile="",
+                               comparisonFile=""):
+        jobsList = {}
+
+        bbvjobs = []
+        for job in boundingBoxJobs:
+            bbvjobs.append(job["jobName"])
+        jobsList["runid"] = self.inputParameters["runId"]
+        jobsList["bounding-box-verification-jobs"] = bbvjobs
+        jobsList["label-verification-job"] = labelVerificationJob
+        jobsList["no-labels-manifest-file"] = noLabelsFile
+        jobsList["deferred-manifest-file"] = deferredFile
+        jobsList["streaming-topics"] = streamingTopics or []
+        jobsList["predictions-manifest-file"] = predictionsFile
+        jobsList["comparison-manifest-file"] = comparisonFile
+        # print(jobsList)
+        
+        jobsListFile = "{}/jobs.json".format(self.inputParameters["jobsListPath"])
+        S3Helper.writeToS3(json.dumps(jobsList), self.inputParameters["outputBucket"], jobsListFile)
+        jobsListFile = "{}/jobs.json".format(self.inputParameters["jobsListPath"])
+        S3Helper.writeToS3(json.dumps(jobsList), self.inputParameters["outputBucket"], jobsListFile)
+        
+        print("Jobs manifest generated: s3://{}/{}".format(self.inputParameters["outputBucket"], jobsListFile))
+
+        print("=============================================")
+        print("To genarete final output with human review run command below:\npython3 get-feedback.py --jobs-manifest ""s3://{}/{}""".format(self.inputParameters["outputBucket"], jobsListFile))
+        print("=============================================")
+
+        return "s3://{}/{}".format(self.inputParameters["outputBucket"], jobsListFile)
+
+    def createNoLabelsManifest(self, noLabelsGroup):
+
+        s3FilePath = ""
+
+        if(noLabelsGroup):
+            fileText = ""
+            for elabel in noLabelsGroup.values():
+                item = {}
+                item["source-ref"] = elabel["imageUrl"]
+                # item["nolabel"] = {"annotations": [], "image_size": [{"width":elabel["imageWidth"],"depth":3,"height":elabel["imageHeight"]}]}
+                # item["nolabel-metadata"] = {"job-name":"labeling-job/nolabels",
+                #                                 "class-map":{},
+                #                                 "human-annotated":"yes",
+                #                                 "objects":[],
+                #                                 "creation-date":"2019-11-27T10:49:14.678944"
+                #                                 ,"type":"groundtruth/object-detection"}
+                fileText += json.dumps(item) + "\n"
+            
+            noLabelsManifestFile = "{}/nolabels.json".format(self.inputParameters["noLabelsManifestPath"])
+            S3Helper.writeToS3(fileText, self.inputParameters["outputBucket"], noLabelsManifestFile)
+            s3FilePath = "s3://{}/{}".format(self.inputParameters["outputBucket"], noLabelsManifestFile)
+
+        return s3FilePath
+
+    def createPredictionsManifest(self, labelGroups, labelBoundingBoxGroups):
+        # The model's predictions for everything sent for review, compared with the human answers by get-feedback.py --evaluate.
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".jsonl") as predictionsFile:
+            for predictionType, groups in [("label", labelGroups), ("bounding-box", labelBoundingBoxGroups)]:
+                for label in groups:
+                    for item in groups.items(label):
+                        predictionsFile.write(json.dumps({ "source-ref": item["imageUrl"], "label": label, "type": predictionType,
+                                                           "confidence": float(item["confidence"]),
+                                                           "boxes": [list(einstance) for einstance in item["instances"]],
+                                                           "boxConfidences": item.get("instanceConfidences", []) }) + "\n")
+            predictionsFile.flush()
+
+            predictionsManifestFile = "{}/predictions.jsonl".format(self.inputParameters["predictionsManifestPath"])
+            S3Helper.uploadToS3(predictionsFile.name, self.inputParameters["outputBucket"], predictionsManifestFile)
+
+        return "s3://{}/{}".format(self.inputParameters["outputBucket"], predictionsManifestFile)
+
+    def createComparisonManifest(self, comparisonGroup):
+        # Every model's answers and the disagreement score of each image, including the ones not sent for review.
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".jsonl") as comparisonFile:
+            for item in comparisonGroup.values():
+                comparisonFile.write(json.dumps(item) + "\n")
+            comparisonFile.flush()
+
+            comparisonManifestFile = "{}/comparison.jsonl".format(self.inputParameters["comparisonManifestPath"])
+            S3Helper.uploadToS3(comparisonFile.name, self.inputParameters["outputBucket"], comparisonManifestFile)
+
+        print("Comparison manifest generated: s3://{}/{}".format(self.inputParameters["outputBucket"], comparisonManifestFile))
+        return "s3://{}/{}".format(self.inputParameters["outputBucket"], comparisonManifestFile)
+
+    def sampleForReview(self, groupStore, labelGroups, labelBoundingBoxGroups):
+        # Items left out of the review budget are written to a manifest to pick up in the next cycle.
+        sampler = ReviewSampler(groupStore, self.inputParameters["reviewBudget"], self.inputParameters["maxImagesPerLabelVerificationBatch"],
+                                self.inputParameters["maxLabelsPerBoundingBoxJob"], self.inputParameters["reviewSampleSeed"])
+
+        s3FilePath = ""
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".json") as deferredFile:
+            labelGroups, labelBoundingBoxGroups, jobLabels, deferredCount = sampler.sample(labelGroups, labelBoundingBoxGroups, deferredFile)
+            deferredFile.flush()
+
+            if(deferredCount):
+                deferredManifestFile = "{}/deferred.json".format(self.inputParameters["deferredManifestPath"])
+                S3Helper.uploadToS3(deferredFile.name, self.inputParameters["outputBucket"], deferredManifestFile)
+                s3FilePath = "s3://{}/{}".format(self.inputParameters["outputBucket"], deferredManifestFile)
+                print("Deferred manifest generated: {}".format(s3FilePath))
+
+        return (labelGroups, labelBoundingBoxGroups, jobLabels, s3FilePath)
+
+    def startRun(self):
+
+        #Run Id
+        runId = str(uuid.uuid1())
+        self.inputParameters["runId"] = runId
+        print("Run Id: {}".format(runId))
+        print("AWS Region: {}".format(self.inputParameters["awsRegion"]))
+        self.setOutputPaths(runId)
+        self.parseInputPath()
+        if(self.inputParameters["autoTuneReview"]):
+            ReviewTuner(self.inputParameters).apply()
+        return self.getImageList()
+
+    def startProjectVersion(self, imageCount):
+        inferenceUnits = self.inputParameters["minInferenceUnits"]
+        if(self.inputParameters["targetRunSeconds"]):
+            capacityPlan = CapacityPlanner(self.inputParameters).plan(imageCount)
+            inferenceUnits = capacityPlan["inferenceUnits"]
+            self.inputParameters["concurrencyControl"] = max(self.inputParameters["concurrencyControl"], capacityPlan["concurrency"])
+
+        projectVersionManager = None
+        if(self.inputParameters["manageProjectVersion"]):
+            projectVersionManager = ProjectVersionManager(self.inputParameters["projectVersionArn"], self.inputParameters["awsRegion"],
+                                                          self.inputParameters["projectVersionPollSeconds"])
+            projectVersionManager.start(inferenceUnits)
+
+        return projectVersionManager
+
+    def scheduleJobs(self, groupStore, labelGroups, labelBoundingBoxGroups, noLabelsGroup, streamingPublisher=None):
+        # self.printGroups(labelGroups, labelBoundingBoxGroups, noLabelsGroup)
+
+        deferredFile = ""
+        jobLabels = None
+        if(self.inputParameters["reviewBudget"]):
+            labelGroups, labelBoundingBoxGroups, jobLabels, deferredFile = self.sampleForReview(groupStore, labelGroups, labelBoundingBoxGroups)
+        
+        noLabelsFile = ""
+        if(noLabelsGroup):
+            noLabelsFile = self.createNoLabelsManifest(noLabelsGroup)
+
+        predictionsFile = ""
+        if(labelGroups or labelBoundingBoxGroups):
+            predictionsFile = self.createPredictionsManifest(labelGroups, labelBoundingBoxGroups)
+
+        comparisonFile = ""
+        comparisonGroup = groupStore.getGroups("comparison")
+        if(comparisonGroup):
+            comparisonFile = self.createComparisonManifest(comparisonGroup)
+
+        # Start GT jobs
+        boundingBoxJobs = []
+        labelVerificationJob = ""
+        streamingTopics = []
+        if(streamingPublisher):
+            boundingBoxJobs, labelVerificationJob = streamingPublisher.close()
+            streamingTopics = streamingPublisher.topics
+            print("Streaming jobs keep accepting tasks until get-feedback.py is run with --stop-streaming-jobs.")
+        else:
+            if(labelBoundingBoxGroups):
+                boundingBoxJobs = self.startBoundingBoxAdjustmentJobs(labelBoundingBoxGroups, jobLabels)
+            if(labelGroups):
+                labelVerificationJob = self.startLabelVerificationJobs(labelGroups)
+        
+        #Output job file
+        return self.generateOutputJobsFile(boundingBoxJobs, labelVerificationJob, noLabelsFile, deferredFile, streamingTopics, predictionsFile,
+                                           comparisonFile)
+
+    def run(self):
+
+        images = self.startRun()
+        projectVersionManager = self.startProjectVersion(len(images))
+        
+        # Analyze images
+        print("Analyzing images...")
+        # In streaming mode the jobs are started and fed while the images are analyzed.
+        streamingPublisher = None
+        if(self.inputParameters["streamingJobs"]):
+            streamingPublisher = StreamingJobPublisher(self.inputParameters)
+
+        imageAnalyzer = ImageAnalyzer(images, self.inputParameters, streamingPublisher)
+        try:
+            try:
+                labelGroups, labelBoundingBoxGroups, noLabelsGroup = imageAnalyzer.run()
+            finally:
+                if(projectVersionManager):
+                    projectVersionManager.stop()
+
+            return self.scheduleJobs(imageAnalyzer.groupStore, labelGroups, labelBoundingBoxGroups, noLabelsGroup, streamingPublisher)
+        finally:
+            imageAnalyzer.groupStore.close()
+
+class CustomLabelsFeedback:
+    
+    def __init__(self):
+        ''' Constructor. '''
+        print("")
+
+    def validateInput(self, input):
+
+        event = {}
+
+        #Validate input parameters
+        event['datasetPath'] = input["images"]
+        event["outputBucket"] = input["outputBucket"]
+        event["gtJobRoleArn"] = input["jobRoleArn"]
+        event["gtWorkTeamArn"] = input["workforceTeamArn"]
+        event["gtLabelVerificationPreLambda"] = input["preLambdaArn"]
+        event["gtLabelVerificationPostLambda"] = input["postLambdaArn"]
+        # With several project versions the first one is the model whose labels are reviewed.
+        event["projectVersionArns"] = input.get("projectVersionArns", [])
+        # Equivalent project versions, possibly in other regions, that share the inference load.
+        event["projectVersionPool"] = input.get("projectVersionPool", [])
+        event["endpointEjectSeconds"] = input.get("endpointEjectSeconds", 5)
+        if(event["projectVersionArns"]):
+            event["projectVersionArn"] = event["projectVersionArns"][0]
+        elif(event["projectVersionPool"]):
+            event["projectVersionArn"] = event["projectVersionPool"][0]
+        else:
+            event["projectVersionArn"] = input["projectVersionArn"]
+        event["disagreementThreshold"] = input.get("disagreementThreshold", 0)
+        event["comparisonIouThreshold"] = input.get("comparisonIouThreshold", 0.5)
+        event["concurrencyControl"] = input["concurrencyControl"]
+        event["minimumConfidence"] = input["minimumConfidence"]
+        event["maxLabelsPerBoundingBoxJob"] = input["maxLabelsPerBoundingBoxJob"]
+        event["maxImagesPerLabelVerificationBatch"] = input["maxImagesPerLabelVerificationBatch"]
+        event["maxLabels"] = input["maxLabels"]
+        # Settings of the Ground Truth jobs per job type, adjusted by autoTuneReview.
+        event["reviewTaskSettings"] = {}
+        for jobType in ["labels", "bounding-boxes"]:
+            event["reviewTaskSettings"][jobType] = { "taskTimeLimitSeconds": input.get("taskTimeLimitSeconds", 600),
+                                                     "maxConcurrentTaskCount": input.get("maxConcurrentTaskCount", 10) }
+        event["autoTuneReview"] = input.get("autoTuneReview", False)
+        event["targetTaskSeconds"] = input.get("targetTaskSeconds", 300)
+        event["maxImageEdge"] = input.get("maxImageEdge", 0)
+        event["jpegQuality"] = input.get("jpegQuality", 90)
+        event["preprocessWorkers"] = input.get("preprocessWorkers", os.cpu_count())
+        event["imageSource"] = input.get("imageSource", "s3object")
+
+        if(not event["imageSource"] in ["s3object", "bytes"]):
+            raise Exception("imageSource must be either s3object or bytes.")
+
+        event["tileSize"] = input.get("tileSize", 0)
+        event["tileOverlap"] = input.get("tileOverlap", 128)
+        event["tileIouThreshold"] = input.get("tileIouThreshold", 0.5)
+
+        if(event["tileSize"] and event["tileOverlap"] >= event["tileSize"]):
+            raise Exception("tileOverlap must be smaller than tileSize.")
+
+        event["targetRunSeconds"] = input.get("targetRunSeconds", 0)
+        event["imageLatencySeconds"] = input.get("imageLatencySeconds", 1.0)
+        event["inferenceUnitImagesPerSecond"] = input.get("inferenceUnitImagesPerSecond", 5)
+        event["minInferenceUnits"] = input.get("minInferenceUnits", 1)
+        event["maxInferenceUnits"] = input.get("maxInferenceUnits", 5)
+        event["manageProjectVersion"] = input.get("manageProjectVersion", False)
+        event["projectVersionPollSeconds"] = input.get("projectVersionPollSeconds", 30)
+        event["sageMakerApiRate"] = input.get("sageMakerApiRate", 2)
+        event["gtJobCreationConcurrency"] = input.get("gtJobCreationConcurrency", 4)
+        event["groupStoreMemoryMB"] = input.get("groupStoreMemoryMB", 256)
+        event["groupStorePath"] = input.get("groupStorePath", None)
+        event["reviewBudget"] = input.get("reviewBudget", 0)
+        event["reviewSampleSeed"] = input.get("reviewSampleSeed", None)
+        event["streamingJobs"] = input.get("streamingJobs", False)
+        event["streamingFillLevel"] = input.get("streamingFillLevel", 10)
+        event["hedgePercentile"] = input.get("hedgePercentile", 0)
+        event["hedgeMaxExtraLoad"] = input.get("hedgeMaxExtraLoad", 0.05)
+        event["traceFile"] = input.get("traceFile", None)
+        event["listConcurrency"] = input.get("listConcurrency", 0)
+        event["maxListedImages"] = input.get("maxListedImages", 100000)
+        event["videoFrameSampling"] = input.get("videoFrameSampling", False)
+        event["videoSampleFps"] = input.get("videoSampleFps", 2)
+        event["sceneChangeThreshold"] = input.get("sceneChangeThreshold", 0.3)
+        event["maxFramesPerVideo"] = input.get("maxFramesPerVideo", 200)
+
+        if(event["hedgePercentile"] < 0 or event["hedgePercentile"] >= 100):
+            raise Exception("hedgePercentile must be between 0 and 100.")
+
+        if(len(event["projectVersionArns"]) == 1):
+            raise Exception("projectVersionArns needs at least two project versions to compare.")
+
+        if((event["projectVersionArns"] or event["projectVersionPool"]) and event["manageProjectVersion"]):
+            raise Exception("manageProjectVersion starts a single project version and cannot be used with projectVersionArns or projectVersionPool.")
+
+        if(event["projectVersionArns"] and event["projectVersionPool"]):
+            raise Exception("projectVersionArns and projectVersionPool cannot be used together.")
+
+        if(event["streamingJobs"] and event["reviewBudget"]):
+            raise Exception("reviewBudget needs every detected label before sampling and cannot be used with streamingJobs.")
+
+        awsRegion = 'us-east-1'
+        bucketName, documentPath = S3Helper.parseBucketAndDocumentName(event['datasetPath'])
+        ar = S3Helper.getS3BucketRegion(bucketName)
+        if(ar):
+            awsRegion = ar
+
+        event['awsRegion'] = awsRegion
+        event['bucketName'] = bucketName
+        event['documentPath'] = documentPath
+
+        # Rekognition only reads S3 objects in its own region. Images over the Bytes limit are still passed
+        # as S3 objects unless they are downscaled, and then only go to project versions in the bucket region.
+        poolRegions = set([getArnRegion(projectVersionArn) for projectVersionArn in event["projectVersionPool"]])
+        otherRegions = poolRegions - set([awsRegion])
+        if(otherRegions and event["imageSource"] != "bytes"):
+            raise Exception("projectVersionPool in {} needs imageSource bytes for images in {}.".format(", ".join(sorted(otherRegions)), awsRegion))
+        if(otherRegions and not awsRegion in poolRegions and not event["maxImageEdge"]):
+            raise Exception("projectVersionPool without a project version in {} needs maxImageEdge, so images over {} MB can be sent as bytes.".format(
+                awsRegion, ImageProcessor.maxImageBytes // (1024 * 1024)))
+
+        return event
+
+    def getInput(self, args):
+
+        inputFile = "feedback-config.json"
+
+        i = 0
+        while(i < len(args)):
+            if(args[i] == '--config'):
+                inputFile = args[i+1]
+                i = i + 1
+            i += 1
+        
+        with open(inputFile, 'r') as i:
+            input = json.load(i)
+
+        return input
+
+    def runConfig(self, input):
+        event = self.validateInput(input)
+        jobScheduler = JobScheduler(event)
+
+        if(not event["traceFile"]):
+            return jobScheduler.run()
+
+        tracer.start()
+        try:
+            return jobScheduler.run()
+        finally:
+            tracer.stop(event["traceFile"])
+
+    def run(self, args):
+        return self.runConfig(self.getInput(args))
+
+def main(args):
+    try:
+        clf = CustomLabelsFeedback()
+        clf.run(args)
+    except Exception as e:
+        print("Something went wrong:\n====================================================\n{}".format(e))
@@ -0,0 +1,333 @@
+# Local stand-ins for AWS service clients. They implement just the calls this solution makes
+# and can be passed to the classes that take a client, or installed with AwsHelper.setClient.
+
+import datetime
+import hashlib
+import io
+import json
+import time
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+class LocalProjectVersionStub:
+    # Stand-in for the project version calls of the Rekognition client, so the managed mode can be
+    # exercised without a trained model. Transitions complete after transitionPolls describe calls.
+
+    def __init__(self, projectVersionArn, status="STOPPED", transitionPolls=1):
+        resource = projectVersionArn.split(":", 5)[5].split("/")
+        self.projectVersionArn = projectVersionArn
+        self.projectName = resource[1]
+        self.versionName = resource[3]
+        self.projectArn = "{}:project/{}/{}".format(projectVersionArn.split(":project/")[0], self.projectName, resource[4])
+        self.status = status
+        self.inferenceUnits = 0
+        self.transitionPolls = transitionPolls
+        self.pendingPolls = 0
+        self.calls = []
+
+    def describe_projects(self, ProjectNames):
+        self.calls.append(("describe_projects", ProjectNames))
+        projects = []
+        if(self.projectName in ProjectNames):
+            projects.append({ "ProjectArn": self.projectArn, "Status": "CREATED" })
+        return { "ProjectDescriptions": projects }
+
+    def describe_project_versions(self, ProjectArn, VersionNames):
+        self.calls.append(("describe_project_versions", ProjectArn, VersionNames))
+        if(self.status in ["STARTING", "STOPPING"]):
+            if(self.pendingPolls <= 0):
+                self.status = "RUNNING" if self.status == "STARTING" else "STOPPED"
+            self.pendingPolls -= 1
+
+        versions = []
+        if(ProjectArn == self.projectArn and self.versionName in VersionNames):
+            versions.append({ "ProjectVersionArn": self.projectVersionArn, "Status": self.status,
+                              "MinInferenceUnits": self.inferenceUnits })
+        return { "ProjectVersionDescriptions": versions }
+
+    def start_project_version(self, ProjectVersionArn, MinInferenceUnits):
+        self.calls.append(("start_project_version", ProjectVersionArn, MinInferenceUnits))
+        self.status = "STARTING"
+        self.inferenceUnits = MinInferenceUnits
+        self.pendingPolls = self.transitionPolls
+        return { "Status": self.status }
+
+    def stop_project_version(self, ProjectVersionArn):
+        self.calls.append(("stop_project_version", ProjectVersionArn))
+        self.status = "STOPPING"
+        self.pendingPolls = self.transitionPolls
+        return { "Status": self.status }
+
+class LocalCustomLabelsStub:
+    # Stand-in for detect_custom_labels of running project versions, to exercise balancing across a
+    # projectVersionPool. Each project version answers after its own latency, throttles calls beyond
+    # its capacity of concurrent requests and fails every call while it is marked down.
+
+    def __init__(self, projectVersions, customLabels=None):
+        self.projectVersions = {}
+        for projectVersionArn, settings in projectVersions.items():
+            self.projectVersions[projectVersionArn] = { "latencySeconds": settings.get("latencySeconds", 0.05),
+                                                        "capacity": settings.get("capacity", 4), "down": settings.get("down", False),
+                                                        "inFlight": 0, "calls": 0 }
+        self.customLabels = customLabels if customLabels is not None else [{ "Name": "object", "Confidence": 90.0 }]
+        self.lock = Lock()
+
+    def setDown(self, projectVersionArn, down=True):
+        self.projectVersions[projectVersionArn]["down"] = down
+
+    def detect_custom_labels(self, Image, ProjectVersionArn, **kwargs):
+        from botocore.exceptions import ClientError
+
+        projectVersion = self.projectVersions[ProjectVersionArn]
+        with self.lock:
+            projectVersion["calls"] += 1
+            if(projectVersion["down"]):
+                raise ClientError({ "Error": { "Code": "ResourceNotReadyException" } }, "DetectCustomLabels")
+            if(projectVersion["inFlight"] >= projectVersion["capacity"]):
+                raise ClientError({ "Error": { "Code": "ThrottlingException" } }, "DetectCustomLabels")
+            projectVersion["inFlight"] += 1
+
+        try:
+            time.sleep(projectVersion["latencySeconds"])
+            return { "CustomLabels": [dict(customLabel) for customLabel in self.customLabels] }
+        finally:
+            with self.lock:
+                projectVersion["inFlight"] -= 1
+
+class LocalSnsStub:
+    # Stand-in for the SNS calls of streaming mode. Messages are kept per topic and handed to any
+    # local subscriber, such as LocalLabelingJobStub, as they are published.
+
+    def __init__(self, awsRegion="us-east-1", accountId="000000000000"):
+        self.arnPrefix = "arn:aws:sns:{}:{}".format(awsRegion, accountId)
+        self.messages = {}
+        self.subscribers = {}
+        self.calls = []
+
+    def create_topic(self, Name):
+        self.calls.append(("create_topic", Name))
+        topicArn = "{}:{}".format(self.arnPrefix, Name)
+        self.messages.setdefault(topicArn, [])
+        return { "TopicArn": topicArn }
+
+    def publish(self, TopicArn, Message):
+        self.calls.append(("publish", TopicArn))
+        if(not TopicArn in self.messages):
+            raise Exception("Topic does not exist: {}".format(TopicArn))
+        self.messages[TopicArn].append(Message)
+        for subscriber in self.subscribers.get(TopicArn, []):
+            subscriber(Message)
+        return { "MessageId": "{}".format(len(self.messages[TopicArn])) }
+
+    def delete_topic(self, TopicArn):
+        self.calls.append(("delete_topic", TopicArn))
+        self.messages.pop(TopicArn, None)
+        self.subscribers.pop(TopicArn, None)
+
+    def subscribe(self, topicArn, callback):
+        self.subscribers.setdefault(topicArn, []).append(callback)
+
+class LocalLabelingJobStub:
+    # Stand-in for the Ground Truth calls of the SageMaker client. Streaming jobs subscribe to their
+    # topic on a LocalSnsStub and collect the data objects they receive, so a run can be checked
+    # end to end without a workforce.
+
+    def __init__(self, sns=None):
+        self.sns = sns
+        self.jobs = {}
+        self.calls = []
+
+    def create_labeling_job(self, LabelingJobName, **kwargs):
+        self.calls.append(("create_labeling_job", LabelingJobName))
+        job = { "LabelingJobName": LabelingJobName, "LabelingJobStatus": "InProgress", "Request": kwargs, "DataObjects": [] }
+        self.jobs[LabelingJobName] = job
+
+        snsDataSource = kwargs["InputConfig"]["DataSource"].get("SnsDataSource")
+        if(snsDataSource and self.sns):
+            self.sns.subscribe(snsDataSource["SnsTopicArn"], lambda message: job["DataObjects"].append(message))
+        return { "LabelingJobArn": "arn:aws:sagemaker:::labeling-job/{}".format(LabelingJobName) }
+
+    def describe_labeling_job(self, LabelingJobName):
+        self.calls.append(("describe_labeling_job", LabelingJobName))
+        job = self.jobs[LabelingJobName]
+        if(job["LabelingJobStatus"] == "Stopping"):
+            job["LabelingJobStatus"] = "Stopped"
+        response = { "LabelingJobName": LabelingJobName, "LabelingJobStatus": job["LabelingJobStatus"] }
+        for key in ["LabelAttributeName", "InputConfig", "OutputConfig", "HumanTaskConfig", "LabelCategoryConfigS3Uri"]:
+            if(key in job["Request"]):
+                response[key] = job["Request"][key]
+        if("OutputDatasetS3Uri" in job):
+            response["LabelingJobOutput"] = { "OutputDatasetS3Uri": job["OutputDatasetS3Uri"] }
+        return response
+
+    def completeJob(self, LabelingJobName, outputManifestUri):
+        # The output manifest itself is put in a LocalS3Stub by the caller.
+        self.jobs[LabelingJobName]["LabelingJobStatus"] = "Completed"
+        self.jobs[LabelingJobName]["OutputDatasetS3Uri"] = outputManifestUri
+
+    def stop_labeling_job(self, LabelingJobName):
+        self.calls.append(("stop_labeling_job", LabelingJobName))
+        self.jobs[LabelingJobName]["LabelingJobStatus"] = "Stopping"
+
+    def get_paginator(self, operationName):
+        stub = self
+
+        class ListLabelingJobsPaginator:
+            def paginate(self, NameContains=""):
+                summaries = [{ "LabelingJobName": name, "LabelingJobStatus": job["LabelingJobStatus"] }
+                             for name, job in stub.jobs.items() if NameContains in name]
+                return [{ "LabelingJobSummaryList": summaries }]
+
+        return ListLabelingJobsPaginator()
+
+class LocalStreamingBody:
+    # The parts of botocore's StreamingBody used by this solution.
+
+    def __init__(self, content):
+        self.stream = io.BytesIO(content)
+
+    def read(self, amt=None):
+        return self.stream.read(amt)
+
+    def iter_chunks(self, chunk_size=1024):
+        chunk = self.stream.read(chunk_size)
+        while(chunk):
+            yield chunk
+            chunk = self.stream.read(chunk_size)
+
+    def iter_lines(self, chunk_size=1024):
+        for line in self.stream:
+            yield line.rstrip(b"\r\n")
+
+class LocalS3Stub:
+    # In-memory stand-in for the S3 client, used by the benchmarks and for local runs. Listings are
+    # served from a sorted copy of the keys, and listLatencySeconds adds the round trip of a real listing.
+
+    def __init__(self, bucketRegion="us-east-1", listLatencySeconds=0):
+        self.bucketRegion = bucketRegion
+        self.listLatencySeconds = listLatencySeconds
+        self.startTime = datetime.datetime.now(datetime.timezone.utc)
+        self.objects = {}
+        self.lastModified = {}
+        self.sortedKeys = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.calls.append(("put_object", Bucket, Key))
+        if(isinstance(Body, str)):
+            Body = Body.encode("utf-8")
+        self.objects[(Bucket, Key)] = bytes(Body)
+        self.lastModified[(Bucket, Key)] = datetime.datetime.now(datetime.timezone.utc)
+        self.sortedKeys.pop(Bucket, None)
+        return {}
+
+    def upload_file(self, Filename, Bucket, Key):
+        self.calls.append(("upload_file", Bucket, Key))
+        with open(Filename, "rb") as localFile:
+            self.objects[(Bucket, Key)] = localFile.read()
+        self.lastModified[(Bucket, Key)] = datetime.datetime.now(datetime.timezone.utc)
+        self.sortedKeys.pop(Bucket, None)
+
+    def getObject(self, Bucket, Key, operationName):
+        from botocore.exceptions import ClientError
+
+        if(not (Bucket, Key) in self.objects):
+            raise ClientError({ "Error": { "Code": "NoSuchKey" if operationName == "GetObject" else "404" } }, operationName)
+        return self.objects[(Bucket, Key)]
+
+    @staticmethod
+    def getETag(content):
+        # S3 uses the MD5 of the content as the ETag of objects uploaded in one part.
+        return '"{}"'.format(hashlib.md5(content).hexdigest())
+
+    def get_object(self, Bucket, Key):
+        self.calls.append(("get_object", Bucket, Key))
+        content = self.getObject(Bucket, Key, "GetObject")
+        return { "Body": LocalStreamingBody(content), "ContentLength": len(content), "ETag": self.getETag(content) }
+
+    def head_object(self, Bucket, Key):
+        self.calls.append(("head_object", Bucket, Key))
+        content = self.getObject(Bucket, Key, "HeadObject")
+        return { "ContentLength": len(content), "ETag": self.getETag(content) }
+
+    def get_bucket_location(self, Bucket):
+        return { "LocationConstraint": self.bucketRegion }
+
+    def generate_presigned_url(self, ClientMethod, Params):
+        return "https://{}.s3.amazonaws.com/{}?local".format(Params["Bucket"], Params["Key"])
+
+    def getSortedKeys(self, Bucket):
+        # Objects added directly to self.objects need a call to self.sortedKeys.clear().
+        if(not Bucket in self.sortedKeys):
+            self.sortedKeys[Bucket] = sorted([key for bucket, key in self.objects if bucket == Bucket])
+        return self.sortedKeys[Bucket]
+
+    @staticmethod
+    def getPrefixEnd(prefix):
+        # The first string after every string that starts with prefix.
+        return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, StartAfter=None, Delimiter=None):
+        self.calls.append(("list_objects_v2", Bucket, Prefix))
+        if(self.listLatencySeconds):
+            time.sleep(self.listLatencySeconds)
+
+        keys = self.getSortedKeys(Bucket)
+        i = bisect_left(keys, Prefix)
+        if(ContinuationToken):
+            # The token is the last key or folder returned. Like S3, a continued listing does not
+            # return that folder again, while a listing that starts after it does.
+            if(Delimiter and ContinuationToken.endswith(Delimiter)):
+                i = max(i, bisect_left(keys, self.getPrefixEnd(ContinuationToken)))
+            else:
+                i = max(i, bisect_right(keys, ContinuationToken))
+        elif(StartAfter):
+            i = max(i, bisect_right(keys, StartAfter))
+
+        contents = []
+        commonPrefixes = []
+        lastEntry = None
+        while(i < len(keys) and keys[i].startswith(Prefix) and len(contents) + len(commonPrefixes) < MaxKeys):
+            key = keys[i]
+            delimiterIndex = key.find(Delimiter, len(Prefix)) if Delimiter else -1
+            if(delimiterIndex >= 0):
+                lastEntry = key[:delimiterIndex + len(Delimiter)]
+                commonPrefixes.append({ "Prefix": lastEntry })
+                i = bisect_left(keys, self.getPrefixEnd(lastEntry))
+            else:
+                lastEntry = key
+                contents.append({ "Key": key, "Size": len(self.objects[(Bucket, key)]), "ETag": self.getETag(self.objects[(Bucket, key)]),
+                                  "LastModified": self.lastModified.get((Bucket, key), self.startTime) })
+                i += 1
+
+        response = { "KeyCount": len(contents) + len(commonPrefixes), "IsTruncated": i < len(keys) and keys[i].startswith(Prefix) }
+        if(contents):
+            response["Contents"] = contents
+        if(commonPrefixes):
+            response["CommonPrefixes"] = commonPrefixes
+        if(response["IsTruncated"]):
+            response["NextContinuationToken"] = lastEntry
+        return response
+
+class LocalDatasetStub:
+    # Stand-in for update_dataset_entries of the Rekognition client. Entries are keyed by source-ref
+    # as in a real dataset. Every throttleEvery-th call fails with a ThrottlingException.
+
+    def __init__(self, throttleEvery=0):
+        self.throttleEvery = throttleEvery
+        self.entries = {}
+        self.calls = []
+        self.lock = Lock()
+
+    def update_dataset_entries(self, DatasetArn, Changes):
+        from botocore.exceptions import ClientError
+
+        with self.lock:
+            self.calls.append(("update_dataset_entries", DatasetArn))
+            if(self.throttleEvery and len(self.calls) % self.throttleEvery == 0):
+                raise ClientError({ "Error": { "Code": "ThrottlingException" } }, "UpdateDatasetEntries")
+
+            for line in Changes["GroundTruth"].decode("utf-8").splitlines():
+                entry = json.loads(line)
+                self.entries.setdefault(DatasetArn, {})[entry["source-ref"]] = entry
+        return {}
@@ -0,0 +1,61 @@
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+class Tracer:
+    # Records a span per operation and writes them in the Chrome trace event format, which
+    # chrome://tracing and https://ui.perfetto.dev open as a timeline with one row per thread.
+    # Spans cost nothing but a flag check while tracing is off.
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events = []
+        self.threadNames = {}
+        self.startTime = 0
+
+    def start(self):
+        with self.lock:
+            self.events = []
+            self.threadNames = {}
+            self.startTime = time.perf_counter()
+            self.enabled = True
+
+    @contextmanager
+    def span(self, name, category, **args):
+        if(not self.enabled):
+            yield
+            return
+
+        beginTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            endTime = time.perf_counter()
+            thread = threading.current_thread()
+            event = { "name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread.ident,
+                      "ts": round((beginTime - self.startTime) * 1000000, 1),
+                      "dur": round((endTime - beginTime) * 1000000, 1),
+                      "args": args }
+            with self.lock:
+                self.events.append(event)
+                if(not thread.ident in self.threadNames):
+                    self.threadNames[thread.ident] = thread.name
+
+    def stop(self, fileName):
+        with self.lock:
+            self.enabled = False
+            events = []
+            for tid, threadName in self.threadNames.items():
+                events.append({ "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": { "name": threadName } })
+            events.extend(self.events)
+
+        with open(fileName, "w") as traceFile:
+            json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, traceFile)
+
+        print("Trace with {} spans written to {}".format(len(events) - len(self.threadNames), fileName))
+
+# Shared by every module, so spans from all threads of a run end up in one trace.
+tracer = Tracer()
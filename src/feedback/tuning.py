@@ -0,0 +1,231 @@
+import json
+import math
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from feedback.helpers import AwsHelper, S3Helper
+from feedback.tracing import tracer
+
+# Tunes the review settings of the next run from how long workers took on the tasks of earlier runs.
+# get-feedback.py --collect-timings reads the worker responses of finished jobs, where Ground Truth
+# records the time spent on each task, and adds them to a profile in the output bucket. With
+# autoTuneReview, start-feedback.py reads the profile back and picks the batch sizes, task time
+# limits and concurrency of the jobs it creates.
+#
+# The size of a task is the number of images it shows for label verification, and the number of
+# labels of its job for bounding boxes. Task time is modelled as a fixed overhead plus a time per
+# unit, so larger tasks review more per worker-hour. The largest size whose predicted time stays
+# within targetTaskSeconds is picked, growing at most twofold per run.
+
+class TuningProfile:
+
+    profileFile = "datasets/tuning/profile.json"
+    # Only the latest samples are kept, so the profile follows changes in the workforce.
+    maxSamples = 5000
+    jobTypes = ["labels", "bounding-boxes"]
+
+    def __init__(self, outputBucket):
+        ''' Constructor. '''
+        self.outputBucket = outputBucket
+        self.profile = { "jobs": [], "samples": { jobType: [] for jobType in self.jobTypes },
+                         "concurrency": { jobType: [] for jobType in self.jobTypes } }
+
+    def load(self):
+        if(S3Helper.objectExists(self.outputBucket, self.profileFile)):
+            self.profile = json.loads(S3Helper.readFromS3(self.outputBucket, self.profileFile))
+        return self
+
+    def save(self):
+        S3Helper.writeToS3(json.dumps(self.profile), self.outputBucket, self.profileFile)
+
+    def hasJob(self, jobName):
+        return jobName in self.profile["jobs"]
+
+    def addJob(self, jobName, jobType, samples, peakConcurrency, maxConcurrentTaskCount):
+        self.profile["jobs"].append(jobName)
+        typeSamples = self.profile["samples"][jobType]
+        typeSamples.extend(samples)
+        del typeSamples[:-self.maxSamples]
+        self.profile["concurrency"][jobType].append([peakConcurrency, maxConcurrentTaskCount])
+        del self.profile["concurrency"][jobType][:-20]
+
+    def getSamples(self, jobType):
+        return self.profile["samples"][jobType]
+
+    def getConcurrency(self, jobType):
+        return self.profile["concurrency"][jobType]
+
+class TaskTimingCollector:
+
+    def __init__(self, inputParameters):
+        ''' Constructor. '''
+        self.inputParameters = inputParameters
+        self.profile = TuningProfile(inputParameters["outputBucket"]).load()
+        self.batchSizes = {}
+
+    @staticmethod
+    def parseTime(value):
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+    @staticmethod
+    def getPeakConcurrency(intervals):
+        # Most tasks held by workers at the same time, from a sweep over acceptance and submission times.
+        events = []
+        for acceptanceTime, submissionTime in intervals:
+            events.append((acceptanceTime, 1))
+            events.append((submissionTime, -1))
+        peak = 0
+        current = 0
+        for eventTime, change in sorted(events):
+            current += change
+            peak = max(peak, current)
+        return peak
+
+    def getWorkerResponseKeys(self, outputBucketName, workerResponsePath):
+        s3 = AwsHelper().getClient('s3', self.inputParameters["awsRegion"])
+        params = { "Bucket": outputBucketName, "Prefix": workerResponsePath, "MaxKeys": 1000 }
+        keys = []
+        while(True):
+            listObjectsResponse = s3.list_objects_v2(**params)
+            for doc in listObjectsResponse.get('Contents', []):
+                keys.append(doc['Key'])
+            if(not listObjectsResponse['IsTruncated']):
+                return keys
+            params["ContinuationToken"] = listObjectsResponse['NextContinuationToken']
+
+    def getTaskSizes(self, response, jobType):
+        # Label verification tasks show the images of one batch file, so the size depends on the task.
+        # Bounding box tasks show every label of their job.
+        if(jobType == "bounding-boxes"):
+            labels = json.loads(S3Helper.readFromS3Uri(response["LabelCategoryConfigS3Uri"]))["labels"]
+            return lambda datasetObjectId: len(labels)
+
+        manifestUri = response["InputConfig"]["DataSource"]["S3DataSource"]["ManifestS3Uri"]
+        sourceRefs = [json.loads(line)["source-ref"] for line in S3Helper.readLinesFromS3Uri(manifestUri, self.inputParameters["awsRegion"])]
+
+        def getBatchSize(datasetObjectId):
+            sourceRef = sourceRefs[int(datasetObjectId)]
+            if(not sourceRef in self.batchSizes):
+                self.batchSizes[sourceRef] = len(json.loads(S3Helper.readFromS3Uri(sourceRef)))
+            return self.batchSizes[sourceRef]
+        return getBatchSize
+
+    def collectJob(self, jobName, jobType):
+        sageMakerClient = AwsHelper().getClient("sagemaker", self.inputParameters["awsRegion"])
+        response = sageMakerClient.describe_labeling_job(LabelingJobName=jobName)
+        if(not "S3DataSource" in response["InputConfig"]["DataSource"]):
+            print("Job: {}, streaming job, timings skipped".format(jobName))
+            return
+
+        outputBucketName, outputPath = S3Helper.parseBucketAndDocumentName(response["OutputConfig"]["S3OutputPath"])
+        workerResponsePath = "{}/{}/annotations/worker-response/".format(outputPath.rstrip("/"), jobName)
+        keys = self.getWorkerResponseKeys(outputBucketName, workerResponsePath)
+
+        # One small file per task, so they are read concurrently.
+        with tracer.span("read worker responses", "s3", job=jobName, files=len(keys)):
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                workerResponses = list(executor.map(lambda key: json.loads(S3Helper.readFromS3(outputBucketName, key)), keys))
+
+        getTaskSize = self.getTaskSizes(response, jobType)
+        samples = []
+        intervals = []
+        for key, workerResponse in zip(keys, workerResponses):
+            # .../worker-response/iteration-<n>/<datasetObjectId>/<timestamp>.json
+            taskSize = getTaskSize(key.split("/")[-2])
+            for answer in workerResponse["answers"]:
+                samples.append([taskSize, answer["timeSpentInSeconds"]])
+                intervals.append((self.parseTime(answer["acceptanceTime"]), self.parseTime(answer["submissionTime"])))
+
+        maxConcurrentTaskCount = response.get("HumanTaskConfig", {}).get("MaxConcurrentTaskCount")
+        self.profile.addJob(jobName, jobType, samples, self.getPeakConcurrency(intervals), maxConcurrentTaskCount)
+        print("Job: {}, task timings collected: {}".format(jobName, len(samples)))
+
+    def run(self, jobs):
+        jobTypes = [(job, "bounding-boxes") for job in jobs["bounding-box-verification-jobs"]]
+        if(jobs["label-verification-job"]):
+            jobTypes.append((jobs["label-verification-job"], "labels"))
+
+        # Jobs already in the profile are not counted twice when get-feedback.py runs again.
+        collected = 0
+        for jobName, jobType in jobTypes:
+            if(not self.profile.hasJob(jobName)):
+                self.collectJob(jobName, jobType)
+                collected += 1
+
+        if(collected):
+            self.profile.save()
+        print("Tuning profile: s3://{}/{}".format(self.inputParameters["outputBucket"], TuningProfile.profileFile))
+
+class ReviewTuner:
+
+    # Fewer samples than this leave the configured settings in place.
+    minSamples = 20
+    maxConcurrentTaskCount = 1000
+    maxTaskTimeLimitSeconds = 28800
+
+    def __init__(self, inputParameters):
+        ''' Constructor. '''
+        self.inputParameters = inputParameters
+
+    @staticmethod
+    def fitTaskTime(samples):
+        # Least squares fit of seconds = overhead + perUnit * size. Without two different sizes the
+        # overhead cannot be told apart, so all of the time is put on the units, which underestimates
+        # how much larger tasks help.
+        count = len(samples)
+        meanSize = sum([sample[0] for sample in samples]) / count
+        meanSeconds = sum([sample[1] for sample in samples]) / count
+        variance = sum([(sample[0] - meanSize) ** 2 for sample in samples])
+        if(variance > 0):
+            perUnit = sum([(sample[0] - meanSize) * (sample[1] - meanSeconds) for sample in samples]) / variance
+            overhead = meanSeconds - perUnit * meanSize
+            if(perUnit > 0 and overhead >= 0):
+                return (overhead, perUnit)
+        return (0.0, max(sum([sample[1] / max(sample[0], 1) for sample in samples]) / count, 1e-3))
+
+    def planBatch(self, samples, currentSize, maxSize):
+        overhead, perUnit = self.fitTaskTime(samples)
+        size = int((self.inputParameters["targetTaskSeconds"] - overhead) / perUnit)
+        size = max(1, min(size, currentSize * 2, maxSize))
+
+        # The time limit leaves room for the slowest tasks, taken as the 95th percentile of the
+        # observed times relative to the model.
+        ratios = sorted([sample[1] / (overhead + perUnit * sample[0]) for sample in samples])
+        slowRatio = ratios[min(len(ratios) - 1, int(len(ratios) * 0.95))]
+        predictedSeconds = overhead + perUnit * size
+        taskTimeLimit = int(min(self.maxTaskTimeLimitSeconds, max(60, math.ceil(1.5 * slowRatio * predictedSeconds))))
+
+        print("Task time: {:.1f} seconds + {:.1f} seconds per unit, size {} -> {}, {:.0f} units per worker-hour.".format(
+            overhead, perUnit, currentSize, size, 3600 * size / predictedSeconds))
+        return (size, taskTimeLimit)
+
+    def planConcurrency(self, concurrency, currentCount):
+        # A job whose workers held as many tasks as it allowed may have been held back, so the limit
+        # doubles. Otherwise it follows the most tasks held at once, with some headroom.
+        if(not concurrency):
+            return currentCount
+        if(any([limit and peak >= limit for peak, limit in concurrency])):
+            limits = [limit for peak, limit in concurrency if limit]
+            return min(self.maxConcurrentTaskCount, max(limits) * 2)
+        return max(1, min(self.maxConcurrentTaskCount, math.ceil(1.25 * max([peak for peak, limit in concurrency]))))
+
+    def apply(self):
+        profile = TuningProfile(self.inputParameters["outputBucket"]).load()
+        reviewTaskSettings = self.inputParameters["reviewTaskSettings"]
+
+        # A label verification task shows at most 100 images, a bounding box job takes at most 50 labels.
+        for jobType, sizeKey, maxSize in [("labels", "maxImagesPerLabelVerificationBatch", 100),
+                                          ("bounding-boxes", "maxLabelsPerBoundingBoxJob", 50)]:
+            samples = profile.getSamples(jobType)
+            if(len(samples) < self.minSamples):
+                print("Tuning {}: {} task timings, keeping the configured settings.".format(jobType, len(samples)))
+                continue
+
+            print("Tuning {} from {} task timings...".format(jobType, len(samples)))
+            size, taskTimeLimit = self.planBatch(samples, self.inputParameters[sizeKey], maxSize)
+            self.inputParameters[sizeKey] = size
+            reviewTaskSettings[jobType]["taskTimeLimitSeconds"] = taskTimeLimit
+            reviewTaskSettings[jobType]["maxConcurrentTaskCount"] = self.planConcurrency(profile.getConcurrency(jobType),
+                                                                                         reviewTaskSettings[jobType]["maxConcurrentTaskCount"])
+            print("{}: {}, task time limit: {} seconds, concurrent tasks: {}".format(sizeKey, size, taskTimeLimit,
+                                                                                    reviewTaskSettings[jobType]["maxConcurrentTaskCount"]))
@@ -0,0 +1,131 @@
+import os
+import shutil
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from feedback.helpers import AwsHelper, S3Helper, FileHelper
+from feedback.tracing import tracer
+
+# Turns videos into a few representative frames, so inference and review cost follow how much the
+# video changes rather than how long it is. Frames are examined at a low rate, and a frame is kept
+# when its brightness histogram differs enough from the last kept frame.
+
+def getFrameHistogram(np, cv2, frame):
+    # 64 bin grayscale histogram of a thumbnail, cheap and insensitive to noise and small motion.
+    thumbnail = cv2.cvtColor(cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return np.bincount((thumbnail // 4).ravel(), minlength=64) / thumbnail.size
+
+def sampleVideoFrames(videoFile, sampleFps, sceneChangeThreshold, maxFramesPerVideo, jpegQuality):
+    # Runs in a worker process of VideoFrameSampler's pool, so it has to stay a module level function.
+    import numpy as np
+    import cv2
+
+    capture = cv2.VideoCapture(videoFile)
+    if(not capture.isOpened()):
+        raise Exception("Video could not be opened.")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    frameStep = max(1, int(round(fps / sampleFps)))
+
+    frames = []
+    examinedFrames = 0
+    lastHistogram = None
+    frameIndex = 0
+    try:
+        while(len(frames) < maxFramesPerVideo):
+            # Frames in between are only grabbed, which skips decoding them.
+            if(frameIndex % frameStep):
+                if(not capture.grab()):
+                    break
+                frameIndex += 1
+                continue
+
+            hasFrame, frame = capture.read()
+            if(not hasFrame):
+                break
+            examinedFrames += 1
+
+            histogram = getFrameHistogram(np, cv2, frame)
+            # Total variation distance, 0 for identical histograms and 1 for disjoint ones.
+            change = 1.0 if lastHistogram is None else 0.5 * float(np.abs(histogram - lastHistogram).sum())
+            if(change >= sceneChangeThreshold):
+                encoded, jpegBytes = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, jpegQuality])
+                if(encoded):
+                    frames.append((int(frameIndex * 1000 / fps), jpegBytes.tobytes(), round(change, 3)))
+                    lastHistogram = histogram
+
+            frameIndex += 1
+    finally:
+        capture.release()
+
+    return (frames, examinedFrames, frameIndex)
+
+class VideoFrameSampler:
+
+    videoFileTypes = ["mp4", "mov", "avi", "mkv", "m4v"]
+
+    def __init__(self, inputParameters):
+        ''' Constructor. '''
+        self.inputParameters = inputParameters
+
+    @staticmethod
+    def isVideo(fileName):
+        return FileHelper.getFileExtenstion(fileName).lower() in VideoFrameSampler.videoFileTypes
+
+    def downloadVideo(self, videoKey):
+        # The decoder reads from a file, so each video is copied to a local file while it is sampled.
+        s3 = AwsHelper().getClient('s3', self.inputParameters["awsRegion"])
+        with tracer.span("fetch video", "video", video=videoKey):
+            response = s3.get_object(Bucket=self.inputParameters["bucketName"], Key=videoKey)
+            with tempfile.NamedTemporaryFile(suffix="." + FileHelper.getFileExtenstion(videoKey), delete=False) as videoFile:
+                shutil.copyfileobj(response['Body'], videoFile, 1024 * 1024)
+        return videoFile.name
+
+    def writeFrames(self, videoKey, future):
+        try:
+            frames, examinedFrames, frameCount = future.result()
+        except Exception as e:
+            print("Could not sample frames of {}: {}".format(videoKey, e))
+            return []
+
+        frameUris = []
+        for timestampMs, jpegBytes, change in frames:
+            frameKey = "{}/{}/{:010d}.jpg".format(self.inputParameters["framesPath"], videoKey, timestampMs)
+            S3Helper.writeToS3(jpegBytes, self.inputParameters["outputBucket"], frameKey)
+            frameUris.append("s3://{}/{}".format(self.inputParameters["outputBucket"], frameKey))
+
+        print("Video: {}, frames read: {}, examined: {}, kept: {}".format(videoKey, frameCount, examinedFrames, len(frames)))
+        return frameUris
+
+    def run(self, videoKeys):
+        print("Sampling frames of {} videos...".format(len(videoKeys)))
+
+        frameUris = []
+        futures = {}
+
+        def finishVideos(done):
+            for future in done:
+                videoKey, videoFile = futures.pop(future)
+                frameUris.extend(self.writeFrames(videoKey, future))
+                os.remove(videoFile)
+
+        # Videos are downloaded while earlier ones are decoded, with at most two waiting per worker.
+        # Workers are spawned rather than forked from a process that may be running other threads.
+        with ProcessPoolExecutor(max_workers=self.inputParameters["preprocessWorkers"],
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            for videoKey in videoKeys:
+                if(len(futures) >= self.inputParameters["preprocessWorkers"] * 2):
+                    done, pending = wait(futures, return_when=FIRST_COMPLETED)
+                    finishVideos(done)
+
+                videoFile = self.downloadVideo(videoKey)
+                future = pool.submit(sampleVideoFrames, videoFile, self.inputParameters["videoSampleFps"],
+                                     self.inputParameters["sceneChangeThreshold"], self.inputParameters["maxFramesPerVideo"],
+                                     self.inputParameters["jpegQuality"])
+                futures[future] = (videoKey, videoFile)
+
+            finishVideos(list(futures))
+
+        print("Sampled {} frames from {} videos.".format(len(frameUris), len(videoKeys)))
+        return frameUris
@@ -0,0 +1,12 @@
+import pytest
+
+from feedback.helpers import AwsHelper
+from feedback.stubs import LocalS3Stub
+
+@pytest.fixture
+def s3():
+    # A LocalS3Stub installed as the S3 client. Every client override is cleared afterwards.
+    s3 = LocalS3Stub()
+    AwsHelper.setClient('s3', s3)
+    yield s3
+    AwsHelper.clearClients()
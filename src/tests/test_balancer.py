@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from botocore.exceptions import ClientError
+
+from feedback.helpers import EndpointBalancer
+from feedback.stubs import LocalCustomLabelsStub
+
+east = "arn:aws:rekognition:us-east-1:000000000000:project/p/version/v/1"
+west = "arn:aws:rekognition:us-west-2:000000000000:project/p/version/v/1"
+
+def getBalancer(stub, ejectSeconds=0.05, maxRounds=3):
+    return EndpointBalancer([(arn, arn) for arn in stub.projectVersions], ejectSeconds, ["InvalidImageFormatException"], maxRounds)
+
+def detect(stub):
+    return lambda projectVersionArn, image: stub.detect_custom_labels(Image=image, ProjectVersionArn=projectVersionArn)
+
+def testFailedEndpointIsEjected():
+    stub = LocalCustomLabelsStub({ east: { "latencySeconds": 0 }, west: { "latencySeconds": 0, "down": True } })
+    balancer = getBalancer(stub, ejectSeconds=60)
+
+    for i in range(10):
+        balancer.call(detect(stub), {})
+
+    # One failed call takes the endpoint out of rotation, the call is retried on the other one.
+    assert stub.projectVersions[west]["calls"] == 1
+    assert stub.projectVersions[east]["calls"] == 10
+
+def testEjectionBacksOff():
+    stub = LocalCustomLabelsStub({ east: {}, west: {} })
+    balancer = getBalancer(stub, ejectSeconds=10)
+    endpoint = balancer.endpoints[0]
+    error = ClientError({ "Error": { "Code": "ThrottlingException" } }, "DetectCustomLabels")
+
+    ejectSeconds = []
+    for i in range(3):
+        endpoint["outstanding"] += 1
+        balancer.eject(endpoint, error)
+        ejectSeconds.append(endpoint["ejectedUntil"] - time.monotonic())
+
+    assert [round(seconds) for seconds in ejectSeconds] == [10, 20, 40]
+    assert endpoint["throttles"] == 3
+
+    # A success resets the back-off.
+    endpoint["outstanding"] += 1
+    balancer.release(endpoint, 0.01)
+    assert endpoint["consecutiveFailures"] == 0
+
+def testThrottledLoadIsSpread():
+    stub = LocalCustomLabelsStub({ east: { "latencySeconds": 0.02, "capacity": 2 }, west: { "latencySeconds": 0.02, "capacity": 2 } })
+    balancer = getBalancer(stub, ejectSeconds=0.01, maxRounds=20)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda i: balancer.call(detect(stub), {}), range(40)))
+
+    assert len(results) == 40
+    assert stub.projectVersions[east]["calls"] > 0 and stub.projectVersions[west]["calls"] > 0
+
+def testEveryEndpointDownRaisesAfterMaxRounds():
+    stub = LocalCustomLabelsStub({ east: { "down": True }, west: { "down": True } })
+    balancer = getBalancer(stub, ejectSeconds=0.01, maxRounds=2)
+
+    with pytest.raises(ClientError):
+        balancer.call(detect(stub), {})
+    assert stub.projectVersions[east]["calls"] + stub.projectVersions[west]["calls"] == 4
+
+def testRequestErrorsAreNotRetried():
+    balancer = EndpointBalancer([(east, east), (west, west)], 60, ["InvalidImageFormatException"])
+
+    def invalidImage(projectVersionArn, image):
+        raise ClientError({ "Error": { "Code": "InvalidImageFormatException" } }, "DetectCustomLabels")
+
+    with pytest.raises(ClientError):
+        balancer.call(invalidImage, {})
+    assert all([endpoint["ejectedUntil"] == 0 and endpoint["outstanding"] == 0 for endpoint in balancer.endpoints])
+
+def testIneligibleEndpointsAreSkipped():
+    stub = LocalCustomLabelsStub({ east: { "latencySeconds": 0 }, west: { "latencySeconds": 0 } })
+    balancer = getBalancer(stub)
+
+    for i in range(5):
+        balancer.call(detect(stub), { "S3Object": {} }, eligible=lambda name: ":us-east-1:" in name)
+
+    assert stub.projectVersions[east]["calls"] == 5
+    assert stub.projectVersions[west]["calls"] == 0
+
+    with pytest.raises(Exception):
+        balancer.call(detect(stub), {}, eligible=lambda name: False)
@@ -0,0 +1,41 @@
+from feedback.stubs import LocalProjectVersionStub
+from feedback.start import CapacityPlanner, ProjectVersionManager
+
+projectVersionArn = "arn:aws:rekognition:us-east-1:000000000000:project/animals/version/animals.v1/1600000000000"
+
+def getInputParameters(**settings):
+    inputParameters = { "targetRunSeconds": 600, "imageLatencySeconds": 0.5, "inferenceUnitImagesPerSecond": 5, "maxInferenceUnits": 10 }
+    inputParameters.update(settings)
+    return inputParameters
+
+def testPlanMeetsTheTarget():
+    # 6000 images in 600 seconds is 10 images per second: 2 inference units and 5 calls in flight.
+    plan = CapacityPlanner(getInputParameters()).plan(6000)
+    assert plan["inferenceUnits"] == 2
+    assert plan["concurrency"] == 5
+    assert plan["expectedSeconds"] == 600
+
+def testPlanIsCappedAtMaxInferenceUnits():
+    plan = CapacityPlanner(getInputParameters(maxInferenceUnits=2)).plan(60000)
+    assert plan["inferenceUnits"] == 2
+    assert plan["expectedSeconds"] == 6000
+
+def testManagedProjectVersionIsStartedAndStopped():
+    rekognition = LocalProjectVersionStub(projectVersionArn, transitionPolls=2)
+    manager = ProjectVersionManager(projectVersionArn, "us-east-1", pollSeconds=0, rekognition=rekognition)
+
+    manager.start(3)
+    assert rekognition.status == "RUNNING"
+    assert rekognition.inferenceUnits == 3
+
+    manager.stop()
+    assert rekognition.status == "STOPPED"
+
+def testRunningProjectVersionIsLeftRunning():
+    rekognition = LocalProjectVersionStub(projectVersionArn, status="RUNNING")
+    manager = ProjectVersionManager(projectVersionArn, "us-east-1", pollSeconds=0, rekognition=rekognition)
+
+    manager.start(3)
+    manager.stop()
+    assert rekognition.status == "RUNNING"
+    assert not [call for call in rekognition.calls if call[0] in ["start_project_version", "stop_project_version"]]
@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from feedback.start import ImageAnalyzer, ImageProcessor
+
+models = ["arn:aws:rekognition:us-east-1:000000000000:project/p/version/v1/1",
+          "arn:aws:rekognition:us-east-1:000000000000:project/p/version/v2/1"]
+
+def getAnalyzer():
+    inputParameters = { "groupStoreMemoryMB": 1, "groupStorePath": None, "bucketName": "images", "disagreementThreshold": 0.1 }
+    return ImageAnalyzer([], inputParameters)
+
+def getDataObject(labels, disagreement):
+    return { "imageName": "a.jpg", "imageWidth": 400, "imageHeight": 300, "labels": labels, "disagreement": disagreement,
+             "modelLabels": { model: labels for model in models } }
+
+def testAgreedImageWithoutLabelsIsKept():
+    analyzer = getAnalyzer()
+    analyzer.processLabels(getDataObject([], 0))
+
+    assert analyzer.agreedCount == 1
+    assert [item["imageUrl"] for item in analyzer.noLabelsGroup.values()] == ["s3://images/a.jpg"]
+    assert len(next(analyzer.comparisonGroup.values())["models"]) == 2
+
+def testAgreedImageWithLabelsIsNotReviewed():
+    analyzer = getAnalyzer()
+    label = { "Name": "cat", "Confidence": 90.0, "Instances": [] }
+    analyzer.processLabels(getDataObject([label], 0))
+
+    assert not len(analyzer.labelGroups)
+    assert not len(analyzer.noLabelsGroup)
+
+def testDisagreedImageIsReviewed():
+    analyzer = getAnalyzer()
+    label = { "Name": "cat", "Confidence": 90.0, "Instances": [] }
+    analyzer.processLabels(getDataObject([label], 0.5))
+
+    assert analyzer.agreedCount == 0
+    assert analyzer.labelGroups.count("cat") == 1
+
+def testFailedFirstModelWaitsForTheOthers():
+    finished = []
+
+    def detectModelLabels(rekognition, image, projectVersionArn=None):
+        if(projectVersionArn == models[0]):
+            raise Exception("first model failed")
+        time.sleep(0.05)
+        finished.append(projectVersionArn)
+        return []
+
+    with ThreadPoolExecutor(max_workers=1) as modelPool:
+        processor = ImageProcessor("a.jpg", { "projectVersionArns": models }, {}, modelPool=modelPool)
+        processor.detectModelLabels = detectModelLabels
+        with pytest.raises(Exception):
+            processor.compareModels(None, { "Bytes": bytearray(b"image") })
+        # The buffer is only handed back once no call is using it.
+        assert finished == [models[1]]
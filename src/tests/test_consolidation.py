@@ -0,0 +1,48 @@
+import math
+
+from feedback.get import BoundingBoxConsolidator
+
+def getManifestItem(boxes, confidences=None):
+    # boxes are (left, top, width, height) of label "person" on one image.
+    item = {
+        "source-ref": "s3://bucket/image.jpg",
+        "bounding-box-new": {
+            "image_size": [{ "width": 400, "height": 300, "depth": 3 }],
+            "annotations": [{ "class_id": 0, "left": b[0], "top": b[1], "width": b[2], "height": b[3] } for b in boxes]
+        },
+        "bounding-box-new-metadata": { "class-map": { "0": "person" } }
+    }
+    if(confidences is not None):
+        item["bounding-box-new-metadata"]["objects"] = [{ "confidence": c } for c in confidences]
+    return item
+
+def getAnnotations(consolidator):
+    item = consolidator.consolidate()["s3://bucket/image.jpg"]
+    return (item["bounding-box"]["annotations"], item["bounding-box-metadata"]["objects"])
+
+def testOverlappingBoxesOfOneJobStaySeparate():
+    consolidator = BoundingBoxConsolidator(0.5)
+    consolidator.addManifestItem(getManifestItem([(100, 50, 100, 200), (120, 50, 100, 200)]), 0)
+
+    annotations, objects = getAnnotations(consolidator)
+    assert sorted([a["left"] for a in annotations]) == [100, 120]
+
+def testOverlappingBoxesOfDifferentJobsAreMerged():
+    consolidator = BoundingBoxConsolidator(0.5)
+    consolidator.addManifestItem(getManifestItem([(100, 50, 100, 200)], [0.8]), 0)
+    consolidator.addManifestItem(getManifestItem([(120, 50, 100, 200)], [0.6]), 1)
+
+    annotations, objects = getAnnotations(consolidator)
+    assert len(annotations) == 1
+    assert annotations[0]["left"] == 110
+    assert math.isclose(objects[0]["confidence"], 0.7)
+
+def testMissingConfidencesAreLeftOutOfTheMean():
+    consolidator = BoundingBoxConsolidator(0.5)
+    consolidator.addManifestItem(getManifestItem([(100, 50, 100, 200)], [0.5]), 0)
+    consolidator.addManifestItem(getManifestItem([(105, 50, 100, 200)]), 1)
+    consolidator.addManifestItem(getManifestItem([(300, 50, 50, 50)]), 2)
+
+    annotations, objects = getAnnotations(consolidator)
+    confidences = dict([(a["left"], o.get("confidence")) for a, o in zip(annotations, objects)])
+    assert confidences == { 102: 0.5, 300: None }
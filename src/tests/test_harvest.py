@@ -0,0 +1,99 @@
+import datetime
+import json
+
+import pytest
+
+from feedback.helpers import AwsHelper
+from feedback.stubs import LocalLabelingJobStub
+from feedback.harvest import PartialResultHarvester
+
+annotationsPath = "gt/bbjob/annotations/consolidated-annotation/consolidation-response/iteration-1"
+
+@pytest.fixture
+def labelingJob(s3):
+    # A running bounding box job with three tasks, whose answers are added by the tests.
+    sageMaker = LocalLabelingJobStub()
+    AwsHelper.setClient('sagemaker', sageMaker)
+
+    s3.put_object(Bucket="output", Key="jobs/jobs.json", Body=json.dumps({ "runid": "run", "bounding-box-verification-jobs": ["bbjob"],
+                                                                           "label-verification-job": "lbjob" }))
+    s3.put_object(Bucket="output", Key="gt/input.manifest",
+                  Body="".join([json.dumps({ "source-ref": "s3://images/{}.jpg".format(i) }) + "\n" for i in range(3)]))
+    sageMaker.create_labeling_job("bbjob", InputConfig={ "DataSource": { "S3DataSource": { "ManifestS3Uri": "s3://output/gt/input.manifest" } } },
+                                  OutputConfig={ "S3OutputPath": "s3://output/gt" })
+
+    # Both label verification tasks show the same batch of two images.
+    s3.put_object(Bucket="output", Key="gt/batch.json", Body=json.dumps([{ "imageUrl": "s3://images/{}.jpg".format(i), "label": "cat" } for i in range(2)]))
+    s3.put_object(Bucket="output", Key="gt/labels.manifest", Body=(json.dumps({ "source-ref": "s3://output/gt/batch.json" }) + "\n") * 2)
+    sageMaker.create_labeling_job("lbjob", InputConfig={ "DataSource": { "S3DataSource": { "ManifestS3Uri": "s3://output/gt/labels.manifest" } } },
+                                  OutputConfig={ "S3OutputPath": "s3://output/gt" })
+    return sageMaker
+
+def putAnswers(s3, fileName, datasetObjectIds, left=10, settled=True):
+    answers = [{ "datasetObjectId": str(i), "consolidatedAnnotation": { "content": {
+                    "bounding-box-new": { "annotations": [{ "class_id": 0, "left": left, "top": 1, "width": 5, "height": 5 }] },
+                    "bounding-box-new-metadata": { "class-map": { "0": "cat" } } } } } for i in datasetObjectIds]
+    key = "{}/{}".format(annotationsPath, fileName)
+    s3.put_object(Bucket="output", Key=key, Body=json.dumps(answers))
+    # Old enough to be behind the watermark.
+    if(settled):
+        s3.lastModified[("output", key)] = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+
+def getOutput(s3):
+    lines = s3.get_object(Bucket="output", Key="datasets/run/partial/output.manifest")["Body"].read().decode("utf-8").splitlines()
+    return { item["source-ref"]: item for item in [json.loads(line) for line in lines] }
+
+def testRefreshAppendsPartsAndKeepsOnlyWatermarks(s3, labelingJob):
+    harvester = PartialResultHarvester("s3://output/jobs/jobs.json")
+
+    putAnswers(s3, "1.json", [0, 1])
+    harvester.refresh()
+    assert sorted(getOutput(s3)) == ["s3://images/0.jpg", "s3://images/1.jpg"]
+
+    # Task 0 answered again, the latest answer wins.
+    putAnswers(s3, "2.json", [2, 0], left=20)
+    harvester.refresh()
+    output = getOutput(s3)
+    assert len(output) == 3
+    assert output["s3://images/0.jpg"]["bounding-box-new"]["annotations"][0]["left"] == 20
+
+    state = json.loads(s3.get_object(Bucket="output", Key="datasets/run/partial/harvest-state.json")["Body"].read())
+    assert state["jobs"]["bbjob"] == { "watermark": "{}/2.json".format(annotationsPath), "parts": 2, "unsettled": {} }
+    assert state["annotations"] == 4
+
+def testRefreshWithoutNewAnswersKeepsTheOutput(s3, labelingJob):
+    harvester = PartialResultHarvester("s3://output/jobs/jobs.json")
+    putAnswers(s3, "1.json", [0])
+    harvester.refresh()
+
+    s3.calls.clear()
+    outputManifest, statuses = harvester.refresh()
+    assert outputManifest == "s3://output/datasets/run/partial/output.manifest"
+    assert not [call for call in s3.calls if call[0] in ["put_object", "upload_file"] and call[2].endswith("output.manifest")]
+
+def testUnsettledFilesAreReadOnce(s3, labelingJob):
+    harvester = PartialResultHarvester("s3://output/jobs/jobs.json")
+    putAnswers(s3, "1.json", [0, 1], settled=False)
+    harvester.refresh()
+    harvester.refresh()
+
+    state = json.loads(s3.get_object(Bucket="output", Key="datasets/run/partial/harvest-state.json")["Body"].read())
+    assert state["jobs"]["bbjob"]["watermark"] is None
+    assert state["jobs"]["bbjob"]["parts"] == 1
+    assert state["annotations"] == 2
+
+    # A file that changed is read again.
+    putAnswers(s3, "1.json", [0, 1, 2], settled=False)
+    harvester.refresh()
+    assert len(getOutput(s3)) == 3
+
+def testLabelBatchesAreReadOncePerRefresh(s3, labelingJob):
+    answers = [{ "datasetObjectId": str(i), "consolidatedAnnotation": { "content": { "labels": { "item-0": "Yes", "item-1": "No" } } } }
+               for i in range(2)]
+    key = "gt/lbjob/annotations/consolidated-annotation/consolidation-response/iteration-1/1.json"
+    s3.put_object(Bucket="output", Key=key, Body=json.dumps(answers))
+
+    PartialResultHarvester("s3://output/jobs/jobs.json").refresh()
+
+    assert len([call for call in s3.calls if call[0] == "get_object" and call[2] == "gt/batch.json"]) == 1
+    assert getOutput(s3)["s3://images/0.jpg"]["label-0-metadata"]["class-name"] == "cat"
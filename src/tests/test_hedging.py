@@ -0,0 +1,57 @@
+import io
+import time
+
+from PIL import Image
+
+from feedback.helpers import RequestHedger
+from feedback.start import ImageProcessor
+
+def testHedgesAreCappedAtMaxExtraLoad():
+    hedger = RequestHedger(50, 0.1, 8, minSamples=5)
+    latencies = iter([0.001] * 10 + [0.02] * 40)
+
+    def call():
+        time.sleep(next(latencies))
+        return "ok"
+
+    try:
+        results = [hedger.call(call) for i in range(40)]
+    finally:
+        hedger.shutdown()
+
+    assert results == ["ok"] * 40
+    assert hedger.hedges > 0
+    assert hedger.hedges <= hedger.calls * 0.1
+
+def testNoHedgesBeforeMinSamples():
+    hedger = RequestHedger(50, 1.0, 4, minSamples=20)
+    try:
+        for i in range(10):
+            hedger.call(time.sleep, 0.001)
+    finally:
+        hedger.shutdown()
+
+    assert hedger.hedgeDelay is None
+    assert hedger.hedges == 0
+
+def getProcessor(s3, hedger):
+    image = io.BytesIO()
+    Image.new("RGB", (40, 30)).save(image, "JPEG")
+    s3.put_object(Bucket="images", Key="a.jpg", Body=image.getvalue())
+    return ImageProcessor("a.jpg", { "bucketName": "images", "awsRegion": "us-east-1" }, {}, hedger=hedger)
+
+def testHedgedCallsGetACopyOfTheBuffer(s3):
+    hedger = RequestHedger(50, 0.1, 1)
+    try:
+        buffer = bytearray()
+        image = getProcessor(s3, hedger).getInferenceImage(buffer)
+    finally:
+        hedger.shutdown()
+
+    # A losing call may still send the image after the buffer is reused for the next one.
+    assert isinstance(image["Bytes"], bytes)
+    assert image["Bytes"] == buffer
+
+def testUnhedgedCallsSendTheBuffer(s3):
+    buffer = bytearray()
+    assert getProcessor(s3, None).getInferenceImage(buffer)["Bytes"] is buffer
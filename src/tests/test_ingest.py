@@ -0,0 +1,47 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from feedback.helpers import AwsHelper
+from feedback.stubs import LocalDatasetStub
+from feedback.ingest import DatasetIngestor, ingestManifest
+
+datasetArn = "arn:aws:rekognition:us-east-1:000000000000:project/p/dataset/train/1"
+manifestUri = "s3://output/datasets/run/output/output.manifest"
+
+def getManifest(count, label="cat"):
+    return "".join([json.dumps({ "source-ref": "s3://images/{}.jpg".format(i), "label": label }) + "\n" for i in range(count)])
+
+def testInterruptedIngestionResumes(s3, tmp_path):
+    s3.put_object(Bucket="output", Key="datasets/run/output/output.manifest", Body=getManifest(50))
+    checkpointFile = str(tmp_path / "checkpoint.json")
+
+    # Every 3rd call is throttled and nothing is retried, so the first ingestion stops part way.
+    failing = LocalDatasetStub(throttleEvery=3)
+    AwsHelper.setClient('rekognition', failing)
+    with pytest.raises(ClientError):
+        DatasetIngestor(datasetArn, checkpointFile, concurrency=1, maxChunkEntries=10, maxRetries=0).run(
+            manifestUri, getManifest(50).splitlines(), s3.head_object(Bucket="output", Key="datasets/run/output/output.manifest")["ETag"])
+    ingested = set(failing.entries[datasetArn])
+    assert 0 < len(ingested) < 50
+
+    # Only the chunks that were not acknowledged are sent again.
+    dataset = LocalDatasetStub()
+    AwsHelper.setClient('rekognition', dataset)
+    assert ingestManifest(manifestUri, datasetArn, checkpointFile, concurrency=1, maxChunkEntries=10) == 50
+    assert len(dataset.entries[datasetArn]) == 50 - len(ingested)
+    assert not ingested & set(dataset.entries[datasetArn])
+
+def testRegeneratedManifestStartsOver(s3, tmp_path):
+    checkpointFile = str(tmp_path / "checkpoint.json")
+    dataset = LocalDatasetStub()
+    AwsHelper.setClient('rekognition', dataset)
+
+    s3.put_object(Bucket="output", Key="datasets/run/output/output.manifest", Body=getManifest(30))
+    ingestManifest(manifestUri, datasetArn, checkpointFile, concurrency=2, maxChunkEntries=10)
+
+    # get-feedback.py writes a rerun to the same URI.
+    s3.put_object(Bucket="output", Key="datasets/run/output/output.manifest", Body=getManifest(30, "dog"))
+    assert ingestManifest(manifestUri, datasetArn, checkpointFile, concurrency=2, maxChunkEntries=10) == 30
+    assert set([entry["label"] for entry in dataset.entries[datasetArn].values()]) == set(["dog"])
@@ -0,0 +1,32 @@
+from feedback.helpers import ParallelS3Lister
+
+def putKeys(s3, keys):
+    for key in keys:
+        s3.objects[("images", key)] = b""
+    s3.sortedKeys.clear()
+
+def testFlatFolderIsSplitIntoRanges(s3):
+    keys = ["flat/{:05d}.jpg".format(i) for i in range(12000)]
+    putKeys(s3, keys + ["flat/notes.txt"])
+
+    lister = ParallelS3Lister("us-east-1", "images", ["jpg"], concurrency=4, splitAfterPages=1)
+    listed = list(lister.listKeys("flat/"))
+
+    assert lister.splits > 0
+    assert len(listed) == len(keys)
+    assert sorted(listed) == keys
+
+def testFoldersAreListedOnce(s3):
+    keys = ["nested/{}/{:04d}.png".format(folder, i) for folder in "abc" for i in range(1500)] + ["nested/top.png"]
+    putKeys(s3, keys)
+
+    lister = ParallelS3Lister("us-east-1", "images", ["png"], concurrency=4, splitAfterPages=1)
+    listed = list(lister.listKeys("nested/"))
+
+    assert sorted(listed) == sorted(keys)
+
+def testMaxKeysStopsTheListing(s3):
+    putKeys(s3, ["flat/{:05d}.jpg".format(i) for i in range(5000)])
+
+    lister = ParallelS3Lister("us-east-1", "images", ["jpg"], concurrency=4, splitAfterPages=1)
+    assert len(list(lister.listKeys("flat/", maxKeys=1500))) == 1500
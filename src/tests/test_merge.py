@@ -0,0 +1,53 @@
+import glob
+import gzip
+import json
+import os
+import tempfile
+
+import pytest
+
+from feedback.get import JobProcessor
+
+def getJobProcessor(s3, manifestCompression, columnarOutput=False):
+    labels = [{ "source-ref": "s3://images/{}.jpg".format(i), "label": i % 2,
+                "label-metadata": { "class-name": "cat", "confidence": 0.9 } } for i in range(3)]
+    boxes = [{ "source-ref": "s3://images/{}.jpg".format(i),
+               "bounding-box": { "annotations": [{ "class_id": 0, "left": 1, "top": 2, "width": 3, "height": 4 }] },
+               "bounding-box-metadata": { "class-map": { "0": "dog" }, "objects": [{ "confidence": 0.5 }] } } for i in range(2, 5)]
+    s3.put_object(Bucket="output", Key="labels.manifest", Body="".join([json.dumps(item) + "\n" for item in labels]))
+    s3.put_object(Bucket="output", Key="boxes.manifest", Body="".join([json.dumps(item) + "\n" for item in boxes]))
+
+    jobProcessor = JobProcessor()
+    jobProcessor.inputParameters = { "outputBucket": "output", "labelsOutputFile": "labels.manifest", "boundingBoxOutputFile": "boxes.manifest",
+                                     "bblbOutputFile": "output.manifest", "columnarOutputFile": "output.parquet",
+                                     "manifestCompression": manifestCompression, "columnarOutput": columnarOutput }
+    return jobProcessor
+
+def getLines(s3, key):
+    return s3.get_object(Bucket="output", Key=key)["Body"].read()
+
+def getTempFiles():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), "tmp*")))
+
+def testMergedManifestJoinsOnSourceRef(s3):
+    getJobProcessor(s3, "none").mergeBBAndLabelsOutput(True, True, False)
+
+    items = [json.loads(line) for line in getLines(s3, "output.manifest").decode("utf-8").splitlines()]
+    assert [item["source-ref"] for item in items] == ["s3://images/{}.jpg".format(i) for i in range(5)]
+    assert "label" in items[2] and "bounding-box" in items[2]
+
+@pytest.mark.parametrize("manifestCompression", ["gzip", "zstd"])
+def testCompressedManifestMatches(s3, manifestCompression):
+    tempFiles = getTempFiles()
+    getJobProcessor(s3, manifestCompression, True).mergeBBAndLabelsOutput(True, True, False)
+
+    manifest = getLines(s3, "output.manifest")
+    if(manifestCompression == "gzip"):
+        assert gzip.decompress(getLines(s3, "output.manifest.gz")) == manifest
+    else:
+        import zstandard
+        assert zstandard.ZstdDecompressor().decompressobj().decompress(getLines(s3, "output.manifest.zst")) == manifest
+    assert getLines(s3, "output.parquet")[:4] == b"PAR1"
+
+    # The local copies are removed once uploaded.
+    assert getTempFiles() == tempFiles
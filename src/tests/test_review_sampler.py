@@ -0,0 +1,57 @@
+import io
+import json
+import math
+
+from feedback.groups import GroupStore
+from feedback.start import ReviewSampler, BoundingBoxScheduler
+
+def getItem(imageUrl, label, confidence):
+    return { "imageUrl": imageUrl, "labelName": label, "confidence": confidence, "imageWidth": 400, "imageHeight": 300,
+             "instances": [[10, 10, 50, 50]], "instanceConfidences": [confidence] }
+
+def getGroups(store):
+    # 40 images with labels a and b, 10 of them also with c, plus 300 items of label d for verification.
+    labelBoundingBoxGroups = store.getGroups("label-bounding-boxes")
+    for i in range(40):
+        image = "s3://bucket/{}.jpg".format(i)
+        labelBoundingBoxGroups.add("a", getItem(image, "a", 50 + i))
+        labelBoundingBoxGroups.add("b", getItem(image, "b", 60))
+        if(i < 10):
+            labelBoundingBoxGroups.add("c", getItem(image, "c", 70))
+
+    labelGroups = store.getGroups("labels")
+    for i in range(300):
+        labelGroups.add("d", getItem("s3://bucket/d{}.jpg".format(i), "d", 80))
+    return (labelGroups, labelBoundingBoxGroups)
+
+def testBudgetCountsTasks():
+    store = GroupStore(1 << 20)
+    labelGroups, labelBoundingBoxGroups = getGroups(store)
+    deferredFile = io.StringIO()
+
+    sampler = ReviewSampler(store, 6, 100, 2, seed=1)
+    sampledLabels, sampledBB, jobLabels, deferredCount = sampler.sample(labelGroups, labelBoundingBoxGroups, deferredFile)
+
+    # Label verification tasks are batches of 100 images, bounding box tasks are images per job.
+    labelTasks = math.ceil(sampledLabels.count("d") / 100)
+    scheduler = BoundingBoxScheduler(sampledBB, { "maxLabelsPerBoundingBoxJob": 2 }, jobLabels)
+    boundingBoxTasks = sum([len(group["items"]) for group in scheduler.createManifestGroups()])
+    assert labelTasks + boundingBoxTasks == 6
+
+    deferred = [json.loads(line) for line in deferredFile.getvalue().splitlines()]
+    assert len(deferred) == deferredCount
+    selectedItems = sum([sampledLabels.count(label) for label in sampledLabels]) + sum([sampledBB.count(label) for label in sampledBB])
+    assert selectedItems + deferredCount == 300 + 40 + 40 + 10
+
+def testImagesKeepAllLabelsOfTheirJob():
+    store = GroupStore(1 << 20)
+    labelGroups, labelBoundingBoxGroups = getGroups(store)
+
+    sampler = ReviewSampler(store, 5, 100, 2, seed=2)
+    sampledLabels, sampledBB, jobLabels, deferredCount = sampler.sample(labelGroups, labelBoundingBoxGroups, io.StringIO())
+
+    # a and b share a job, so an image is either reviewed for both or deferred for both.
+    imagesA = set([item["imageUrl"] for item in sampledBB.items("a")])
+    imagesB = set([item["imageUrl"] for item in sampledBB.items("b")])
+    assert imagesA == imagesB
+    assert jobLabels[0] == ["a", "b"]